@@ -370,6 +370,7 @@ def get_linked_calls(name):
 			"status",
 			"type",
 			"recording_url",
+			"recording_file",
 			"creation",
 			"note",
 		],
@@ -399,6 +400,7 @@ def get_linked_calls(name):
 				CallLog.status,
 				CallLog.type,
 				CallLog.recording_url,
+				CallLog.recording_file,
 				CallLog.creation,
 				CallLog.note,
 				Link.link_doctype,
@@ -0,0 +1,262 @@
+"""
+Bulk deletion of documents together with the references to them.
+
+Deleting a document another one links to fails, so the documents linking to the ones being
+deleted are unlinked (or, on request, deleted) first. `get_links` finds them for a whole set of
+names with one query per field of the doctype's link graph (see `crm.utils.link_graph`), instead
+of scanning every field once per document. After the documents are deleted, the links to them
+are cleared with one update per field, and the child rows pointing at them removed with one
+delete per table.
+
+A link that cannot be cleared, a mandatory field of another document, keeps its target: that
+document is reported as blocked and left alone. `dry_run` reports what a deletion would do without
+changing anything. Larger deletions run in a background job, in chunks, publishing progress to the
+user on `crm_bulk_delete`.
+"""
+
+import frappe
+from frappe import _
+
+from crm.utils.link_graph import get_linking_documents
+
+CHUNK_SIZE = 200
+# Larger deletions run in a background job
+INLINE_LIMIT = 10
+PROGRESS_EVENT = "crm_bulk_delete"
+
+UNLINK = "Unlink"
+REMOVE_ROW = "Remove Row"
+DELETE = "Delete"
+BLOCKED = "Blocked"
+
+
+@frappe.whitelist()
+def delete_docs(doctype: str, names: list | str, delete_linked: bool = False, dry_run: bool = False):
+	"""
+	Delete documents, unlinking the documents that link to them or deleting those too.
+
+	:param names: Names of the documents, documents the user cannot see are left out
+	:param delete_linked: Delete the linked documents instead of unlinking them
+	:param dry_run: Only report what would be deleted, unlinked and blocked, see `plan_deletion`
+	:return: The result of `delete_batch`, or the job id when the deletion runs in the background
+	"""
+	frappe.has_permission(doctype, "delete", throw=True)
+	names = frappe.parse_json(names) if isinstance(names, str) else names
+	names = frappe.get_list(doctype, filters={"name": ("in", names)}, pluck="name")
+	delete_linked = frappe.utils.cint(delete_linked)
+
+	if frappe.utils.cint(dry_run):
+		return plan_deletion(doctype, names, delete_linked)
+	if len(names) <= INLINE_LIMIT:
+		return delete_batch(doctype, names, delete_linked)
+
+	job_id = f"crm_bulk_delete::{frappe.generate_hash(length=10)}"
+	frappe.enqueue(
+		"crm.api.bulk_delete.delete_batch",
+		queue="long",
+		timeout=3600,
+		job_id=job_id,
+		doctype=doctype,
+		names=names,
+		delete_linked=delete_linked,
+		commit=True,
+		enqueue_after_commit=True,
+	)
+	return {"job_id": job_id}
+
+
+def plan_deletion(doctype, names, delete_linked=False):
+	"""
+	What deleting `names` would do, without changing anything.
+
+	:return: `{"total", "deletable", "blocked": {name: [links]}, "actions": [{"doctype", "fieldname",
+		"action", "count"}], "linked_docs": [{"doctype", "name", "title", "action"}]}`
+	"""
+	links, blocked = [], {}
+	for i in range(0, len(names), CHUNK_SIZE):
+		chunk_links = get_links(doctype, names[i : i + CHUNK_SIZE], delete_linked)
+		links += chunk_links
+		for link in chunk_links:
+			if link.action == BLOCKED:
+				blocked.setdefault(link.target, []).append(
+					{"doctype": link.doctype, "name": link.name, "fieldname": link.fieldname}
+				)
+
+	actions = {}
+	for link in links:
+		key = (link.table, link.fieldname, link.action)
+		actions[key] = actions.get(key, 0) + 1
+
+	linked = {(link.doctype, link.name): link.action for link in links}
+	titles = {}
+	for linked_doctype in {key[0] for key in linked}:
+		docnames = [name for dt, name in linked if dt == linked_doctype]
+		titles[linked_doctype] = get_titles(linked_doctype, docnames)
+
+	return {
+		"total": len(names),
+		"deletable": len(names) - len(blocked),
+		"blocked": blocked,
+		"actions": [
+			{"doctype": table, "fieldname": fieldname, "action": action, "count": count}
+			for (table, fieldname, action), count in actions.items()
+		],
+		"linked_docs": [
+			{"doctype": dt, "name": name, "title": titles[dt].get(name) or name, "action": action}
+			for (dt, name), action in linked.items()
+		],
+	}
+
+
+def delete_batch(doctype, names, delete_linked=False, commit=False):
+	"""
+	Delete `names` chunk by chunk, publishing progress after each.
+
+	:return: `{"deleted": count, "blocked": names, "failed": {name: error}}`
+	"""
+	total, deleted, blocked, failed = len(names), 0, [], {}
+	for i in range(0, total, CHUNK_SIZE):
+		chunk_deleted, chunk_blocked, chunk_failed = delete_chunk(
+			doctype, names[i : i + CHUNK_SIZE], delete_linked
+		)
+		deleted += chunk_deleted
+		blocked += chunk_blocked
+		failed.update(chunk_failed)
+		if commit:
+			frappe.db.commit()
+
+		frappe.publish_realtime(
+			PROGRESS_EVENT,
+			{"doctype": doctype, "done": min(i + CHUNK_SIZE, total), "total": total, "deleted": deleted},
+			user=frappe.session.user,
+			after_commit=not commit,
+		)
+
+	return {"deleted": deleted, "blocked": blocked, "failed": failed}
+
+
+def delete_chunk(doctype, names, delete_linked):
+	"""
+	Delete one chunk, each document in its own savepoint, then clear the links to the deleted ones.
+
+	:return: Tuple of (number deleted, names blocked, `{name: error}` of the failed deletions)
+	"""
+	links = get_links(doctype, names, delete_linked)
+	blocked = {link.target for link in links if link.action == BLOCKED}
+	by_target = {}
+	for link in links:
+		by_target.setdefault(link.target, []).append(link)
+
+	deleted, failed, deleted_linked = set(), {}, set()
+	savepoint = f"delete_{frappe.generate_hash(length=8)}"
+	for name in names:
+		if name in blocked:
+			continue
+
+		frappe.db.savepoint(savepoint)
+		linked = {
+			(link.doctype, link.name)
+			for link in by_target.get(name, [])
+			if link.action == DELETE and (link.doctype, link.name) not in deleted_linked
+		}
+		try:
+			for linked_doctype, linked_name in linked:
+				frappe.delete_doc(linked_doctype, linked_name)
+			# the links are cleared below, in one go for the whole chunk
+			frappe.delete_doc(doctype, name, force=True)
+		except Exception as e:
+			frappe.db.rollback(save_point=savepoint)
+			failed[name] = str(e) or _("Could not delete {0}").format(name)
+			frappe.log_error(title="Bulk delete failed", reference_doctype=doctype, reference_name=name)
+			continue
+
+		deleted.add(name)
+		deleted_linked |= linked
+
+	unlink([link for link in links if link.target in deleted and link.action in (UNLINK, REMOVE_ROW)])
+	return len(deleted), [name for name in names if name in blocked], failed
+
+
+def get_links(doctype, names, delete_linked=False):
+	"""
+	Every reference to `names` from other documents, one query per link and dynamic link field.
+
+	References from doctypes Frappe cleans up itself on delete (`ignore_links_on_delete`), from
+	cancelled documents through dynamic links, from dynamic links of singles and from the documents
+	being deleted are left out.
+
+	:return: List of `frappe._dict(doctype, name, table, row, fieldname, options, target, action)`,
+		`doctype` and `name` being the referencing document and `row` the referencing row of
+		`table`, which is the doctype itself or one of its child tables
+	"""
+	ignored = set(frappe.get_hooks("ignore_links_on_delete"))
+	targets = set(names)
+	links = []
+	for row in get_linking_documents(doctype, list(names)):
+		linked_doctype = row.parenttype if row.istable else row.doctype
+		linked_name = row.parent if row.istable else row.name
+		if row.doctype in ignored or linked_doctype in ignored:
+			continue
+		if linked_doctype == doctype and linked_name in targets:
+			continue
+		if row.options and (row.issingle or row.docstatus == 2):
+			continue
+
+		if delete_linked and not row.issingle:
+			action = DELETE
+		elif row.istable:
+			action = REMOVE_ROW
+		elif row.reqd:
+			action = BLOCKED
+		else:
+			action = UNLINK
+		links.append(
+			frappe._dict(
+				doctype=linked_doctype,
+				name=linked_name,
+				table=row.doctype,
+				row=row.name,
+				fieldname=row.fieldname,
+				options=row.options,
+				target=row.target,
+				action=action,
+			)
+		)
+	return links
+
+
+def unlink(links):
+	"""Clear the links with one update per field, and remove the child rows with one delete per table."""
+	groups = {}
+	for link in links:
+		groups.setdefault((link.action, link.table, link.fieldname, link.options), []).append(link.row)
+
+	for (action, table, fieldname, options), rows in groups.items():
+		if action == REMOVE_ROW:
+			frappe.db.delete(table, {"name": ("in", rows)})
+		elif frappe.get_meta(table).issingle:
+			frappe.db.set_single_value(table, fieldname, None)
+		elif options:
+			frappe.db.sql(
+				f"update `tab{table}` set `{options}` = '', `{fieldname}` = '' where name in %(rows)s",
+				{"rows": tuple(rows)},
+			)
+		else:
+			frappe.db.sql(
+				f"update `tab{table}` set `{fieldname}` = null where name in %(rows)s", {"rows": tuple(rows)}
+			)
+
+
+def get_titles(doctype, names):
+	"""`{name: title}` of documents of one doctype, with one query."""
+	if doctype == "CRM Call Log":
+		rows = frappe.get_all(doctype, filters={"name": ("in", names)}, fields=["name", "from", "to"])
+		return {row.name: _("Call from {0} to {1}").format(row["from"], row.to) for row in rows}
+
+	meta = frappe.get_meta(doctype)
+	title_field = {"CRM Deal": "organization", "CRM Notification": "message"}.get(doctype) or meta.title_field
+	if not title_field or meta.issingle:
+		return {}
+	return dict(
+		frappe.get_all(doctype, filters={"name": ("in", names)}, fields=["name", title_field], as_list=True)
+	)
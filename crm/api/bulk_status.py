@@ -0,0 +1,244 @@
+"""
+Bulk status transitions for leads and deals.
+
+The generic bulk edit saves every record: an SLA lookup, the status change log, agent sharing,
+assignment rules and every `on_update` hook, once per record. `update_status` checks the target
+status once and then works batch by batch: the status (and, for deals, the fields that follow
+from it) is written with one update, the status change log with `log_status_changes`, and the
+SLA of records that had none is looked up again in memory and written with one update. What
+a save would have done afterwards (version, `on_update` hooks, notifications) runs from a
+background job per batch.
+
+Progress is published to the user on `crm_bulk_status_update` after every batch.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import now_datetime, nowdate
+
+from crm.fcrm.doctype.crm_service_level_agreement.utils import get_cached_slas, get_sla
+from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import (
+	get_status_types,
+	log_status_changes,
+)
+from crm.utils import get_writable_names
+
+STATUS_DOCTYPES = {"CRM Lead": "CRM Lead Status", "CRM Deal": "CRM Deal Status"}
+BATCH_SIZE = 500
+SIDE_EFFECTS_BATCH_SIZE = 100
+# Larger updates run in a background job
+INLINE_LIMIT = 500
+PROGRESS_EVENT = "crm_bulk_status_update"
+
+SLA_FIELDS = ("sla", "sla_creation", "response_by", "sla_status")
+
+
+@frappe.whitelist()
+def update_status(doctype: str, names: list | str, status: str, lost_reason=None, lost_notes=None):
+	"""
+	Move leads or deals to `status`.
+
+	:param names: Names of the records, records the user cannot change are left out
+	:param lost_reason: Required when moving deals to a status of type Lost
+	:return: The result of `apply_status`, or the job id when the update runs in the background
+	"""
+	names = frappe.parse_json(names) if isinstance(names, str) else names
+	values = validate_transition(doctype, status, lost_reason, lost_notes)
+
+	if len(names) <= INLINE_LIMIT:
+		return apply_status(doctype, names, values)
+
+	job_id = f"crm_bulk_status::{frappe.generate_hash(length=10)}"
+	frappe.enqueue(
+		"crm.api.bulk_status.apply_status",
+		queue="long",
+		timeout=3600,
+		job_id=job_id,
+		doctype=doctype,
+		names=names,
+		values=values,
+		commit=True,
+		enqueue_after_commit=True,
+	)
+	return {"job_id": job_id}
+
+
+def validate_transition(doctype, status, lost_reason=None, lost_notes=None):
+	"""Check the doctype, permission and target status once, return the values to write."""
+	if doctype not in STATUS_DOCTYPES:
+		frappe.throw(_("Bulk status update is not supported for {0}").format(doctype))
+	frappe.has_permission(doctype, "write", throw=True)
+
+	if not frappe.db.exists(STATUS_DOCTYPES[doctype], status):
+		frappe.throw(_("{0} is not a valid {1}").format(status, _(STATUS_DOCTYPES[doctype])))
+
+	values = {"status": status}
+	if doctype != "CRM Deal":
+		return values
+
+	status_type = get_status_types().get(status)
+	if status_type == "Lost":
+		if not lost_reason:
+			frappe.throw(_("Please specify a reason for losing the deal."), frappe.ValidationError)
+		elif lost_reason == "Other" and not lost_notes:
+			frappe.throw(_("Please specify the reason for losing the deal."), frappe.ValidationError)
+		values.update(lost_reason=lost_reason, lost_notes=lost_notes)
+	elif status_type == "Won":
+		values["closed_date"] = nowdate()
+	values["probability"] = frappe.db.get_value("CRM Deal Status", status, "probability") or 0
+	return values
+
+
+def apply_status(doctype, names, values, commit=False):
+	"""
+	Apply a validated transition to `names` in batches, publishing progress after each.
+
+	:return: `{"updated": count, "skipped": names}`, skipped records failed a check a save runs
+	"""
+	total, updated, skipped = len(names), 0, []
+	for i in range(0, total, BATCH_SIZE):
+		batch = get_writable_names(doctype, names[i : i + BATCH_SIZE])
+		changed, invalid = update_batch(doctype, batch, values)
+		updated += len(changed)
+		skipped += invalid
+		if commit:
+			frappe.db.commit()
+
+		frappe.publish_realtime(
+			PROGRESS_EVENT,
+			{
+				"doctype": doctype,
+				"status": values["status"],
+				"done": min(i + BATCH_SIZE, total),
+				"total": total,
+				"updated": updated,
+			},
+			user=frappe.session.user,
+			after_commit=not commit,
+		)
+
+	return {"updated": updated, "skipped": skipped}
+
+
+def update_batch(doctype, names, values):
+	"""
+	Write a transition for one batch.
+
+	:return: Tuple of (`{name: previous status}` of the changed records, names left out)
+	"""
+	if not names:
+		return {}, []
+
+	status = values["status"]
+	previous = dict(
+		frappe.db.sql(
+			f"select name, status from `tab{doctype}` where name in %(names)s and status != %(status)s",
+			{"names": tuple(names), "status": status},
+		)
+	)
+	skipped = get_invalid_records(doctype, previous)
+	for name in skipped:
+		previous.pop(name)
+	if not previous:
+		return {}, skipped
+
+	assignments = ["status = %(status)s", "modified = %(now)s", "modified_by = %(user)s"]
+	if "closed_date" in values:
+		assignments.append("closed_date = ifnull(closed_date, %(closed_date)s)")
+	if "probability" in values:
+		assignments.append("probability = if(ifnull(probability, 0) = 0, %(probability)s, probability)")
+	if "lost_reason" in values:
+		assignments.append("lost_reason = %(lost_reason)s, lost_notes = %(lost_notes)s")
+
+	frappe.db.sql(
+		f"update `tab{doctype}` set {', '.join(assignments)} where name in %(names)s",
+		{**values, "now": now_datetime(), "user": frappe.session.user, "names": tuple(previous)},
+	)
+	log_status_changes(doctype, {name: (old, status) for name, old in previous.items()})
+	apply_slas(doctype, list(previous))
+
+	changed = list(previous.items())
+	for i in range(0, len(changed), SIDE_EFFECTS_BATCH_SIZE):
+		frappe.enqueue(
+			"crm.api.bulk_status.run_side_effects",
+			doctype=doctype,
+			previous=dict(changed[i : i + SIDE_EFFECTS_BATCH_SIZE]),
+			enqueue_after_commit=True,
+		)
+	return previous, skipped
+
+
+def get_invalid_records(doctype, previous):
+	"""Deals a save would reject: with forecasting on, they need a value and a closure date."""
+	if doctype != "CRM Deal" or not previous:
+		return []
+	if not frappe.db.get_single_value("FCRM Settings", "enable_forecasting"):
+		return []
+
+	return frappe.get_all(
+		doctype,
+		filters={"name": ("in", list(previous))},
+		or_filters={"expected_deal_value": 0, "expected_closure_date": ("is", "not set")},
+		pluck="name",
+	)
+
+
+def apply_slas(doctype, names):
+	"""
+	Look up the SLA of changed records that have none, as a save would, and write the SLA fields.
+
+	A record that already has an SLA keeps it, a save does not look it up again either.
+	"""
+	if not get_cached_slas(doctype):
+		return
+
+	rows = frappe.get_all(doctype, filters={"name": ("in", names), "sla": ("is", "not set")}, fields=["*"])
+	updates = {}
+	for row in rows:
+		doc = frappe.get_doc({"doctype": doctype, **row})
+		sla = get_sla(doc)
+		if not sla:
+			continue
+
+		doc.sla = sla.name
+		# nothing changed since the last save, as far as the SLA is concerned
+		doc._doc_before_save = frappe.get_doc(doc.as_dict())
+		sla.apply(doc)
+		updates[doc.name] = {field: doc.get(field) for field in SLA_FIELDS}
+
+	if updates:
+		update_fields(doctype, updates, SLA_FIELDS)
+
+
+def update_fields(doctype, updates, fields):
+	"""Write `{name: {field: value}}` to `fields` with one `UPDATE ... CASE`."""
+	params = {"names": tuple(updates)}
+	cases = {field: [] for field in fields}
+	for i, (name, values) in enumerate(updates.items()):
+		params[f"n{i}"] = name
+		for j, field in enumerate(fields):
+			params[f"v{i}_{j}"] = values.get(field)
+			cases[field].append(f"when %(n{i})s then %(v{i}_{j})s")
+
+	assignments = ", ".join(f"`{field}` = case name {' '.join(cases[field])} end" for field in fields)
+	frappe.db.sql(f"update `tab{doctype}` set {assignments} where name in %(names)s", params)
+
+
+def run_side_effects(doctype, previous):
+	"""Background job: what a save would have done after writing the status, one commit each."""
+	for name, old_status in previous.items():
+		try:
+			doc = frappe.get_doc(doctype, name)
+			doc_before_save = frappe.get_doc(doc.as_dict())
+			doc_before_save.status = old_status
+			doc._doc_before_save = doc_before_save
+
+			doc.save_version()
+			doc.run_method("on_update")
+			doc.notify_update()
+			frappe.db.commit()
+		except Exception:
+			frappe.db.rollback()
+			frappe.log_error(
+				title="Bulk status update side effects failed", reference_doctype=doctype, reference_name=name
+			)
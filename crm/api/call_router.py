@@ -1,6 +1,8 @@
 import frappe
 import json
 from crm.integrations.api import get_contact_by_phone_number
+from crm.integrations.call_events import apply_call_event, payload_digest
+from crm.integrations.telephony_log import log_call_event
 
 # =========================================================
 # Utilities
@@ -169,12 +171,11 @@ def validate_webhook():
 
 		got = auth_header[6:].strip()
 
-		# Debug log
-		frappe.logger().info(
-			f"[SMARTFLOW INBOUND AUTH] expected='{expected}' got='{got}' raw='{auth_header}'"
-		)
+		if got != expected:
+			log_call_event("Smartflo", "inbound_auth_failed", level="warning", received_length=len(got))
+			return False
 
-		return got == expected
+		return True
 
 	except Exception:
 		frappe.log_error(frappe.get_traceback(), "Inbound webhook token validation failed")
@@ -330,167 +331,88 @@ def _map_agent_number_to_user(agent_number):
 #         frappe.log_error(frappe.get_traceback(), "CRM Call Log update failed")
 #         return None, call_key
 
-def upsert_call_log(event, payload):
-    """
-    event: received | answered | completed
-    """
-    call_key = _call_key(payload)
-
-    customer = _extract_customer(payload)                 # customer_no_with_prefix
-    did = _extract_did(payload)                           # call_to_number
-    answered_agent_no = _extract_answered_agent_number(payload)
-
-    receiver_user = _map_agent_number_to_user(answered_agent_no) if answered_agent_no else None
+# Call log status reached by each Smartflo inbound event
+EVENT_STATUS = {
+    "received": "Ringing",
+    "answered": "In Progress",
+    "completed": "Completed",
+}
 
-    duration = _extract_duration_seconds(payload)         # billsec preferred
-    rec_url = _extract_recording_url(payload)
 
-    start_dt = _extract_start_dt(payload) or frappe.utils.now_datetime()
-    end_dt = _extract_end_dt(payload)
+def _link_call_log(doc):
+    """Link a new inbound call log with the Lead/Deal/Contact of the customer number."""
+    customer = doc.get("from")
+    if not customer:
+        return
 
-    # ✅ Find CRM entity by phone number (Lead/Deal/Contact)
-    # Expecting your method to return something like:
-    # {"name": "...", "lead": "...", "deal": "..."}
     contact_info = {}
     try:
-        if customer:
-            frappe.logger().info(f"[SMARTFLOW INBOUND] Looking up contact by phone: {customer}")
-            contact_info = get_contact_by_phone_number(customer) or {}
-            frappe.logger().info(f"[SMARTFLOW INBOUND] Contact lookup result: {contact_info}")
+        contact_info = get_contact_by_phone_number(customer) or {}
     except Exception:
         frappe.log_error(frappe.get_traceback(), "get_contact_by_phone_number failed")
 
-    # ✅ Decide reference (Lead > Deal > Contact)
-    ref_doctype = None
-    ref_docname = None
+    # ✅ Decide reference (Lead > Deal > Contact), this makes it appear in Activities
     if contact_info.get("lead"):
-        ref_doctype = "CRM Lead"
-        ref_docname = contact_info.get("lead")
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Linking to Lead: {ref_docname}")
+        doc.set("reference_doctype", "CRM Lead")
+        doc.set("reference_docname", contact_info.get("lead"))
     elif contact_info.get("deal"):
-        ref_doctype = "CRM Deal"
-        ref_docname = contact_info.get("deal")
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Linking to Deal: {ref_docname}")
+        doc.set("reference_doctype", "CRM Deal")
+        doc.set("reference_docname", contact_info.get("deal"))
     elif contact_info.get("name"):
-        ref_doctype = "Contact"
-        ref_docname = contact_info.get("name")
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Linking to Contact: {ref_docname}")
+        doc.set("reference_doctype", "Contact")
+        doc.set("reference_docname", contact_info.get("name"))
     else:
-        frappe.logger().warning(f"[SMARTFLOW INBOUND] No Lead/Deal/Contact found for phone: {customer}")
+        log_call_event("Smartflo", "inbound_unmatched_number", level="warning", number=customer)
 
-    existing_name = frappe.db.exists("CRM Call Log", {"id": call_key})
 
-    # -------------------------
-    # CREATE
-    # -------------------------
-    if not existing_name:
-        try:
-            doc = frappe.new_doc("CRM Call Log")
-            doc.set("id", call_key)
-            doc.set("type", "Incoming")
-            doc.set("telephony_medium", "Tata Tele")
-            doc.set("medium", "Smartflow")
-
-            # ✅ save numbers
-            if customer:
-                doc.set("from", customer)
-                # Don't set "caller" - it's a Link field, not for phone numbers
-            if did:
-                doc.set("to", did)
-
-            # ✅ link to Lead/Deal/Contact (this makes it appear in Activities)
-            if ref_doctype and ref_docname:
-                doc.set("reference_doctype", ref_doctype)
-                doc.set("reference_docname", ref_docname)
-
-            # ✅ receiver mapping
-            if receiver_user:
-                doc.set("receiver", receiver_user)
-
-            # times
-            doc.set("start_time", start_dt)
-
-            # default duration
-            doc.set("duration", 0)
-
-            # status updates
-            if event == "received":
-                doc.set("status", "Ringing")
-
-            elif event == "answered":
-                doc.set("status", "In Progress")
-
-            elif event == "completed":
-                doc.set("status", "Completed")
-                if duration is not None:
-                    doc.set("duration", duration)
-                doc.set("end_time", end_dt or frappe.utils.now_datetime())
-                if rec_url:
-                    doc.set("recording_url", rec_url)
-
-            else:
-                doc.set("status", "Initiated")
-
-            doc.insert(ignore_permissions=True)
-            frappe.db.commit()
-            return doc.name, call_key
+def _call_event_values(event, payload):
+    """Call log fields carried by a Smartflo inbound event."""
+    answered_agent_no = _extract_answered_agent_number(payload)
 
-        except Exception:
-            frappe.log_error(frappe.get_traceback(), "CRM Call Log insert failed")
-            return None, call_key
+    values = {
+        # Don't set "caller" - it's a Link field, not for phone numbers
+        "from": _extract_customer(payload),                       # customer_no_with_prefix
+        "to": _extract_did(payload),                              # call_to_number
+        "receiver": _map_agent_number_to_user(answered_agent_no) if answered_agent_no else None,
+        "start_time": _extract_start_dt(payload),
+    }
 
-    # -------------------------
-    # UPDATE
-    # -------------------------
-    try:
-        updates = {}
-
-        # ✅ save numbers
-        if customer:
-            updates["from"] = customer
-            # Don't set "caller" - it's a Link field, not for phone numbers
-        if did:
-            updates["to"] = did
-
-        # ✅ keep start_time stable
-        if frappe.db.get_value("CRM Call Log", existing_name, "start_time") in (None, ""):
-            updates["start_time"] = start_dt
-
-        # ✅ always ensure reference is filled (activities)
-        if ref_doctype and ref_docname:
-            updates["reference_doctype"] = ref_doctype
-            updates["reference_docname"] = ref_docname
-
-        # ✅ receiver
-        if receiver_user:
-            updates["receiver"] = receiver_user
-
-        if event == "received":
-            updates["status"] = "Ringing"
-
-        elif event == "answered":
-            updates["status"] = "In Progress"
-
-        elif event == "completed":
-            updates["status"] = "Completed"
-            if duration is not None:
-                updates["duration"] = duration
-            updates["end_time"] = end_dt or frappe.utils.now_datetime()
-            if rec_url:
-                updates["recording_url"] = rec_url
-
-        # apply updates safely (because "from" is reserved)
-        for k, v in updates.items():
-            if k == "from":
-                frappe.db.set_value("CRM Call Log", existing_name, "from", v)
-            else:
-                frappe.db.set_value("CRM Call Log", existing_name, k, v)
+    if event == "completed":
+        values["duration"] = _extract_duration_seconds(payload)   # billsec preferred
+        values["end_time"] = _extract_end_dt(payload) or frappe.utils.now_datetime()
+        values["recording_url"] = _extract_recording_url(payload)
+
+    return values
+
+
+def upsert_call_log(event, payload):
+    """
+    event: received | answered | completed
+
+    Events are applied through the call-event state machine, so a late "received"
+    can never move a completed call back to Ringing and redelivered events are skipped.
+    """
+    call_key = _call_key(payload)
 
+    try:
+        call_log = apply_call_event(
+            call_key,
+            EVENT_STATUS.get(event, "Initiated"),
+            _call_event_values(event, payload),
+            defaults={
+                "type": "Incoming",
+                "telephony_medium": "Tata Tele",
+                "medium": "Smartflow",
+                "start_time": frappe.utils.now_datetime(),
+            },
+            on_create=_link_call_log,
+            event_key=payload_digest(payload),
+        )
         frappe.db.commit()
-        return existing_name, call_key
+        return call_log.name, call_key
 
     except Exception:
-        frappe.log_error(frappe.get_traceback(), "CRM Call Log update failed")
+        frappe.log_error(frappe.get_traceback(), "CRM Call Log upsert failed")
         return None, call_key
 
 
@@ -503,19 +425,15 @@ def smartflow_inbound_received():
     frappe.local.no_csrf = True
     
     try:
-        frappe.logger().info("[SMARTFLOW INBOUND] Received webhook called")
-        
         if not validate_webhook():
-            frappe.logger().warning("[SMARTFLOW INBOUND] Webhook validation failed")
             frappe.local.response.http_status_code = 401
             return {"success": False, "error": "Unauthorized"}
 
         payload = _get_json()
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Payload: {json.dumps(payload, indent=2)}")
         
         name, call_id = upsert_call_log("received", payload)
-        
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Call log created/updated: {name}, call_id: {call_id}")
+
+        log_call_event("Smartflo", "inbound_received", payload, call_log=name)
 
         if not name:
             frappe.local.response.http_status_code = 500
@@ -524,7 +442,6 @@ def smartflow_inbound_received():
         return {"success": True, "event": "received", "call_log": name, "call_id": call_id}
         
     except Exception as e:
-        frappe.logger().error(f"[SMARTFLOW INBOUND] Exception in smartflow_inbound_received: {str(e)}")
         frappe.log_error(frappe.get_traceback(), "Smartflow Inbound Received Error")
         frappe.local.response.http_status_code = 500
         return {"success": False, "error": str(e)}
@@ -534,19 +451,15 @@ def smartflow_inbound_answered():
     frappe.local.no_csrf = True
     
     try:
-        frappe.logger().info("[SMARTFLOW INBOUND] Answered webhook called")
-        
         if not validate_webhook():
-            frappe.logger().warning("[SMARTFLOW INBOUND] Webhook validation failed")
             frappe.local.response.http_status_code = 401
             return {"success": False, "error": "Unauthorized"}
 
         payload = _get_json()
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Payload: {json.dumps(payload, indent=2)}")
         
         name, call_id = upsert_call_log("answered", payload)
-        
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Call log updated: {name}, call_id: {call_id}")
+
+        log_call_event("Smartflo", "inbound_answered", payload, call_log=name)
 
         if not name:
             frappe.local.response.http_status_code = 500
@@ -555,7 +468,6 @@ def smartflow_inbound_answered():
         return {"success": True, "event": "answered", "call_log": name, "call_id": call_id}
         
     except Exception as e:
-        frappe.logger().error(f"[SMARTFLOW INBOUND] Exception in smartflow_inbound_answered: {str(e)}")
         frappe.log_error(frappe.get_traceback(), "Smartflow Inbound Answered Error")
         frappe.local.response.http_status_code = 500
         return {"success": False, "error": str(e)}
@@ -565,19 +477,15 @@ def smartflow_inbound_completed():
     frappe.local.no_csrf = True
     
     try:
-        frappe.logger().info("[SMARTFLOW INBOUND] Completed webhook called")
-        
         if not validate_webhook():
-            frappe.logger().warning("[SMARTFLOW INBOUND] Webhook validation failed")
             frappe.local.response.http_status_code = 401
             return {"success": False, "error": "Unauthorized"}
 
         payload = _get_json()
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Payload: {json.dumps(payload, indent=2)}")
         
         name, call_id = upsert_call_log("completed", payload)
-        
-        frappe.logger().info(f"[SMARTFLOW INBOUND] Call log completed: {name}, call_id: {call_id}")
+
+        log_call_event("Smartflo", "inbound_completed", payload, call_log=name)
 
         if not name:
             frappe.local.response.http_status_code = 500
@@ -586,7 +494,6 @@ def smartflow_inbound_completed():
         return {"success": True, "event": "completed", "call_log": name, "call_id": call_id}
         
     except Exception as e:
-        frappe.logger().error(f"[SMARTFLOW INBOUND] Exception in smartflow_inbound_completed: {str(e)}")
         frappe.log_error(frappe.get_traceback(), "Smartflow Inbound Completed Error")
         frappe.local.response.http_status_code = 500
         return {"success": False, "error": str(e)}
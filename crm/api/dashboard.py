@@ -1141,6 +1141,209 @@ def get_deals_by_salesperson(from_date="", to_date="", user=""):
 	}
 
 
+# Dimensions of `CRM Call Metrics` the call analytics can be grouped by
+CALL_METRICS_GROUP_BY = {
+	"agent": "IFNULL(u.full_name, m.agent)",
+	"team": "m.team",
+	"department": "m.department",
+	"telephony_medium": "m.telephony_medium",
+	"did": "m.did",
+}
+
+
+@frappe.whitelist()
+@sales_user_only
+def get_call_analytics(from_date="", to_date="", group_by="agent", user=""):
+	"""
+	Get talk time, answer rate, missed calls and average handle time grouped by agent, team,
+	department, telephony medium or DID. Reads the hourly `CRM Call Metrics` rollup, not the call logs.
+	"""
+	if group_by not in CALL_METRICS_GROUP_BY:
+		frappe.throw(_("Invalid group by {0}").format(group_by))
+
+	if not from_date or not to_date:
+		from_date = frappe.utils.get_first_day(from_date or frappe.utils.nowdate())
+		to_date = frappe.utils.get_last_day(to_date or frappe.utils.nowdate())
+
+	roles = frappe.get_roles(frappe.session.user)
+	if "Sales User" in roles and "Sales Manager" not in roles and "System Manager" not in roles:
+		user = frappe.session.user
+
+	return get_call_metrics(from_date, to_date, user, group_by)
+
+
+def get_call_metrics(from_date, to_date, user="", group_by=None):
+	"""
+	Sum the call metrics between two dates, optionally grouped by one of `CALL_METRICS_GROUP_BY`.
+	[
+		{ agent: 'John Smith', total_calls: 120, answered_calls: 96, missed_calls: 14,
+		  talk_time: 25200, answer_rate: 80.0, average_handle_time: 262.5 },
+		...
+	]
+	"""
+	conds = ""
+	params = {"from": from_date, "to": to_date}
+
+	if user:
+		conds += " AND m.agent = %(user)s"
+		params["user"] = user
+
+	group_field, group_clause = "", ""
+	if group_by:
+		group_field = f"IFNULL({CALL_METRICS_GROUP_BY[group_by]}, '') AS `{group_by}`,"
+		group_clause = "GROUP BY 1 ORDER BY total_calls DESC"
+
+	result = frappe.db.sql(
+		f"""
+		SELECT
+			{group_field}
+			IFNULL(SUM(m.total_calls), 0) AS total_calls,
+			IFNULL(SUM(m.answered_calls), 0) AS answered_calls,
+			IFNULL(SUM(m.missed_calls), 0) AS missed_calls,
+			IFNULL(SUM(m.talk_time), 0) AS talk_time
+		FROM `tabCRM Call Metrics` AS m
+		LEFT JOIN `tabUser` AS u ON u.name = m.agent
+		WHERE m.period_start >= %(from)s AND m.period_start < DATE_ADD(%(to)s, INTERVAL 1 DAY)
+		{conds}
+		{group_clause}
+		""",
+		params,
+		as_dict=True,
+	)
+
+	for row in result:
+		row.answer_rate = row.answered_calls / row.total_calls * 100 if row.total_calls else 0
+		row.average_handle_time = row.talk_time / row.answered_calls if row.answered_calls else 0
+
+	return result
+
+
+def get_previous_period(from_date, to_date):
+	diff = frappe.utils.date_diff(to_date, from_date)
+	if diff == 0:
+		diff = 1
+	return frappe.utils.add_days(from_date, -diff), frappe.utils.add_days(from_date, -1)
+
+
+def get_call_answer_rate(from_date, to_date, user=""):
+	"""
+	Get the share of answered calls for the dashboard.
+	"""
+	current = get_call_metrics(from_date, to_date, user)[0]
+	prev = get_call_metrics(*get_previous_period(from_date, to_date), user)[0]
+
+	return {
+		"title": _("Call answer rate"),
+		"tooltip": _("Percentage of calls that were answered"),
+		"value": current.answer_rate,
+		"suffix": "%",
+		"delta": current.answer_rate - prev.answer_rate if prev.total_calls else 0,
+		"deltaSuffix": "%",
+	}
+
+
+def get_missed_calls(from_date, to_date, user=""):
+	"""
+	Get the number of missed incoming calls for the dashboard.
+	"""
+	current = get_call_metrics(from_date, to_date, user)[0]
+	prev = get_call_metrics(*get_previous_period(from_date, to_date), user)[0]
+
+	return {
+		"title": _("Missed calls"),
+		"tooltip": _("Incoming calls that were not answered"),
+		"value": current.missed_calls,
+		"delta": (current.missed_calls - prev.missed_calls) / prev.missed_calls * 100
+		if prev.missed_calls
+		else 0,
+		"deltaSuffix": "%",
+		"negativeIsBetter": True,
+	}
+
+
+def get_average_handle_time(from_date, to_date, user=""):
+	"""
+	Get the average talk time of answered calls for the dashboard.
+	"""
+	current = get_call_metrics(from_date, to_date, user)[0]
+	prev = get_call_metrics(*get_previous_period(from_date, to_date), user)[0]
+	value = current.average_handle_time / 60
+	prev_value = prev.average_handle_time / 60
+
+	return {
+		"title": _("Avg. handle time"),
+		"tooltip": _("Average talk time of answered calls"),
+		"value": value,
+		"suffix": " min",
+		"delta": value - prev_value if prev_value else 0,
+		"deltaSuffix": " min",
+		"negativeIsBetter": True,
+	}
+
+
+def get_calls_by_agent(from_date="", to_date="", user=""):
+	"""
+	Get answered and missed calls with talk time per agent for the dashboard.
+	"""
+	return _calls_by_chart(
+		from_date,
+		to_date,
+		user,
+		"agent",
+		_("Calls by agent"),
+		_("Answered and missed calls and talk time per agent"),
+		_("Agent"),
+	)
+
+
+def get_calls_by_team(from_date="", to_date="", user=""):
+	"""
+	Get answered and missed calls with talk time per team for the dashboard.
+	"""
+	return _calls_by_chart(
+		from_date,
+		to_date,
+		user,
+		"team",
+		_("Calls by team"),
+		_("Answered and missed calls and talk time per team"),
+		_("Team"),
+	)
+
+
+def _calls_by_chart(from_date, to_date, user, group_by, title, subtitle, axis_title):
+	if not from_date or not to_date:
+		from_date = frappe.utils.get_first_day(from_date or frappe.utils.nowdate())
+		to_date = frappe.utils.get_last_day(to_date or frappe.utils.nowdate())
+
+	result = get_call_metrics(from_date, to_date, user, group_by)
+	for row in result:
+		row[group_by] = row[group_by] or _("Unassigned")
+		row.talk_time = row.talk_time / 60
+
+	return {
+		"data": result,
+		"title": title,
+		"subtitle": subtitle,
+		"xAxis": {
+			"title": axis_title,
+			"key": group_by,
+			"type": "category",
+		},
+		"yAxis": {
+			"title": _("Number of calls"),
+		},
+		"y2Axis": {
+			"title": _("Talk time (min)"),
+		},
+		"series": [
+			{"name": "answered_calls", "type": "bar"},
+			{"name": "missed_calls", "type": "bar"},
+			{"name": "talk_time", "type": "line", "showDataPoints": True, "axis": "y2"},
+		],
+	}
+
+
 def get_base_currency_symbol():
 	"""
 	Get the base currency symbol from the system settings.
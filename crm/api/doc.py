@@ -872,7 +872,7 @@ def remove_linked_doc_reference(items, remove_contact=None, delete=False):
 
 @frappe.whitelist()
 def delete_bulk_docs(doctype, items, delete_linked=False):
-	from frappe.desk.reportview import delete_bulk
+	from crm.api.bulk_delete import delete_docs
 
 	if not doctype:
 		frappe.throw("Doctype is required")
@@ -884,32 +884,4 @@ def delete_bulk_docs(doctype, items, delete_linked=False):
 	if not isinstance(items, list):
 		frappe.throw("Items must be a list")
 
-	for doc in items:
-		try:
-			if not frappe.db.exists(doctype, doc):
-				frappe.log_error(f"Document {doctype} {doc} does not exist", "Bulk Delete Error")
-				continue
-
-			linked_docs = get_linked_docs_of_document(doctype, doc)
-			for linked_doc in linked_docs:
-				if not linked_doc.get("reference_doctype") or not linked_doc.get("reference_docname"):
-					continue
-
-				remove_linked_doc_reference(
-					[
-						{
-							"doctype": linked_doc["reference_doctype"],
-							"docname": linked_doc["reference_docname"],
-						}
-					],
-					remove_contact=doctype == "Contact",
-					delete=delete_linked,
-				)
-		except Exception as e:
-			frappe.log_error(f"Error processing linked docs for {doctype} {doc}: {e!s}", "Bulk Delete Error")
-
-	if len(items) > 10:
-		frappe.enqueue("frappe.desk.reportview.delete_bulk", doctype=doctype, items=items)
-	else:
-		delete_bulk(doctype, items)
-	return "success"
+	return delete_docs(doctype, items, delete_linked=delete_linked)
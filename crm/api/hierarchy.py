@@ -5,6 +5,8 @@ Shift → Department → Team → Agent
 import frappe
 from frappe import _
 
+from crm.api.lead_distribution import distribute_leads, get_team_fields
+
 
 @frappe.whitelist()
 def get_user_hierarchy():
@@ -325,28 +327,40 @@ def get_my_leads_for_dialer():
 
 @frappe.whitelist()
 def assign_lead_to_hierarchy(lead, team=None, department=None):
-	"""Assign a lead to team/department (auto-fills shift)"""
+	"""Assign a lead to team/department (auto-fills shift), a lead without owner gets an agent of the team"""
 	if not lead:
 		frappe.throw("Lead is required")
 	
-	lead_doc = frappe.get_doc("CRM Lead", lead)
-	
+	sources = {}
 	if team:
-		team_doc = frappe.get_doc("CRM Team", team)
-		lead_doc.assigned_team = team
-		lead_doc.assigned_department = team_doc.department
-		lead_doc.assigned_shift = team_doc.shift
+		team_doc = frappe.db.get_value("CRM Team", team, ["department", "shift"], as_dict=True)
+		if not team_doc:
+			frappe.throw(_("Team {0} not found").format(team))
+		sources = {"name": team, "department": team_doc.department, "shift": team_doc.shift}
 	elif department:
-		dept_doc = frappe.get_doc("CRM Department", department)
-		lead_doc.assigned_department = department
-		lead_doc.assigned_shift = dept_doc.shift
+		sources = {
+			"department": department,
+			"shift": frappe.db.get_value("CRM Department", department, "shift")
+		}
+	
+	# sites have the assigned_* fields or the older sales_team/department ones
+	team_fields = get_team_fields()
+	values = {field: sources[source] for field, source in team_fields.items() if source in sources}
+	if values:
+		frappe.db.set_value("CRM Lead", lead, values)
+	
+	# Pick the agent within the team
+	if team:
+		distribute_leads([lead])
 	
-	lead_doc.save(ignore_permissions=True)
+	lead_doc = frappe.db.get_value("CRM Lead", lead, ["lead_owner", *team_fields], as_dict=True)
+	hierarchy = {source: lead_doc.get(field) for field, source in team_fields.items()}
 	
 	return {
 		"success": True,
 		"lead": lead,
-		"assigned_team": lead_doc.assigned_team,
-		"assigned_department": lead_doc.assigned_department,
-		"assigned_shift": lead_doc.assigned_shift
+		"lead_owner": lead_doc.lead_owner,
+		"assigned_team": hierarchy.get("name"),
+		"assigned_department": hierarchy.get("department"),
+		"assigned_shift": hierarchy.get("shift")
 	}
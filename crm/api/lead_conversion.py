@@ -0,0 +1,314 @@
+"""
+Bulk lead to deal conversion.
+
+`convert_to_deal` converts one lead: it looks its contact up with three queries, inserts the
+contact and organization with all their hooks and then the deal. `convert_leads` converts a whole
+batch. It first matches every lead to an existing contact and organization with one query per
+table, dedupes the ones to create across the batch (two leads with the same email get one
+contact) and writes them with one insert per table. Deals are then created in chunks, each in a
+savepoint: a chunk that fails is rolled back and retried lead by lead, so one bad lead costs its
+own conversion only. Failures are reported per lead.
+"""
+
+import frappe
+from frappe import _
+from frappe.contacts.doctype.contact.contact import get_full_name
+
+from crm.integrations.phone_index import index_new_documents
+from crm.lead_syncing.ingest import insert_each
+
+LEAD = "CRM Lead"
+CHUNK_SIZE = 50
+# Larger conversions run in a background job
+INLINE_LIMIT = 100
+RESULT_EVENT = "crm_bulk_convert_to_deal"
+
+
+@frappe.whitelist()
+def convert_leads(names: list | str):
+	"""
+	Convert leads to deals.
+
+	:param names: Names of the leads, leads the user cannot change are left out
+	:return: The result of `convert_lead_batch`, or the job id when the conversion runs in the
+		background; its result is then published to the user on `crm_bulk_convert_to_deal`
+	"""
+	frappe.has_permission(LEAD, "write", throw=True)
+	frappe.has_permission("CRM Deal", "create", throw=True)
+	names = frappe.parse_json(names) if isinstance(names, str) else names
+	names = frappe.get_list(LEAD, filters={"name": ("in", names)}, pluck="name")
+
+	if len(names) <= INLINE_LIMIT:
+		return convert_lead_batch(names)
+
+	job_id = f"crm_bulk_convert::{frappe.generate_hash(length=10)}"
+	frappe.enqueue(
+		"crm.api.lead_conversion.convert_lead_batch",
+		queue="long",
+		timeout=3600,
+		job_id=job_id,
+		names=names,
+		commit=True,
+		enqueue_after_commit=True,
+	)
+	return {"job_id": job_id}
+
+
+def convert_lead_batch(names, commit=False):
+	"""
+	:return: `{"deals": {lead: deal}, "failed": {lead: error}, "skipped": [converted leads]}`
+	"""
+	leads = [frappe.get_doc(LEAD, name) for name in names]
+	# the read permission `convert_leads` filtered on is not enough, `convert_to_deal` needs write
+	leads = [lead for lead in leads if frappe.has_permission(LEAD, "write", doc=lead)]
+	skipped = [lead.name for lead in leads if lead.converted]
+	leads = [lead for lead in leads if not lead.converted]
+
+	failed = {}
+	contacts = get_contacts(leads, failed)
+	organizations = get_organizations(leads, failed)
+	leads = [lead for lead in leads if lead.name not in failed]
+	if commit:
+		frappe.db.commit()
+
+	lead_values = get_converted_lead_values()
+	deals = {}
+	for i in range(0, len(leads), CHUNK_SIZE):
+		chunk = leads[i : i + CHUNK_SIZE]
+		chunk_deals, chunk_failed = create_deals(chunk, contacts, organizations, lead_values)
+		deals.update(chunk_deals)
+		failed.update(chunk_failed)
+		if commit:
+			frappe.db.commit()
+
+	result = {"deals": deals, "failed": failed, "skipped": skipped}
+	if commit:
+		frappe.publish_realtime(RESULT_EVENT, result, user=frappe.session.user)
+	return result
+
+
+def get_contacts(leads, failed):
+	"""
+	`{lead: contact}` of the leads, creating the contacts that do not exist yet in one insert.
+
+	A lead's contact is the one with its email, else its phone, else its mobile number, like
+	`CRMLead.contact_exists`. Leads of the batch sharing one of those share the new contact.
+	Leads whose contact cannot be created are added to `failed`, `{lead: error}`.
+	"""
+	emails = {lead.email for lead in leads if lead.email}
+	phones = {phone for lead in leads for phone in (lead.phone, lead.mobile_no) if phone}
+	by_email = dict(
+		frappe.get_all(
+			"Contact Email",
+			filters={"email_id": ("in", list(emails))},
+			fields=["email_id", "parent"],
+			as_list=True,
+		)
+		if emails
+		else []
+	)
+	by_phone = dict(
+		frappe.get_all(
+			"Contact Phone", filters={"phone": ("in", list(phones))}, fields=["phone", "parent"], as_list=True
+		)
+		if phones
+		else []
+	)
+
+	contacts, existing, new_contacts, used_names = {}, {}, [], set()
+	for lead in leads:
+		contact = by_email.get(lead.email) or by_phone.get(lead.phone) or by_phone.get(lead.mobile_no)
+		if contact:
+			contacts[lead.name] = contact
+			existing.setdefault(contact, []).append(lead)
+			continue
+
+		try:
+			contact = prepare_contact(lead, used_names)
+		except Exception as e:
+			record_failure(failed, lead.name, e)
+			continue
+		new_contacts.append(contact)
+		contacts[lead.name] = contact.name
+		# later leads of the batch with the same email or numbers get this contact
+		if lead.email:
+			by_email[lead.email] = contact.name
+		for phone in (lead.phone, lead.mobile_no):
+			if phone:
+				by_phone[phone] = contact.name
+
+	if new_contacts:
+		errors = insert_each(new_contacts)
+		index_new_documents([contact for contact in new_contacts if contact.name not in errors])
+		for lead, contact in contacts.items():
+			if contact in errors:
+				record_failure(failed, lead, errors[contact])
+	if existing:
+		update_leads_from_contacts(existing)
+	return contacts
+
+
+def prepare_contact(lead, used_names):
+	"""Build the contact of a lead as `CRMLead.create_contact` would, ready to be written."""
+	if not lead.lead_name:
+		lead.set_full_name()
+		lead.set_lead_name()
+
+	contact = frappe.new_doc("Contact")
+	contact.update(
+		{
+			"first_name": lead.first_name or lead.lead_name,
+			"last_name": lead.last_name,
+			"salutation": lead.salutation,
+			"gender": lead.gender,
+			"designation": lead.job_title,
+			"company_name": lead.organization,
+			"image": lead.image or "",
+		}
+	)
+	if lead.email:
+		contact.append("email_ids", {"email_id": lead.email, "is_primary": 1})
+	if lead.phone:
+		contact.append("phone_nos", {"phone": lead.phone, "is_primary_phone": 1})
+	if lead.mobile_no:
+		contact.append("phone_nos", {"phone": lead.mobile_no, "is_primary_mobile_no": 1})
+
+	# what `Contact.validate` sets, without its gravatar lookup: the lead had one already
+	contact.full_name = get_full_name(
+		contact.first_name, contact.middle_name, contact.last_name, contact.company_name
+	)
+	contact.set_primary_email()
+	contact.set_primary("phone")
+	contact.set_primary("mobile_no")
+
+	contact.set_new_name()
+	# the names of the batch are not in the database yet to be numbered against
+	base_name, number = contact.name, 0
+	while contact.name in used_names or (number and frappe.db.exists("Contact", contact.name)):
+		number += 1
+		contact.name = f"{base_name}-{number}"
+	used_names.add(contact.name)
+
+	contact.set_parent_in_children()
+	contact.set_user_and_timestamp()
+	contact._validate_mandatory()
+	return contact
+
+
+def update_leads_from_contacts(existing):
+	"""Take the details of the existing contacts over on their leads, like `update_lead_contact`."""
+	fields = ["name", "salutation", "first_name", "last_name", "email_id", "mobile_no"]
+	for contact in frappe.get_all("Contact", filters={"name": ("in", list(existing))}, fields=fields):
+		values = {
+			"salutation": contact.salutation,
+			"first_name": contact.first_name,
+			"last_name": contact.last_name,
+			"email": contact.email_id,
+			"mobile_no": contact.mobile_no,
+		}
+		names = [lead.name for lead in existing[contact.name]]
+		frappe.db.set_value(LEAD, {"name": ("in", names)}, values, update_modified=False)
+		for lead in existing[contact.name]:
+			lead.update(values)
+
+
+def get_organizations(leads, failed):
+	"""
+	`{lead: organization}` of the leads with one, creating the missing ones in one insert. Leads
+	whose organization cannot be created are added to `failed`, `{lead: error}`.
+	"""
+	names = {lead.organization for lead in leads if lead.organization}
+	if not names:
+		return {}
+
+	existing = dict(
+		frappe.get_all(
+			"CRM Organization",
+			filters={"organization_name": ("in", list(names))},
+			fields=["organization_name", "name"],
+			as_list=True,
+		)
+	)
+	new_organizations = {}
+	for lead in leads:
+		if lead.name in failed or not lead.organization:
+			continue
+		if lead.organization in existing or lead.organization in new_organizations:
+			continue
+
+		organization = frappe.new_doc("CRM Organization")
+		organization.update(
+			{
+				"organization_name": lead.organization,
+				"website": lead.website,
+				"territory": lead.territory,
+				"industry": lead.industry,
+				"annual_revenue": lead.annual_revenue,
+				# no currency, so the system currency
+				"exchange_rate": 1,
+			}
+		)
+		organization.set_new_name()
+		organization.set_user_and_timestamp()
+		new_organizations[lead.organization] = organization
+
+	errors = insert_each(list(new_organizations.values())) if new_organizations else {}
+
+	organizations = {**existing, **{name: doc.name for name, doc in new_organizations.items()}}
+	result = {}
+	for lead in leads:
+		if lead.name in failed or not lead.organization:
+			continue
+		if organizations[lead.organization] in errors:
+			record_failure(failed, lead.name, errors[organizations[lead.organization]])
+			continue
+		result[lead.name] = organizations[lead.organization]
+	return result
+
+
+def record_failure(failed, lead, error):
+	failed[lead] = str(error) or _("Could not convert the lead")
+	frappe.log_error(title="Lead conversion failed", reference_doctype=LEAD, reference_name=lead)
+
+
+def get_converted_lead_values():
+	"""What `convert_to_deal` sets on a converted lead, communication status only if it has an SLA."""
+	values = {"converted": 1}
+	if frappe.db.exists("CRM Lead Status", "Qualified"):
+		values["status"] = "Qualified"
+	if frappe.db.exists("CRM Communication Status", "Replied"):
+		values["communication_status"] = "Replied"
+	return values
+
+
+def create_deals(leads, contacts, organizations, lead_values):
+	"""Create the deals of a chunk in one savepoint, lead by lead if that fails."""
+	savepoint = f"convert_{frappe.generate_hash(length=8)}"
+	frappe.db.savepoint(savepoint)
+	try:
+		return {lead.name: convert_lead(lead, contacts, organizations, lead_values) for lead in leads}, {}
+	except Exception:
+		frappe.db.rollback(save_point=savepoint)
+
+	deals, failed = {}, {}
+	for lead in leads:
+		frappe.db.savepoint(savepoint)
+		try:
+			deals[lead.name] = convert_lead(lead, contacts, organizations, lead_values)
+		except Exception as e:
+			frappe.db.rollback(save_point=savepoint)
+			record_failure(failed, lead.name, e)
+	return deals, failed
+
+
+def convert_lead(lead, contacts, organizations, lead_values):
+	"""What `convert_to_deal` does for one lead, its contact and organization being known."""
+	values = dict(lead_values)
+	if not lead.sla:
+		values.pop("communication_status", None)
+	lead.db_set(values)
+
+	organization = organizations.get(lead.name)
+	if organization and organization != lead.organization:
+		lead.db_set("organization", organization)
+	return lead.create_deal(contacts[lead.name], organization)
@@ -0,0 +1,331 @@
+"""
+Lead distribution within a team.
+
+Teams set on leads (by hand, by `crm.api.hierarchy.assign_lead_to_hierarchy` or by a lead sync
+source) say who may work a lead; `distribute_leads` picks the agent. It takes a whole batch of
+leads at once, picks an owner for each in memory and writes them with one update, then shares
+and assigns the leads through `crm.api.reassignment`.
+
+Leads created by a Data Import are gathered as they are inserted, the importer committing each row
+on its own, and distributed by one background job in the batches that piled up meanwhile.
+
+Agents are the enabled users among the team's `CRM Team Member` records, picked by smooth
+weighted round-robin: an agent with weight 3 gets three leads for every one of an agent with
+weight 1, interleaved rather than in runs. Agents outside their team's shift hours, or holding
+`max_open_leads` unconverted leads, are passed over until that changes.
+
+The round-robin counters live in memory per worker, with the roster and the open lead counts,
+and are reloaded every `STATE_TTL` seconds. The counters are saved to redis at most every
+`PERSIST_INTERVAL` seconds, so a restarted worker carries on where the last one stopped.
+
+`benchmark` measures the picking rate and how closely each agent's share follows its weight:
+
+	bench --site test.localhost execute crm.api.lead_distribution.benchmark --kwargs "{'count': 100000}"
+"""
+
+import threading
+import time
+
+import frappe
+from frappe.utils import now_datetime
+
+from crm.api.reassignment import apply_owners
+from crm.utils import get_writable_names
+
+LEAD = "CRM Lead"
+STATE_TTL = 60
+PERSIST_INTERVAL = 10
+COUNTERS_KEY = "crm:lead_distribution:{0}"
+IMPORTED_LEADS_KEY = "crm:lead_distribution_imports"
+
+# Hierarchy fields of CRM Lead, filled from the CRM Team; sites have one set or the other
+TEAM_FIELD_SETS = (
+	{"assigned_team": "name", "assigned_department": "department", "assigned_shift": "shift"},
+	{"sales_team": "name", "department": "department"},
+)
+
+# (site, team) -> TeamState
+_teams = {}
+_teams_lock = threading.Lock()
+
+
+class Agent:
+	__slots__ = ("capacity", "current", "open_leads", "user", "weight")
+
+	def __init__(self, user, weight=1, capacity=0, open_leads=0, current=0):
+		self.user = user
+		self.weight = max(int(weight or 1), 1)
+		self.capacity = int(capacity or 0)
+		self.open_leads = open_leads
+		self.current = current
+
+	def has_capacity(self):
+		return not self.capacity or self.open_leads < self.capacity
+
+
+class TeamState:
+	"""Roster and round-robin counters of one team."""
+
+	def __init__(self, team, agents, shift=None):
+		self.team = team
+		self.agents = agents
+		self.shift = shift
+		self.loaded_at = time.monotonic()
+		self.persisted_at = self.loaded_at
+		self.lock = threading.Lock()
+
+	def is_on_shift(self):
+		return not self.shift or bool(self.shift.is_active_now())
+
+	def pick(self) -> str | None:
+		"""Next agent by smooth weighted round-robin among those with capacity left."""
+		best, total = None, 0
+		for agent in self.agents:
+			if not agent.has_capacity():
+				continue
+			agent.current += agent.weight
+			total += agent.weight
+			if best is None or agent.current > best.current:
+				best = agent
+
+		if best is None:
+			return None
+		best.current -= total
+		best.open_leads += 1
+		return best.user
+
+	def assign(self, count) -> list[str | None]:
+		"""Agents for `count` leads, None for leads nobody can take now."""
+		if not self.is_on_shift():
+			return [None] * count
+		with self.lock:
+			return [self.pick() for _ in range(count)]
+
+	def counters(self):
+		return {agent.user: agent.current for agent in self.agents}
+
+
+@frappe.whitelist()
+def distribute(names: list | str, team: str | None = None, reassign: bool = False):
+	"""Pick owners for leads within `team`, or within the team each lead is set to."""
+	frappe.has_permission(LEAD, "write", throw=True)
+	names = frappe.parse_json(names) if isinstance(names, str) else names
+	names = get_writable_names(LEAD, names)
+	return distribute_leads(names, team, reassign=frappe.utils.cint(reassign))
+
+
+def distribute_leads(names, team=None, reassign=False):
+	"""
+	Give each lead an owner from its team in one pass.
+
+	:param team: Team to distribute all the leads to, it is set on them; by default each lead's team
+	:param reassign: Also distribute leads that have an owner already
+	:return: `{"assigned": {lead: agent}, "unassigned": [leads no agent could take]}`
+	"""
+	team_fields = get_team_fields()
+	if not names or not team_fields:
+		return {"assigned": {}, "unassigned": list(names or [])}
+
+	team_field = next(iter(team_fields))
+	leads = frappe.get_all(
+		LEAD,
+		filters={"name": ("in", list(names))},
+		fields=["name", "lead_owner", f"{team_field} as team"],
+	)
+
+	by_team = {}
+	for lead in leads:
+		if lead.lead_owner and not reassign:
+			continue
+		if lead_team := team or lead.team:
+			by_team.setdefault(lead_team, []).append(lead.name)
+
+	assigned, unassigned = {}, []
+	for lead_team, team_leads in by_team.items():
+		state = get_team_state(lead_team)
+		agents = state.assign(len(team_leads)) if state else [None] * len(team_leads)
+		for name, agent in zip(team_leads, agents, strict=True):
+			if agent:
+				assigned[name] = agent
+			else:
+				unassigned.append(name)
+		if state:
+			persist_counters(state)
+
+	write_owners(assigned, team, team_fields)
+	if team and unassigned:
+		write_team(unassigned, team, team_fields)
+	apply_owners(LEAD, assigned)
+	return {"assigned": assigned, "unassigned": unassigned}
+
+
+def queue_imported_lead(doc, method=None):
+	"""CRM Lead `after_insert`: leave the leads of a Data Import to `distribute_imported_leads`."""
+	if not frappe.flags.in_import:
+		return
+	frappe.cache.sadd(IMPORTED_LEADS_KEY, doc.name)
+	frappe.enqueue(
+		"crm.api.lead_distribution.distribute_imported_leads",
+		queue="long",
+		job_id="crm_distribute_imported_leads",
+		deduplicate=True,
+		enqueue_after_commit=True,
+	)
+
+
+def distribute_imported_leads():
+	"""Distribute the imported leads gathered so far, until no more come in."""
+	while names := [frappe.safe_decode(name) for name in frappe.cache.smembers(IMPORTED_LEADS_KEY)]:
+		distribute_leads(names)
+		frappe.db.commit()
+		frappe.cache.srem(IMPORTED_LEADS_KEY, *names)
+
+
+def get_team_fields() -> dict[str, str]:
+	"""The set of hierarchy fields this site's CRM Lead has, `{lead field: team field}`."""
+	meta = frappe.get_meta(LEAD)
+	for fields in TEAM_FIELD_SETS:
+		if meta.has_field(next(iter(fields))):
+			return {field: source for field, source in fields.items() if meta.has_field(field)}
+	return {}
+
+
+def get_team_state(team) -> TeamState | None:
+	key = (getattr(frappe.local, "site", None), team)
+	with _teams_lock:
+		state = _teams.get(key)
+	if state and time.monotonic() - state.loaded_at < STATE_TTL:
+		return state
+
+	fresh = load_team_state(team)
+	if state and fresh:
+		# keep the counters of this worker, they are newer than the saved ones
+		current = state.counters()
+		for agent in fresh.agents:
+			agent.current = current.get(agent.user, agent.current)
+	with _teams_lock:
+		_teams[key] = fresh
+	return fresh
+
+
+def load_team_state(team) -> TeamState | None:
+	"""Load a team's agents with their open lead counts and saved counters."""
+	team_doc = frappe.db.get_value("CRM Team", team, ["enabled", "shift"], as_dict=True)
+	if not team_doc or not team_doc.enabled:
+		return None
+
+	members = frappe.db.sql(
+		"""
+		select tm.user, tm.weight, tm.max_open_leads
+		from `tabCRM Team Member` tm
+		join `tabUser` u on u.name = tm.user
+		where tm.team = %s and u.enabled = 1
+		order by tm.creation
+		""",
+		(team,),
+		as_dict=True,
+	)
+	if not members:
+		return None
+
+	users = tuple(member.user for member in members)
+	open_leads = dict(
+		frappe.db.sql(
+			"""
+			select lead_owner, count(*) from `tabCRM Lead`
+			where lead_owner in %(users)s and converted = 0
+			group by lead_owner
+			""",
+			{"users": users},
+		)
+	)
+	counters = frappe.cache.get_value(COUNTERS_KEY.format(team)) or {}
+	agents = [
+		Agent(
+			member.user,
+			weight=member.weight,
+			capacity=member.max_open_leads,
+			open_leads=open_leads.get(member.user, 0),
+			current=counters.get(member.user, 0),
+		)
+		for member in members
+	]
+	shift = frappe.get_cached_doc("CRM Shift", team_doc.shift) if team_doc.shift else None
+	return TeamState(team, agents, shift)
+
+
+def persist_counters(state, force=False):
+	now = time.monotonic()
+	if not force and now - state.persisted_at < PERSIST_INTERVAL:
+		return
+	state.persisted_at = now
+	frappe.cache.set_value(COUNTERS_KEY.format(state.team), state.counters())
+
+
+def write_owners(assigned, team, team_fields):
+	"""Set the picked owners with one `UPDATE ... CASE`, and the team when it was given."""
+	if not assigned:
+		return
+
+	params = {"names": tuple(assigned), "now": now_datetime()}
+	cases = []
+	for i, (name, agent) in enumerate(assigned.items()):
+		params[f"n{i}"], params[f"a{i}"] = name, agent
+		cases.append(f"when %(n{i})s then %(a{i})s")
+
+	assignments = [f"lead_owner = case name {' '.join(cases)} end", "modified = %(now)s"]
+	assignments += get_team_assignments(team, team_fields, params)
+	frappe.db.sql(f"update `tabCRM Lead` set {', '.join(assignments)} where name in %(names)s", params)
+
+
+def write_team(names, team, team_fields):
+	params = {"names": tuple(names), "now": now_datetime()}
+	assignments = ["modified = %(now)s", *get_team_assignments(team, team_fields, params)]
+	frappe.db.sql(f"update `tabCRM Lead` set {', '.join(assignments)} where name in %(names)s", params)
+
+
+def get_team_assignments(team, team_fields, params):
+	meta = frappe.get_meta(LEAD)
+	assignments = []
+	if meta.has_field("auto_distributed"):
+		assignments.append("auto_distributed = 1")
+	if meta.has_field("distribution_timestamp"):
+		assignments.append("distribution_timestamp = %(now)s")
+	if not team:
+		return assignments
+
+	values = frappe.get_cached_value("CRM Team", team, ["department", "shift"], as_dict=True) or {}
+	for field, source in team_fields.items():
+		params[f"team_{field}"] = team if source == "name" else values.get(source)
+		assignments.append(f"`{field}` = %(team_{field})s")
+	return assignments
+
+
+def benchmark(count=100000, weights=(1, 1, 2, 3, 5), window=1000):
+	"""
+	Pick agents for `count` leads over a synthetic team, without touching the database.
+
+	:return: Leads per second, and the largest gap between an agent's share of the leads and its
+		share of the weight, over all the leads and over every run of `window` consecutive leads
+	"""
+	agents = [Agent(f"agent-{i}@example.com", weight=weight) for i, weight in enumerate(weights)]
+	state = TeamState("Benchmark", agents)
+	total_weight = sum(weights)
+	expected = {agent.user: agent.weight / total_weight for agent in agents}
+
+	started = time.perf_counter()
+	picks = [state.pick() for _ in range(count)]
+	elapsed = time.perf_counter() - started
+
+	def deviation(sample):
+		counts = dict.fromkeys(expected, 0)
+		for user in sample:
+			counts[user] += 1
+		return max(abs(counts[user] / len(sample) - share) for user, share in expected.items())
+
+	windows = [picks[i : i + window] for i in range(0, count - window + 1, window)]
+	return {
+		"leads_per_second": round(count / elapsed),
+		"deviation": round(deviation(picks), 6),
+		"max_window_deviation": round(max(map(deviation, windows)), 6) if windows else None,
+	}
@@ -0,0 +1,307 @@
+"""
+Owner reassignment for leads and deals.
+
+A lead or deal is shared with its owner only and assigned to them. Doing that per document
+(`frappe.share.add` and `frappe.desk.form.assign_to.add`) costs a handful of queries and inserts
+for each share and assignment, and a notification per document. `apply_owners` works out, for a
+whole set of documents, which shares to drop and which shares, assignments and assignment
+comments to add, then applies them with one delete and one insert per table. Each new owner gets
+a single notification for all the documents they received.
+
+`reassign` is the endpoint to change the owner of many documents. Its ToDos are inserted directly,
+so Frappe's assignment email and notification log and other apps' ToDo hooks do not run for them;
+`notify_new_owners` sends the CRM notification instead. The lead and deal controllers share a
+single document through `sync_shares` but still assign it with `assign_to.add`.
+"""
+
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import get_fullname, now_datetime
+
+from crm.api.todo import notify_assigned_user
+from crm.utils import get_writable_names
+
+OWNER_FIELDS = {"CRM Lead": "lead_owner", "CRM Deal": "deal_owner"}
+BATCH_SIZE = 1000
+# Larger reassignments run in a background job
+INLINE_LIMIT = 1000
+
+DOCSHARE_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx",
+	"user",
+	"share_doctype",
+	"share_name",
+	"read",
+	"write",
+	"share",
+	"submit",
+	"everyone",
+	"notify_by_email",
+)
+TODO_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx",
+	"status",
+	"priority",
+	"allocated_to",
+	"description",
+	"reference_type",
+	"reference_name",
+	"assigned_by",
+)
+COMMENT_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx",
+	"comment_type",
+	"comment_email",
+	"comment_by",
+	"reference_doctype",
+	"reference_name",
+	"content",
+)
+
+
+@frappe.whitelist()
+def reassign(doctype: str, names: list | str, owner: str):
+	"""
+	Make `owner` the owner of leads or deals, sharing them with and assigning them to `owner`.
+
+	:param names: Names of the records, records the user cannot change are left out
+	:return: `{"reassigned": count}`, or the job id when the reassignment runs in the background
+	"""
+	if doctype not in OWNER_FIELDS:
+		frappe.throw(_("Reassignment is not supported for {0}").format(doctype))
+	frappe.has_permission(doctype, "write", throw=True)
+	if not frappe.db.exists("User", {"name": owner, "enabled": 1}):
+		frappe.throw(_("{0} is not an enabled user").format(owner))
+
+	names = frappe.parse_json(names) if isinstance(names, str) else names
+	if len(names) <= INLINE_LIMIT:
+		return reassign_records(doctype, names, owner)
+
+	job_id = f"crm_reassign::{frappe.generate_hash(length=10)}"
+	frappe.enqueue(
+		"crm.api.reassignment.reassign_records",
+		queue="long",
+		timeout=3600,
+		job_id=job_id,
+		doctype=doctype,
+		names=names,
+		owner=owner,
+		commit=True,
+		enqueue_after_commit=True,
+	)
+	return {"job_id": job_id}
+
+
+def reassign_records(doctype, names, owner, commit=False):
+	owner_field = OWNER_FIELDS[doctype]
+	reassigned = 0
+	for i in range(0, len(names), BATCH_SIZE):
+		batch = get_writable_names(doctype, names[i : i + BATCH_SIZE])
+		if not batch:
+			continue
+
+		frappe.db.sql(
+			f"""
+			update `tab{doctype}` set `{owner_field}` = %(owner)s, modified = %(now)s, modified_by = %(user)s
+			where name in %(names)s
+			""",
+			{"owner": owner, "now": now_datetime(), "user": frappe.session.user, "names": tuple(batch)},
+		)
+		apply_owners(doctype, dict.fromkeys(batch, owner))
+		reassigned += len(batch)
+		if commit:
+			frappe.db.commit()
+
+	return {"reassigned": reassigned}
+
+
+def apply_owners(doctype, owners: dict[str, str], notify=True) -> dict[str, str]:
+	"""
+	Share each document with its owner only and assign it to them, `owners` is `{name: owner}`.
+
+	:return: `{name: _assign}` of the documents that got a new assignment, the caller holding one
+		of them in memory should take the value over before saving it
+	"""
+	owners = {name: owner for name, owner in owners.items() if owner}
+	if not owners:
+		return {}
+
+	sync_shares(doctype, owners)
+	assigned, assign_values = add_assignments(doctype, owners)
+	if notify and assigned:
+		notify_new_owners(doctype, assigned)
+	return assign_values
+
+
+def sync_shares(doctype, owners):
+	"""Drop every share of the documents but the owner's, and add the owner's where missing."""
+	shares = frappe.get_all(
+		"DocShare",
+		filters={"share_doctype": doctype, "share_name": ("in", list(owners))},
+		fields=["name", "share_name", "user"],
+	)
+	stale = [share.name for share in shares if share.user != owners[share.share_name]]
+	if stale:
+		frappe.db.delete("DocShare", {"name": ("in", stale)})
+
+	shared = {(share.share_name, share.user) for share in shares}
+	now, user = now_datetime(), frappe.session.user
+	rows = [
+		(frappe.generate_hash(length=10), now, now, user, user, 0, 0, owner, doctype, name, 1, 1, 0, 0, 0, 0)
+		for name, owner in owners.items()
+		if (name, owner) not in shared
+	]
+	if rows:
+		frappe.db.bulk_insert("DocShare", DOCSHARE_FIELDS, rows)
+
+
+def add_assignments(doctype, owners):
+	"""
+	Assign the documents not assigned to their owner yet, as `assign_to.add` would.
+
+	:return: Tuple of (`{name: owner}` of the new assignments, `{name: _assign}` of their documents)
+	"""
+	todos = frappe.get_all(
+		"ToDo",
+		filters={
+			"reference_type": doctype,
+			"reference_name": ("in", list(owners)),
+			"status": ("!=", "Cancelled"),
+		},
+		fields=["reference_name", "allocated_to", "status"],
+	)
+	assignees, open_assignees = {}, {}
+	for todo in todos:
+		assignees.setdefault(todo.reference_name, set()).add(todo.allocated_to)
+		if todo.status == "Open":
+			open_assignees.setdefault(todo.reference_name, []).append(todo.allocated_to)
+
+	assigned = {name: owner for name, owner in owners.items() if owner not in assignees.get(name, ())}
+	if not assigned:
+		return {}, {}
+
+	now, user = now_datetime(), frappe.session.user
+	assigned_by = get_fullname(user)
+	todo_rows, comment_rows, assign_values = [], [], {}
+	for name, owner in assigned.items():
+		description = _("Assignment for {0} {1}").format(_(doctype), name)
+		todo_rows.append(
+			(
+				frappe.generate_hash(length=10),
+				now,
+				now,
+				user,
+				user,
+				0,
+				0,
+				"Open",
+				"Medium",
+				owner,
+				description,
+				doctype,
+				name,
+				user,
+			)
+		)
+
+		if owner == user:
+			content = _("{0} self assigned this task: {1}").format(assigned_by, description)
+		else:
+			content = _("{0} assigned {1}: {2}").format(assigned_by, get_fullname(owner), description)
+		comment_rows.append(
+			(
+				frappe.generate_hash(length=10),
+				now,
+				now,
+				user,
+				user,
+				0,
+				0,
+				"Assigned",
+				user,
+				assigned_by,
+				doctype,
+				name,
+				content,
+			)
+		)
+		assign_values[name] = json.dumps([*open_assignees.get(name, []), owner])
+
+	frappe.db.bulk_insert("ToDo", TODO_FIELDS, todo_rows)
+	frappe.db.bulk_insert("Comment", COMMENT_FIELDS, comment_rows)
+	update_assign(doctype, assign_values)
+	return assigned, assign_values
+
+
+def update_assign(doctype, assign_values):
+	"""Write the `_assign` lists the list views show, with one `UPDATE ... CASE`."""
+	params = {"names": tuple(assign_values)}
+	cases = []
+	for i, (name, value) in enumerate(assign_values.items()):
+		params[f"n{i}"], params[f"a{i}"] = name, value
+		cases.append(f"when %(n{i})s then %(a{i})s")
+
+	frappe.db.sql(
+		f"update `tab{doctype}` set _assign = case name {' '.join(cases)} end where name in %(names)s",
+		params,
+	)
+
+
+def notify_new_owners(doctype, assigned):
+	"""Notify each owner once: the usual notification for one document, a digest for more."""
+	by_owner = {}
+	for name, owner in assigned.items():
+		by_owner.setdefault(owner, []).append(name)
+
+	user = frappe.session.user
+	assigned_by = get_fullname(user)
+	label = _(doctype[4:].lower() + "s")
+	for owner, names in by_owner.items():
+		if owner == user:
+			continue
+		if len(names) == 1:
+			notify_assigned_user(
+				frappe._dict(reference_type=doctype, reference_name=names[0], allocated_to=owner)
+			)
+			continue
+
+		message = _("{0} assigned {1} {2} to you").format(assigned_by, len(names), label)
+		frappe.get_doc(
+			{
+				"doctype": "CRM Notification",
+				"from_user": user,
+				"to_user": owner,
+				"type": "Assignment",
+				"message": message,
+				"notification_text": f"""
+					<div class="mb-2 leading-5 text-ink-gray-5">
+						<span class="font-medium text-ink-gray-9">{assigned_by}</span>
+						<span>{_("assigned {0} {1} to you").format(len(names), label)}</span>
+					</div>
+				""",
+				"notification_type_doctype": doctype,
+				"notification_type_doc": names[0],
+				"reference_doctype": doctype,
+				"reference_name": names[0],
+			}
+		).insert(ignore_permissions=True)
@@ -1,9 +1,12 @@
 import json
+from collections import defaultdict
 
 import frappe
 from frappe import _
+from frappe.utils import cint
 
 from crm.api.doc import get_assigned_users
+from crm.fcrm.doctype.whatsapp_templates.whatsapp_templates import get_cached_templates
 from crm.fcrm.doctype.crm_notification.crm_notification import notify_user
 from crm.integrations.api import get_contact_lead_or_deal_from_number
 import crm.integrations.interakt.api as interakt_api
@@ -85,11 +88,43 @@ def is_whatsapp_installed():
 	return True
 
 
+MESSAGE_FIELDS = [
+	"name",
+	"direction",
+	"to",
+	"from",
+	"content_type",
+	"message_type",
+	"attach",
+	"template",
+	"use_template",
+	"message_id",
+	"is_reply",
+	"reply_to_message_id",
+	"creation",
+	"message",
+	"status",
+	"reference_doctype",
+	"reference_name",
+	"template_parameters",
+	"template_header_parameters",
+]
+
+
 @frappe.whitelist()
-def get_whatsapp_messages(reference_doctype, reference_name):
+def get_whatsapp_messages(reference_doctype, reference_name, limit=None, before=None):
+	"""
+	Messages of a lead or deal, a deal also shows the messages of its lead.
+
+	:param limit: Only return the latest `limit` messages
+	:param before: Only return messages created before this, pass the `creation` of the oldest
+		message loaded so far to page back through the conversation
+	"""
 	# Delegate to Interakt API if available
 	if frappe.db.exists("DocType", "CRM Interakt Settings") and interakt_api.is_enabled():
-		return interakt_api.get_whatsapp_messages(reference_doctype, reference_name)
+		return interakt_api.get_whatsapp_messages(
+			reference_doctype, reference_name, limit=limit, before=before
+		)
 
 	# twilio integration app is not compatible with crm app
 	# crm has its own twilio integration in built
@@ -97,137 +132,141 @@ def get_whatsapp_messages(reference_doctype, reference_name):
 		return []
 	if not frappe.db.exists("DocType", "CRM WhatsApp Message") and not frappe.db.exists("DocType", "WhatsApp Message"):
 		return []
-	messages = []
-	
+
 	doctype = "CRM WhatsApp Message" if frappe.db.exists("DocType", "CRM WhatsApp Message") else "WhatsApp Message"
 
+	references = [(reference_doctype, reference_name)]
 	if reference_doctype == "CRM Deal":
 		lead = frappe.db.get_value(reference_doctype, reference_name, "lead")
 		if lead:
-			messages = frappe.get_all(
-				doctype,
-				filters={
-					"reference_doctype": "CRM Lead",
-					"reference_name": lead,
-				},
-				fields=[
-					"name",
-					"direction",
-					"to",
-					"from",
-					"content_type",
-					"message_type",
-					"attach",
-					"template",
-					"use_template",
-					"message_id",
-					"is_reply",
-					"reply_to_message_id",
-					"creation",
-					"message",
-					"status",
-					"reference_doctype",
-					"reference_name",
-					"template_parameters",
-					"template_header_parameters",
-				],
-			)
+			references.append(("CRM Lead", lead))
+
+	limit = cint(limit)
+	messages = []
+	for doctype_, name in references:
+		filters = {"reference_doctype": doctype_, "reference_name": name}
+		if limit:
+			# reactions are fetched with the messages they react to
+			filters["content_type"] = ("!=", "reaction")
+		if before:
+			filters["creation"] = ("<", before)
+		messages += frappe.get_all(
+			doctype,
+			filters=filters,
+			fields=MESSAGE_FIELDS,
+			order_by="creation desc",
+			limit=limit or None,
+		)
+
+	messages.sort(key=lambda message: message.creation)
+	if limit:
+		messages = messages[-limit:]
+
+	return build_thread(doctype, messages, is_page=bool(limit or before))
+
+
+def build_thread(doctype, messages, is_page=False):
+	"""
+	Add templates, reactions, replies and sender names to the messages of a conversation.
+
+	Messages are indexed by `message_id`, so this is linear in the number of messages. When
+	`messages` is a page of the conversation, the reactions to it and the messages it replies to
+	may not be part of it and are fetched with one query each.
+	"""
+	by_id = {message.message_id: message for message in messages if message.message_id}
+
+	if is_page:
+		reactions = get_messages_by(doctype, "reply_to_message_id", list(by_id), content_type="reaction")
+		replied_ids = {
+			message.reply_to_message_id
+			for message in messages
+			if message.is_reply and message.reply_to_message_id not in by_id
+		}
+		replied = {
+			message.message_id: message for message in get_messages_by(doctype, "message_id", replied_ids)
+		}
+		replied.update(by_id)
+	else:
+		reactions = [message for message in messages if message.content_type == "reaction"]
+		messages = [message for message in messages if message.content_type != "reaction"]
+		replied = by_id
+
+	add_templates([message for message in replied.values() if message.message_type == "Template"])
+
+	# later reactions replace earlier ones
+	for reaction in sorted(reactions, key=lambda message: message.creation):
+		if reacted_message := replied.get(reaction.reply_to_message_id):
+			reacted_message["reaction"] = reaction.message
+
+	from_names = get_from_names((message.reference_doctype, message.reference_name) for message in messages)
+	for message in messages:
+		reference = (message.reference_doctype, message.reference_name)
+		message["from_name"] = from_names.get(reference, "") if message["from"] else _("You")
+
+	for reply_message in messages:
+		if not reply_message.is_reply:
+			continue
 
-	messages += frappe.get_all(
+		# Find the message that this message is replying to
+		replied_message = replied.get(reply_message.reply_to_message_id)
+		if not replied_message:
+			continue
+
+		message = replied_message["message"]
+		if replied_message["message_type"] == "Template":
+			message = replied_message["template"]
+		reply_message["reply_message"] = message
+		reply_message["header"] = replied_message.get("header") or ""
+		reply_message["footer"] = replied_message.get("footer") or ""
+		reply_message["reply_to"] = replied_message["name"]
+		reply_message["reply_to_type"] = replied_message["direction"]
+		reference = (reply_message.reference_doctype, reply_message.reference_name)
+		reply_message["reply_to_from"] = (
+			from_names.get(reference, "") if replied_message["from"] else _("You")
+		)
+
+	return messages
+
+
+def get_messages_by(doctype, field, values, **filters):
+	if not values:
+		return []
+	return frappe.get_all(
 		doctype,
-		filters={
-			"reference_doctype": reference_doctype,
-			"reference_name": reference_name,
-		},
-		fields=[
-			"name",
-			"direction",
-			"to",
-			"from",
-			"content_type",
-			"message_type",
-			"attach",
-			"template",
-			"use_template",
-			"message_id",
-			"is_reply",
-			"reply_to_message_id",
-			"creation",
-			"message",
-			"status",
-			"reference_doctype",
-			"reference_name",
-			"template_parameters",
-			"template_header_parameters",
-		],
+		filters={field: ("in", list(values)), **filters},
+		fields=MESSAGE_FIELDS,
+		order_by="creation asc",
 	)
 
-	# Filter messages to get only Template messages
-	template_messages = [message for message in messages if message["message_type"] == "Template"]
+
+def add_templates(template_messages):
+	"""Replace the template name of template messages with the rendered template."""
+	if not template_messages:
+		return
+
+	# Load every template used in the conversation at once
+	templates = get_cached_templates(message["template"] for message in template_messages)
 
 	# Iterate through template messages
 	for template_message in template_messages:
 		# Find the template that this message is using
-		template = frappe.get_doc("WhatsApp Templates", template_message["template"])
+		template = templates.get(template_message["template"])
 
 		# If the template is found, add the template details to the template message
 		if template:
 			template_message["template_name"] = template.template_name
+			body, header = template.template, template.header
 			if template_message["template_parameters"]:
 				parameters = json.loads(template_message["template_parameters"])
-				template.template = parse_template_parameters(template.template, parameters)
+				body = parse_template_parameters(body, parameters)
 
-			template_message["template"] = template.template
+			template_message["template"] = body
 			if template_message["template_header_parameters"]:
 				header_parameters = json.loads(template_message["template_header_parameters"])
-				template.header = parse_template_parameters(template.header, header_parameters)
-			template_message["header"] = template.header
+				header = parse_template_parameters(header, header_parameters)
+			template_message["header"] = header
 			template_message["footer"] = template.footer
 
-	# Filter messages to get only reaction messages
-	reaction_messages = [message for message in messages if message["content_type"] == "reaction"]
-
-	# Iterate through reaction messages
-	for reaction_message in reaction_messages:
-		# Find the message that this reaction is reacting to
-		reacted_message = next(
-			(m for m in messages if m["message_id"] == reaction_message["reply_to_message_id"]),
-			None,
-		)
-
-		# If the reacted message is found, add the reaction to it
-		if reacted_message:
-			reacted_message["reaction"] = reaction_message["message"]
-
-	for message in messages:
-		from_name = get_from_name(message) if message["from"] else _("You")
-		message["from_name"] = from_name
-	# Filter messages to get only replies
-	reply_messages = [message for message in messages if message["is_reply"]]
-
-	# Iterate through reply messages
-	for reply_message in reply_messages:
-		# Find the message that this message is replying to
-		replied_message = next(
-			(m for m in messages if m["message_id"] == reply_message["reply_to_message_id"]),
-			None,
-		)
-
-		# If the replied message is found, add the reply details to the reply message
-		from_name = get_from_name(reply_message) if replied_message["from"] else _("You")
-		if replied_message:
-			message = replied_message["message"]
-			if replied_message["message_type"] == "Template":
-				message = replied_message["template"]
-			reply_message["reply_message"] = message
-			reply_message["header"] = replied_message.get("header") or ""
-			reply_message["footer"] = replied_message.get("footer") or ""
-			reply_message["reply_to"] = replied_message["name"]
-			reply_message["reply_to_type"] = replied_message["direction"]
-			reply_message["reply_to_from"] = from_name
-
-	return [message for message in messages if message["content_type"] != "reaction"]
-
 
 @frappe.whitelist()
 def create_whatsapp_message(
@@ -322,17 +361,37 @@ def parse_template_parameters(string, parameters):
 	return string
 
 
-def get_from_name(message):
-	doc = frappe.get_doc(message["reference_doctype"], message["reference_name"])
-	from_name = ""
-	if message["reference_doctype"] == "CRM Deal":
-		if doc.get("contacts"):
-			for c in doc.get("contacts"):
-				if c.is_primary:
-					from_name = c.full_name or c.mobile_no
-					break
-		else:
-			from_name = doc.get("lead_name")
-	else:
-		from_name = " ".join(filter(None, [doc.get("first_name"), doc.get("last_name")]))
-	return from_name
+def get_from_names(references):
+	"""
+	Sender names of incoming messages by `(reference_doctype, reference_name)`: the primary
+	contact of a deal (its lead name if it has no contacts), else the first and last name.
+	"""
+	by_doctype = defaultdict(set)
+	for doctype, name in references:
+		if doctype and name:
+			by_doctype[doctype].add(name)
+
+	from_names = {}
+	for doctype, names in by_doctype.items():
+		names = list(names)
+		if doctype == "CRM Deal":
+			contacts = frappe.get_all(
+				"CRM Contacts",
+				filters={"parenttype": doctype, "parentfield": "contacts", "parent": ("in", names)},
+				fields=["parent", "is_primary", "full_name", "mobile_no"],
+			)
+			has_contacts = {contact.parent for contact in contacts}
+			deals = frappe.get_all(doctype, filters={"name": ("in", names)}, fields=["name", "lead_name"])
+			for deal in deals:
+				from_names[(doctype, deal.name)] = "" if deal.name in has_contacts else deal.lead_name
+			for contact in contacts:
+				if contact.is_primary:
+					from_names[(doctype, contact.parent)] = contact.full_name or contact.mobile_no
+			continue
+
+		meta = frappe.get_meta(doctype)
+		fields = [field for field in ("first_name", "last_name") if meta.has_field(field)]
+		for doc in frappe.get_all(doctype, filters={"name": ("in", names)}, fields=["name", *fields]):
+			from_names[(doctype, doc.name)] = " ".join(filter(None, [doc.get(field) for field in fields]))
+
+	return from_names
@@ -0,0 +1,30 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("crm-missing-link-indexes")
+@click.argument("doctypes", nargs=-1)
+@pass_context
+def missing_link_indexes(context, doctypes):
+	"""Report link columns pointing at DOCTYPES (by default the CRM doctypes) that have no index."""
+	from crm.utils.link_graph import get_missing_indexes
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		missing = get_missing_indexes(list(doctypes) or None)
+	finally:
+		frappe.destroy()
+
+	for field in missing:
+		columns = [field["options"], field["fieldname"]] if field["options"] else [field["fieldname"]]
+		click.echo(
+			f"{field['doctype']}.{field['fieldname']} -> {', '.join(field['targets'])}: "
+			f'frappe.db.add_index("{field["doctype"]}", {columns})'
+		)
+	if not missing:
+		click.echo("All link columns are indexed")
+
+
+commands = [missing_link_indexes]
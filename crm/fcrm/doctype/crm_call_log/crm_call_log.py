@@ -5,6 +5,7 @@ import frappe
 from frappe.model.document import Document
 
 from crm.integrations.api import get_contact_by_phone_number
+from crm.integrations.call_recordings import get_recording_url
 from crm.utils import seconds_to_duration
 
 
@@ -74,6 +75,7 @@ class CRMCallLog(Document):
 			"to",
 			"note",
 			"recording_url",
+			"recording_file",
 			"reference_doctype",
 			"reference_docname",
 			"creation",
@@ -99,6 +101,8 @@ def parse_call_log(call):
 	try:
 		call["show_recording"] = False
 		call["_duration"] = seconds_to_duration(call.get("duration"))
+		if call.get("recording_file"):
+			call["recording_url"] = get_recording_url(call.get("name"))
 		if call.get("type") == "Incoming":
 			call["activity_type"] = "incoming_call"
 			contact = get_contact_by_phone_number(call.get("from"))
@@ -168,6 +172,7 @@ def get_call_log(name):
 				"to",
 				"note",
 				"recording_url",
+				"recording_file",
 				"reference_doctype",
 				"reference_docname",
 				"creation",
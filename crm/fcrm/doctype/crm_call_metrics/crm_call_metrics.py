@@ -0,0 +1,147 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_to_date, get_datetime, now_datetime
+
+# Last `modified` of CRM Call Log covered by the rollup
+WATERMARK_KEY = "crm_call_metrics_rolled_up_to"
+# Re-read call logs modified slightly before the watermark, their transaction may have
+# committed after the previous run
+WATERMARK_OVERLAP_MINUTES = 5
+HOURS_PER_BATCH = 200
+
+CALL_COLUMNS = (
+	"c.start_time, c.creation, c.type, c.caller, c.receiver, c.telephony_medium, c.`from`, c.`to`, "
+	"c.status, c.duration"
+)
+
+UNANSWERED_STATUSES = ("No Answer", "Busy", "Failed", "Canceled")
+
+# Hour bucket of a call log. Calls are counted in the hour they started, or were logged when
+# the start is unknown.
+PERIOD_SQL = "date_format(coalesce(c.start_time, c.creation), '%%Y-%%m-%%d %%H:00:00')"
+
+
+class CRMCallMetrics(Document):
+	pass
+
+
+def rollup_call_metrics():
+	"""
+	Hourly job: recompute the metrics of every hour that has call logs modified since the last run.
+
+	Each touched hour is rebuilt from scratch, so late events (a call completing after the hour
+	was rolled up) and re-runs are handled without keeping counters in sync.
+	"""
+	started_at = now_datetime()
+	watermark = frappe.db.get_global(WATERMARK_KEY)
+
+	conditions, params = "", {}
+	if watermark:
+		conditions = "where c.modified >= %(since)s"
+		params["since"] = add_to_date(get_datetime(watermark), minutes=-WATERMARK_OVERLAP_MINUTES)
+
+	hours = frappe.db.sql_list(
+		f"select distinct {PERIOD_SQL} from `tabCRM Call Log` c {conditions}",
+		params,
+	)
+
+	for i in range(0, len(hours), HOURS_PER_BATCH):
+		rebuild_call_metrics(hours[i : i + HOURS_PER_BATCH])
+		frappe.db.commit()
+
+	frappe.db.set_global(WATERMARK_KEY, str(started_at))
+	frappe.db.commit()
+
+
+def rebuild_call_metrics(hours):
+	"""
+	Replace the metrics of the given hours (`YYYY-MM-DD HH:00:00`) with fresh totals from CRM Call Log.
+
+	One row per hour, agent, type, telephony medium and DID. The agent is the receiver of
+	incoming calls and the caller of outgoing calls; the DID is the number dialled for incoming
+	calls and the number dialled from for outgoing calls. The team and department are those of
+	the agent when the hour is rolled up.
+	"""
+	if not hours:
+		return
+
+	now = now_datetime()
+	params = {
+		"hours": tuple(hours),
+		"now": now,
+		"user": frappe.session.user,
+		"unanswered": UNANSWERED_STATUSES,
+	}
+	# plain ranges on the columns rather than `PERIOD_SQL`, so the indexes are used instead of
+	# scanning every call log; calls without a start time fall back to their creation
+	ranges = get_hour_ranges(hours)
+	start_time_condition = get_range_condition("c.start_time", ranges, params)
+	creation_condition = get_range_condition("c.creation", ranges, params)
+
+	frappe.db.sql("delete from `tabCRM Call Metrics` where period_start in %(hours)s", params)
+	frappe.db.sql(
+		f"""
+		insert into `tabCRM Call Metrics` (
+			name, creation, modified, owner, modified_by, docstatus, idx,
+			period_start, agent, team, department, telephony_medium, did, type,
+			total_calls, answered_calls, missed_calls, talk_time
+		)
+		select
+			md5(concat_ws('|', m.period_start, m.agent, m.telephony_medium, m.did, m.type)),
+			%(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+			m.period_start,
+			nullif(m.agent, ''),
+			tm.team,
+			t.department,
+			m.telephony_medium,
+			m.did,
+			m.type,
+			m.total_calls, m.answered_calls, m.missed_calls, m.talk_time
+		from (
+			select
+				{PERIOD_SQL} as period_start,
+				ifnull(if(c.type = 'Outgoing', c.caller, c.receiver), '') as agent,
+				ifnull(c.telephony_medium, '') as telephony_medium,
+				ifnull(if(c.type = 'Outgoing', c.`from`, c.`to`), '') as did,
+				ifnull(c.type, '') as type,
+				count(*) as total_calls,
+				sum(c.status = 'Completed') as answered_calls,
+				sum(c.type = 'Incoming' and c.status in %(unanswered)s) as missed_calls,
+				sum(if(c.status = 'Completed', ifnull(c.duration, 0), 0)) as talk_time
+			from (
+				select {CALL_COLUMNS} from `tabCRM Call Log` c where {start_time_condition}
+				union all
+				select {CALL_COLUMNS} from `tabCRM Call Log` c
+				where c.start_time is null and ({creation_condition})
+			) c
+			group by 1, 2, 3, 4, 5
+		) m
+		left join (
+			select user, min(team) as team from `tabCRM Team Member` group by user
+		) tm on tm.user = m.agent
+		left join `tabCRM Team` t on t.name = tm.team
+		""",
+		params,
+	)
+
+
+def get_hour_ranges(hours):
+	"""Merge hour buckets (`YYYY-MM-DD HH:00:00`) into `[start, end)` ranges of consecutive hours."""
+	ranges = []
+	for hour in sorted({get_datetime(hour) for hour in hours}):
+		if ranges and ranges[-1][1] == hour:
+			ranges[-1][1] = add_to_date(hour, hours=1)
+		else:
+			ranges.append([hour, add_to_date(hour, hours=1)])
+	return ranges
+
+
+def get_range_condition(column, ranges, params):
+	conditions = []
+	for i, (start, end) in enumerate(ranges):
+		params[f"from_{i}"], params[f"to_{i}"] = start, end
+		conditions.append(f"({column} >= %(from_{i})s and {column} < %(to_{i})s)")
+	return " or ".join(conditions)
@@ -0,0 +1,53 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.api.dashboard import get_call_metrics
+from crm.fcrm.doctype.crm_call_metrics.crm_call_metrics import rebuild_call_metrics
+
+HOUR = "2025-01-17 16:00:00"
+
+
+def make_call_log(call_id, status, type="Incoming", duration=0, **kwargs):
+	doc = frappe.new_doc("CRM Call Log")
+	doc.update(
+		{
+			"id": call_id,
+			"status": status,
+			"type": type,
+			"duration": duration,
+			"telephony_medium": "Exotel",
+			"from": "9123456789",
+			"to": "8047091234",
+			"receiver": "Administrator",
+			"start_time": "2025-01-17 16:20:00",
+			**kwargs,
+		}
+	)
+	return doc.insert(ignore_permissions=True)
+
+
+class IntegrationTestCRMCallMetrics(IntegrationTestCase):
+	def test_rollup_sums_calls_of_the_hour(self):
+		make_call_log("metrics-1", "Completed", duration=60)
+		make_call_log("metrics-2", "Completed", duration=120)
+		make_call_log("metrics-3", "No Answer")
+		make_call_log("metrics-4", "Completed", duration=30, start_time="2025-01-17 17:05:00")
+
+		rebuild_call_metrics([HOUR])
+		# rebuilding an hour replaces its rows
+		rebuild_call_metrics([HOUR])
+
+		rows = frappe.get_all("CRM Call Metrics", filters={"period_start": HOUR}, fields=["*"])
+		self.assertEqual(len(rows), 1)
+		self.assertEqual(rows[0].agent, "Administrator")
+		self.assertEqual(rows[0].did, "8047091234")
+		self.assertEqual((rows[0].total_calls, rows[0].answered_calls, rows[0].missed_calls), (3, 2, 1))
+		self.assertEqual(rows[0].talk_time, 180)
+
+		(summary,) = get_call_metrics("2025-01-17", "2025-01-17", "Administrator")
+		self.assertEqual(summary.total_calls, 3)
+		self.assertAlmostEqual(summary.answer_rate, 200 / 3)
+		self.assertEqual(summary.average_handle_time, 90)
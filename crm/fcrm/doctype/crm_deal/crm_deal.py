@@ -6,8 +6,12 @@ from frappe import _
 from frappe.desk.form.assign_to import add as assign
 from frappe.model.document import Document
 
-from crm.fcrm.doctype.crm_service_level_agreement.utils import get_sla
-from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import add_status_change_log
+from crm.api.reassignment import sync_shares
+from crm.fcrm.doctype.crm_service_level_agreement.utils import get_cached_sla, get_sla
+from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import (
+	add_status_change_log,
+	log_status_change,
+)
 from crm.fcrm.doctype.fcrm_settings.fcrm_settings import get_exchange_rate
 
 
@@ -85,8 +89,9 @@ class CRMDeal(Document):
 		if not self.is_new() and self.has_value_changed("deal_owner") and self.deal_owner:
 			self.share_with_agent(self.deal_owner)
 			self.assign_agent(self.deal_owner)
-		if self.has_value_changed("status"):
+		if self.is_new():
 			add_status_change_log(self)
+		if self.has_value_changed("status"):
 			if frappe.db.get_value("CRM Deal Status", self.status, "type") == "Won":
 				self.closed_date = frappe.utils.nowdate()
 		self.validate_forecasting_fields()
@@ -97,6 +102,9 @@ class CRMDeal(Document):
 		if self.deal_owner:
 			self.assign_agent(self.deal_owner)
 
+	def on_update(self):
+		log_status_change(self)
+
 	def before_save(self):
 		self.apply_sla()
 
@@ -148,34 +156,15 @@ class CRMDeal(Document):
 					# the agent is already set as an assignee
 					return
 
+		# one document goes through `assign_to.add`, for Frappe's assignment email, notification log
+		# and ToDo hooks; `crm.api.reassignment` is for sets of documents
 		assign({"assign_to": [agent], "doctype": "CRM Deal", "name": self.name}, ignore_permissions=True)
 
 	def share_with_agent(self, agent):
 		if not agent:
 			return
 
-		docshares = frappe.get_all(
-			"DocShare",
-			filters={"share_name": self.name, "share_doctype": self.doctype},
-			fields=["name", "user"],
-		)
-
-		shared_with = [d.user for d in docshares] + [agent]
-
-		for user in shared_with:
-			if user == agent and not frappe.db.exists(
-				"DocShare",
-				{"user": agent, "share_name": self.name, "share_doctype": self.doctype},
-			):
-				frappe.share.add_docshare(
-					self.doctype,
-					self.name,
-					agent,
-					write=1,
-					flags={"ignore_share_permission": True},
-				)
-			elif user != agent:
-				frappe.share.remove(self.doctype, self.name, user)
+		sync_shares(self.doctype, {self.name: agent})
 
 	def set_sla(self):
 		"""
@@ -197,7 +186,7 @@ class CRMDeal(Document):
 		"""
 		if not self.sla:
 			return
-		sla = frappe.get_last_doc("CRM Service Level Agreement", {"name": self.sla})
+		sla = get_cached_sla(self.doctype, self.sla)
 		if sla:
 			sla.apply(self)
 
@@ -450,3 +439,8 @@ def create_deal(args):
 
 	deal.insert(ignore_permissions=True)
 	return deal.name
+
+
+def on_doctype_update():
+	# pending SLA deadlines by due time, see `sla_monitor.sweep_sla_breaches`
+	frappe.db.add_index("CRM Deal", ["sla_status", "response_by"])
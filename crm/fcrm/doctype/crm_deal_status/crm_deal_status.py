@@ -4,6 +4,15 @@
 # import frappe
 from frappe.model.document import Document
 
+from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import clear_status_types_cache
+
 
 class CRMDealStatus(Document):
-	pass
+	def on_update(self):
+		clear_status_types_cache()
+
+	def on_trash(self):
+		clear_status_types_cache()
+
+	def after_rename(self, old, new, merge=False):
+		clear_status_types_cache()
@@ -2,10 +2,11 @@
 # For license information, please see license.txt
 
 import frappe
-import requests
 from frappe import _
 from frappe.model.document import Document
 
+from crm.integrations import http_client
+
 
 class CRMExotelSettings(Document):
 	def validate(self):
@@ -13,10 +14,12 @@ class CRMExotelSettings(Document):
 
 	def verify_credentials(self):
 		if self.enabled:
-			response = requests.get(
+			response = http_client.get(
+				"Exotel",
 				"https://{subdomain}/v1/Accounts/{sid}".format(
 					subdomain=self.subdomain, sid=self.account_sid
 				),
+				endpoint="account",
 				auth=(self.api_key, self.get_password("api_token")),
 			)
 			if response.status_code != 200:
@@ -8,6 +8,8 @@ from frappe import _, throw
 from frappe.model.document import Document
 from frappe.utils import cint, formatdate, getdate, today
 
+from crm.fcrm.doctype.crm_service_level_agreement.utils import clear_sla_cache
+
 
 class CRMHolidayList(Document):
 	# begin: auto-generated types
@@ -34,6 +36,12 @@ class CRMHolidayList(Document):
 		self.validate_days()
 		self.total_holidays = len(self.holidays)
 
+	def on_update(self):
+		clear_sla_cache()
+
+	def on_trash(self):
+		clear_sla_cache()
+
 	@frappe.whitelist()
 	def get_weekly_off_dates(self):
 		self.validate_values()
@@ -7,9 +7,11 @@ from frappe.desk.form.assign_to import add as assign
 from frappe.model.document import Document
 from frappe.utils import has_gravatar, validate_email_address
 
-from crm.fcrm.doctype.crm_service_level_agreement.utils import get_sla
+from crm.api.reassignment import sync_shares
+from crm.fcrm.doctype.crm_service_level_agreement.utils import get_cached_sla, get_sla
 from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import (
 	add_status_change_log,
+	log_status_change,
 )
 
 
@@ -79,13 +81,16 @@ class CRMLead(Document):
 		if not self.is_new() and self.has_value_changed("lead_owner") and self.lead_owner:
 			self.share_with_agent(self.lead_owner)
 			self.assign_agent(self.lead_owner)
-		if self.has_value_changed("status"):
+		if self.is_new():
 			add_status_change_log(self)
 
 	def after_insert(self):
 		if self.lead_owner:
 			self.assign_agent(self.lead_owner)
 
+	def on_update(self):
+		log_status_change(self)
+
 	def before_save(self):
 		self.apply_sla()
 
@@ -140,34 +145,15 @@ class CRMLead(Document):
 					# the agent is already set as an assignee
 					return
 
+		# one document goes through `assign_to.add`, for Frappe's assignment email, notification log
+		# and ToDo hooks; `crm.api.reassignment` is for sets of documents
 		assign({"assign_to": [agent], "doctype": "CRM Lead", "name": self.name})
 
 	def share_with_agent(self, agent):
 		if not agent:
 			return
 
-		docshares = frappe.get_all(
-			"DocShare",
-			filters={"share_name": self.name, "share_doctype": self.doctype},
-			fields=["name", "user"],
-		)
-
-		shared_with = [d.user for d in docshares] + [agent]
-
-		for user in shared_with:
-			if user == agent and not frappe.db.exists(
-				"DocShare",
-				{"user": agent, "share_name": self.name, "share_doctype": self.doctype},
-			):
-				frappe.share.add_docshare(
-					self.doctype,
-					self.name,
-					agent,
-					write=1,
-					flags={"ignore_share_permission": True},
-				)
-			elif user != agent:
-				frappe.share.remove(self.doctype, self.name, user)
+		sync_shares(self.doctype, {self.name: agent})
 
 	def create_contact(self, existing_contact=None, throw=True):
 		if not self.lead_name:
@@ -368,7 +354,7 @@ class CRMLead(Document):
 		"""
 		if not self.sla:
 			return
-		sla = frappe.get_last_doc("CRM Service Level Agreement", {"name": self.sla})
+		sla = get_cached_sla(self.doctype, self.sla)
 		if sla:
 			sla.apply(self)
 
@@ -471,3 +457,10 @@ def convert_to_deal(lead, doc=None, deal=None, existing_contact=None, existing_o
 	organization = lead.create_organization(existing_organization)
 	_deal = lead.create_deal(contact, organization, deal)
 	return _deal
+
+
+def on_doctype_update():
+	# pending SLA deadlines by due time, see `sla_monitor.sweep_sla_breaches`
+	frappe.db.add_index("CRM Lead", ["sla_status", "response_by"])
+	# open leads per owner, see `lead_distribution.load_team_state`
+	frappe.db.add_index("CRM Lead", ["lead_owner", "converted"])
@@ -0,0 +1,13 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class CRMMessageOutbox(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("CRM Message Outbox", ["status", "next_attempt_at"])
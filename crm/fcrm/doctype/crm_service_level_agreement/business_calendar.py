@@ -0,0 +1,71 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+from datetime import date, datetime, timedelta
+
+from frappe.utils import get_weekdays, getdate, to_timedelta
+
+
+class BusinessCalendar:
+	"""
+	Working time of an SLA: one working interval per weekday, none on holidays.
+
+	Both operations walk the calendar a day at a time and do interval arithmetic on each day, so
+	their cost grows with the number of days spanned rather than the number of seconds.
+	"""
+
+	def __init__(self, working_hours: dict[str, tuple], holidays=()):
+		"""
+		:param working_hours: `{weekday name: (start time, end time)}`, times as `timedelta` or `HH:MM:SS`
+		:param holidays: Dates without working time
+		"""
+		weekdays = get_weekdays()
+		self.intervals = [None] * 7
+		for workday, (start_time, end_time) in working_hours.items():
+			start, end = to_timedelta(start_time), to_timedelta(end_time)
+			if workday in weekdays and start < end:
+				self.intervals[weekdays.index(workday)] = (start, end)
+		self.holidays = {getdate(holiday) for holiday in holidays}
+
+	def get_working_interval(self, day: date) -> tuple[datetime, datetime] | None:
+		"""Start and end of the working time on `day`, None on days off."""
+		interval = self.intervals[day.weekday()]
+		if not interval or day in self.holidays:
+			return None
+
+		midnight = datetime.combine(day, datetime.min.time())
+		return midnight + interval[0], midnight + interval[1]
+
+	def add_working_seconds(self, start: datetime, seconds: float) -> datetime | None:
+		"""
+		Moment at which `seconds` of working time have passed since `start`.
+
+		Returns `start` for no seconds, and None if the calendar has no working time at all.
+		"""
+		if seconds <= 0:
+			return start
+		if not any(self.intervals):
+			return None
+
+		remaining = timedelta(seconds=seconds)
+		day = start.date()
+		while True:
+			if interval := self.get_working_interval(day):
+				begin, end = max(interval[0], start), interval[1]
+				if begin < end:
+					if remaining <= end - begin:
+						return begin + remaining
+					remaining -= end - begin
+			day += timedelta(days=1)
+
+	def working_seconds_between(self, start: datetime, end: datetime) -> float:
+		"""Seconds of working time from `start` to `end`."""
+		total = timedelta()
+		day = start.date()
+		while day <= end.date():
+			if interval := self.get_working_interval(day):
+				begin, finish = max(interval[0], start), min(interval[1], end)
+				if begin < finish:
+					total += finish - begin
+			day += timedelta(days=1)
+		return total.total_seconds()
@@ -0,0 +1,193 @@
+"""
+SLA breach monitor.
+
+`sla_status` is worked out when a lead or deal is saved, so a record nobody touches after its
+response deadline stays "First Response Due" for good. `sweep_sla_breaches` runs from the
+scheduler and finds overdue records through the (`sla_status`, `response_by`) index of each
+doctype, which serves as the queue of pending deadlines ordered by due time. A batch of
+breaches is marked Failed with one update, its owners get their notifications in one insert,
+and the daily counters behind `get_sla_breach_rate` are bumped.
+
+Documents are never loaded. The breach rule is the one `CRMServiceLevelAgreement` applies on
+save: a first response is breached once `response_by` passes without `first_responded_on`. A
+rolling response is breached once `response_by` passes: it is counted from `last_responded_on`,
+which is always set by then, and a new response moves it on.
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, getdate, now_datetime
+
+# Doctypes under SLA, with the field holding the user notified of a breach
+SLA_DOCTYPES = {"CRM Lead": "lead_owner", "CRM Deal": "deal_owner"}
+DUE_STATUSES = ("First Response Due", "Rolling Response Due")
+
+BATCH_SIZE = 500
+MAX_BATCHES = 20
+SWEPT_UNTIL_KEY = "crm:sla_monitor:swept_until"
+METRICS_TTL = 90 * 24 * 60 * 60
+
+NOTIFICATION_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx",
+	"type",
+	"from_user",
+	"to_user",
+	"notification_text",
+	"notification_type_doctype",
+	"notification_type_doc",
+	"reference_doctype",
+	"reference_name",
+)
+
+
+def sweep_sla_breaches():
+	"""Scheduled job: mark overdue leads and deals Failed, notify their owners and count breaches."""
+	now = now_datetime()
+	swept_until = frappe.cache.get_value(SWEPT_UNTIL_KEY) or now
+
+	for doctype, owner_field in SLA_DOCTYPES.items():
+		due = count_came_due(doctype, swept_until, now)
+		breached = 0
+		for _batch in range(MAX_BATCHES):
+			records = get_breached_records(doctype, owner_field, now)
+			if not records:
+				break
+
+			mark_failed(doctype, records)
+			notify_owners(doctype, records, now)
+			frappe.db.commit()
+			breached += len(records)
+
+		record_sla_metrics(doctype, getdate(now), due, breached)
+
+	frappe.cache.set_value(SWEPT_UNTIL_KEY, now)
+
+
+def count_came_due(doctype, since, until):
+	"""Records whose response deadline fell in the period, breached or not."""
+	return frappe.db.sql(
+		f"""
+		select count(*) from `tab{doctype}`
+		where response_by > %s and response_by <= %s
+		""",
+		(since, until),
+	)[0][0]
+
+
+def get_breached_records(doctype, owner_field, now):
+	return frappe.db.sql(
+		f"""
+		select name, `{owner_field}` as owner from `tab{doctype}`
+		where sla_status in %(due_statuses)s and response_by < %(now)s
+			and (sla_status = 'Rolling Response Due' or first_responded_on is null)
+		order by response_by
+		limit %(limit)s
+		""",
+		{"due_statuses": DUE_STATUSES, "now": now, "limit": BATCH_SIZE},
+		as_dict=True,
+	)
+
+
+def mark_failed(doctype, records):
+	frappe.db.sql(
+		f"""
+		update `tab{doctype}` set sla_status = 'Failed'
+		where name in %(names)s and sla_status in %(due_statuses)s
+		""",
+		{"names": tuple(record.name for record in records), "due_statuses": DUE_STATUSES},
+	)
+
+
+def notify_owners(doctype, records, now):
+	"""Insert the breach notifications of a batch at once, and ping every owner once."""
+	label = _(doctype[4:].lower() if doctype.startswith("CRM ") else doctype)
+	rows = []
+	for record in records:
+		if not record.owner:
+			continue
+
+		notification_text = f"""
+			<div class="mb-2 leading-5 text-ink-gray-5">
+				<span>{_("Response time missed on {0}").format(label)}</span>
+				<span class="font-medium text-ink-gray-9">{record.name}</span>
+			</div>
+		"""
+		rows.append(
+			(
+				frappe.generate_hash(length=10),
+				now,
+				now,
+				"Administrator",
+				"Administrator",
+				0,
+				0,
+				"SLA",
+				"Administrator",
+				record.owner,
+				notification_text,
+				doctype,
+				record.name,
+				doctype,
+				record.name,
+			)
+		)
+
+	if not rows:
+		return
+
+	frappe.db.bulk_insert("CRM Notification", NOTIFICATION_FIELDS, rows)
+	for user in {row[9] for row in rows}:
+		frappe.publish_realtime("crm_notification", user=user, after_commit=True)
+
+
+def _metrics_key(day):
+	return frappe.cache.make_key(f"crm:sla_metrics:{day}")
+
+
+def record_sla_metrics(doctype, day, due, breached):
+	"""Add a sweep's counts to the day's counters; metrics never fail the sweep."""
+	try:
+		key = _metrics_key(day)
+		pipe = frappe.cache.pipeline()
+		pipe.hincrby(key, f"{doctype}:due", due)
+		pipe.hincrby(key, f"{doctype}:breached", breached)
+		pipe.expire(key, METRICS_TTL)
+		pipe.execute()
+	except Exception:
+		frappe.log_error(title="SLA metrics could not be recorded")
+
+
+@frappe.whitelist()
+def get_sla_breach_rate(days: int = 7):
+	"""Deadlines that came due, deadlines breached and breach rate per day and doctype."""
+	frappe.only_for(["System Manager", "Sales Manager"])
+
+	today = getdate()
+	dates = [add_days(today, -offset) for offset in range(int(days))]
+	# read through the raw client like the counters are written: the `frappe.cache` helpers would
+	# prefix the keys a second time and unpickle the plain numbers
+	pipe = frappe.cache.pipeline()
+	for day in dates:
+		pipe.hgetall(_metrics_key(day))
+
+	metrics = []
+	for day, raw in zip(dates, pipe.execute(), strict=True):
+		values = {frappe.safe_decode(k): int(v) for k, v in raw.items()}
+		for doctype in SLA_DOCTYPES:
+			due, breached = values.get(f"{doctype}:due", 0), values.get(f"{doctype}:breached", 0)
+			metrics.append(
+				{
+					"date": day,
+					"doctype": doctype,
+					"due": due,
+					"breached": breached,
+					"breach_rate": breached / due if due else 0,
+				}
+			)
+	return metrics
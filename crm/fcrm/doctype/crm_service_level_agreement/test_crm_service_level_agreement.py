@@ -1,9 +1,171 @@
 # Copyright (c) 2023, Frappe Technologies Pvt. Ltd. and Contributors
 # See license.txt
 
-# import frappe
-from frappe.tests import UnitTestCase
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
 
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+from frappe.utils import get_weekdays
+from hypothesis import given, settings
+from hypothesis import strategies as st
 
-class TestCRMServiceLevelAgreement(UnitTestCase):
-	pass
+from crm.fcrm.doctype.crm_service_level_agreement import utils
+from crm.fcrm.doctype.crm_service_level_agreement.business_calendar import BusinessCalendar
+from crm.fcrm.doctype.crm_service_level_agreement.utils import (
+	_bump_sla_version,
+	get_cached_slas,
+	get_sla,
+)
+
+WINDOW_START = datetime(2026, 1, 1)
+WINDOW_DAYS = 21
+
+
+@st.composite
+def calendars(draw):
+	"""Working hours on minute boundaries for some weekdays, and holidays within the window."""
+	working_hours = {}
+	for workday in draw(st.sets(st.sampled_from(get_weekdays()), min_size=1)):
+		start = draw(st.integers(0, 24 * 60 - 1))
+		end = draw(st.integers(start + 1, 24 * 60))
+		working_hours[workday] = (timedelta(minutes=start), timedelta(minutes=end))
+
+	days = st.integers(0, WINDOW_DAYS - 1).map(lambda i: WINDOW_START.date() + timedelta(days=i))
+	holidays = draw(st.sets(days))
+	return working_hours, holidays
+
+
+moments = st.integers(0, WINDOW_DAYS * 24 * 60).map(lambda minutes: WINDOW_START + timedelta(minutes=minutes))
+
+
+def is_working_minute(working_hours, holidays, moment):
+	"""The check the former `calc_elapsed_time` made for every step of its walk, holidays included."""
+	start_time, end_time = working_hours.get(get_weekdays()[moment.weekday()], (timedelta(), timedelta()))
+	minute = timedelta(hours=moment.hour, minutes=moment.minute)
+	return moment.date() not in holidays and start_time <= minute < end_time
+
+
+def walk_elapsed(working_hours, holidays, start, end):
+	"""Working seconds counted by walking from start to end, one minute a step."""
+	total, current = 0, start
+	while current < end:
+		if is_working_minute(working_hours, holidays, current):
+			total += 60
+		current += timedelta(minutes=1)
+	return total
+
+
+def walk_add(working_hours, holidays, start, minutes):
+	"""Moment reached by walking from start until `minutes` working minutes passed."""
+	current = start
+	while minutes:
+		if is_working_minute(working_hours, holidays, current):
+			minutes -= 1
+		current += timedelta(minutes=1)
+	return current
+
+
+class TestBusinessCalendar(UnitTestCase):
+	def setUp(self):
+		nine_to_six = (timedelta(hours=9), timedelta(hours=18))
+		self.calendar = BusinessCalendar(
+			{day: nine_to_six for day in get_weekdays()[:5]}, holidays=[date(2026, 1, 26)]
+		)
+
+	def test_deadline_skips_weekend_and_holiday(self):
+		# Friday 17:00 plus two working hours, Monday 26th is a holiday
+		deadline = self.calendar.add_working_seconds(datetime(2026, 1, 23, 17), 2 * 60 * 60)
+		self.assertEqual(deadline, datetime(2026, 1, 27, 10))
+
+	def test_deadline_from_a_day_off_starts_at_opening(self):
+		deadline = self.calendar.add_working_seconds(datetime(2026, 1, 17, 15), 60 * 60)
+		self.assertEqual(deadline, datetime(2026, 1, 19, 10))
+
+	def test_no_working_hours(self):
+		calendar = BusinessCalendar({})
+		self.assertIsNone(calendar.add_working_seconds(WINDOW_START, 60))
+		self.assertEqual(calendar.working_seconds_between(WINDOW_START, WINDOW_START + timedelta(days=7)), 0)
+
+	@settings(max_examples=200, deadline=None)
+	@given(calendars(), moments, moments)
+	def test_elapsed_matches_walk(self, calendar, start, end):
+		working_hours, holidays = calendar
+		self.assertEqual(
+			BusinessCalendar(working_hours, holidays).working_seconds_between(start, end),
+			walk_elapsed(working_hours, holidays, start, end),
+		)
+
+	@settings(max_examples=200, deadline=None)
+	@given(calendars(), moments, st.data())
+	def test_add_matches_walk(self, calendar, start, data):
+		working_hours, holidays = calendar
+		# up to two weeks of working time, so the walk stays short
+		weekly_minutes = sum((end - opens).total_seconds() // 60 for opens, end in working_hours.values())
+		minutes = data.draw(st.integers(0, int(2 * weekly_minutes)))
+		business_calendar = BusinessCalendar(working_hours, holidays)
+		deadline = business_calendar.add_working_seconds(start, minutes * 60)
+
+		self.assertEqual(deadline, walk_add(working_hours, holidays, start, minutes))
+		self.assertEqual(business_calendar.working_seconds_between(start, deadline), minutes * 60)
+
+
+class IntegrationTestSLARegistry(IntegrationTestCase):
+	def setUp(self):
+		self.tag = frappe.generate_hash(length=8)
+		self.priority = frappe.db.get_value("CRM Communication Status", {}, "name")
+		self.sla = frappe.get_doc(
+			{
+				"doctype": "CRM Service Level Agreement",
+				"sla_name": f"SLA {self.tag}",
+				"enabled": 1,
+				"apply_on": "CRM Lead",
+				"condition": f"doc.organization == '{self.tag}'",
+				"priorities": [
+					{"priority": self.priority, "first_response_time": 3600, "default_priority": 1}
+				],
+				"working_hours": [
+					{"workday": workday, "start_time": "09:00:00", "end_time": "18:00:00"}
+					for workday in get_weekdays()[:5]
+				],
+			}
+		).insert(ignore_permissions=True)
+		# the cache is reset after commit, tests never commit
+		_bump_sla_version()
+
+	def cached_sla_names(self):
+		return [sla.name for sla, _ in get_cached_slas("CRM Lead")]
+
+	def test_selection_runs_no_queries_once_cached(self):
+		lead = frappe.new_doc("CRM Lead")
+		lead.organization = self.tag
+		lead.communication_status = self.priority
+		get_sla(lead)
+
+		with patch.object(frappe.db, "sql", wraps=frappe.db.sql) as sql:
+			sla = get_sla(lead)
+
+		self.assertEqual(sql.call_count, 0)
+		self.assertIn(self.sla.name, self.cached_sla_names())
+		self.assertEqual(sla.name, self.sla.name)
+
+	def test_sla_edit_reloads_cache(self):
+		self.assertIn(self.sla.name, self.cached_sla_names())
+
+		self.sla.enabled = 0
+		self.sla.save(ignore_permissions=True)
+		_bump_sla_version()
+
+		self.assertNotIn(self.sla.name, self.cached_sla_names())
+
+	def test_conditions_fall_back_to_safe_eval(self):
+		lead = frappe.new_doc("CRM Lead")
+		lead.organization = self.tag
+		lead.communication_status = self.priority
+
+		with patch.object(utils, "_validate_safe_eval_syntax", None):
+			_bump_sla_version()
+			conditions = {sla.name: condition for sla, condition in get_cached_slas("CRM Lead")}
+			self.assertIsInstance(conditions[self.sla.name], str)
+			self.assertEqual(get_sla(lead).name, self.sla.name)
+		_bump_sla_version()
@@ -1,9 +1,26 @@
+import threading
+import unicodedata
+
 import frappe
 from frappe.model.document import Document
-from frappe.query_builder import JoinType
-from frappe.utils import now_datetime
+from frappe.utils import get_datetime, now_datetime
 from frappe.utils.safe_exec import get_safe_globals
-from pypika import Criterion
+
+try:
+	# what `frappe.safe_eval` checks and evaluates with, to compile conditions once
+	from frappe.utils.safe_exec import WHITELISTED_SAFE_EVAL_GLOBALS, _validate_safe_eval_syntax
+except ImportError:
+	# conditions then go through `frappe.safe_eval` on every call
+	WHITELISTED_SAFE_EVAL_GLOBALS = _validate_safe_eval_syntax = None
+
+SLA = "CRM Service Level Agreement"
+# Changes whenever an SLA or holiday list is saved or deleted, every worker then reloads its SLAs
+SLA_VERSION_KEY = "crm:sla_version"
+
+# site -> (version, {apply_on: [(SLA document, compiled condition or None)]})
+_sla_cache = {}
+_sla_cache_lock = threading.Lock()
+_safe_utils = None
 
 
 def get_sla(doc: Document) -> Document:
@@ -13,38 +30,96 @@ def get_sla(doc: Document) -> Document:
 	:param doc: Lead/Deal to use
 	:return: Applicable SLA
 	"""
-	SLA = frappe.qb.DocType("CRM Service Level Agreement")
-	Priority = frappe.qb.DocType("CRM Service Level Priority")
 	now = now_datetime()
 	priority = doc.communication_status
-	q = (
-		frappe.qb.from_(SLA)
-		.select(SLA.name, SLA.condition)
-		.where(SLA.apply_on == doc.doctype)
-		.where(SLA.enabled)
-		.where(Criterion.any([SLA.start_date.isnull(), SLA.start_date <= now]))
-		.where(Criterion.any([SLA.end_date.isnull(), SLA.end_date >= now]))
-	)
-	if priority:
-		q = (
-			q.join(Priority, JoinType.inner)
-			.on(Priority.parent == SLA.name)
-			.where(Priority.priority == priority)
-		)
-	sla_list = q.run(as_dict=True)
-	res = None
-
-	# move default SLA to the end if present without mutating during iteration
-	default_index = next((i for i, sla in enumerate(sla_list) if sla.get("default")), None)
-	if default_index is not None:
-		sla_list.append(sla_list.pop(default_index))
-
-	for sla in sla_list:
-		cond = sla.get("condition")
-		if not cond or frappe.safe_eval(cond, None, get_context(doc)):
-			res = sla
-			break
-	return res
+	candidates = [
+		(sla, condition)
+		for sla, condition in get_cached_slas(doc.doctype)
+		if (not sla.start_date or get_datetime(sla.start_date) <= now)
+		and (not sla.end_date or get_datetime(sla.end_date) >= now)
+		and (not priority or any(row.priority == priority for row in sla.priorities))
+	]
+	# the default SLA goes last
+	candidates.sort(key=lambda candidate: bool(candidate[0].default))
+
+	context = None
+	for sla, condition in candidates:
+		if not condition:
+			return sla
+		context = context or get_context(doc)
+		if isinstance(condition, str):
+			matches = frappe.safe_eval(condition, None, context)
+		else:
+			matches = eval(condition, {"__builtins__": {}, **WHITELISTED_SAFE_EVAL_GLOBALS}, context)
+		if matches:
+			return sla
+	return None
+
+
+def get_cached_slas(apply_on: str) -> list[tuple]:
+	"""
+	Return the enabled SLAs of a doctype as `(SLA document, compiled condition)` pairs.
+
+	They are loaded once per worker along with their holidays, and reloaded after any SLA or
+	holiday list changes, so the common case costs one cache read and no queries. The documents
+	are shared, do not change them.
+	"""
+	version = frappe.cache.get_value(SLA_VERSION_KEY)
+	site = getattr(frappe.local, "site", None)
+
+	with _sla_cache_lock:
+		cached_version, slas = _sla_cache.get(site, (None, None))
+		if slas is None or cached_version != version:
+			slas = {}
+			_sla_cache[site] = (version, slas)
+		if apply_on in slas:
+			return slas[apply_on]
+
+	loaded = []
+	for name in frappe.get_all(SLA, filters={"apply_on": apply_on, "enabled": 1}, pluck="name"):
+		sla = frappe.get_doc(SLA, name)
+		sla.get_calendar()
+		loaded.append((sla, compile_condition(sla.condition)))
+
+	with _sla_cache_lock:
+		slas[apply_on] = loaded
+	return loaded
+
+
+def get_cached_sla(apply_on: str, name: str) -> Document | None:
+	"""Return an SLA of a doctype by name, from the cache unless it is disabled."""
+	for sla, _ in get_cached_slas(apply_on):
+		if sla.name == name:
+			return sla
+	return frappe.get_doc(SLA, name) if frappe.db.exists(SLA, name) else None
+
+
+def compile_condition(condition: str | None):
+	"""
+	Compile an SLA condition once, with the checks `frappe.safe_eval` makes on every call. Without
+	Frappe's safe eval internals the condition is returned as is, for `frappe.safe_eval`.
+	"""
+	if not condition:
+		return None
+	if _validate_safe_eval_syntax is None or WHITELISTED_SAFE_EVAL_GLOBALS is None:
+		return condition
+	condition = unicodedata.normalize("NFKC", condition)
+	_validate_safe_eval_syntax(condition)
+	return compile(condition, "<safe_eval>", "eval")
+
+
+def clear_sla_cache():
+	"""Reload SLAs on every worker once the current transaction commits."""
+	if frappe.flags.crm_sla_cache_cleared:
+		return
+
+	frappe.flags.crm_sla_cache_cleared = True
+	frappe.db.after_commit.add(_bump_sla_version)
+
+
+def _bump_sla_version():
+	frappe.flags.crm_sla_cache_cleared = False
+	frappe.cache.set_value(SLA_VERSION_KEY, frappe.generate_hash(length=10))
 
 
 def get_context(d: Document) -> dict:
@@ -54,8 +129,10 @@ def get_context(d: Document) -> dict:
 	:param doc: `Document` to add in context
 	:return: Context with `doc` and safe variables
 	"""
-	utils = get_safe_globals().get("frappe").get("utils")
+	global _safe_utils
+	if _safe_utils is None:
+		_safe_utils = get_safe_globals().get("frappe").get("utils")
 	return {
 		"doc": d.as_dict(),
-		"frappe": frappe._dict(utils=utils),
+		"frappe": frappe._dict(utils=_safe_utils),
 	}
@@ -5,7 +5,31 @@ from datetime import datetime
 
 import frappe
 from frappe.model.document import Document
-from frappe.utils import add_to_date, get_datetime
+from frappe.utils import get_datetime, now_datetime
+
+STATUS_LOG = "CRM Status Change Log"
+STATUS_TYPES_KEY = "crm:deal_status_types"
+
+STATUS_LOG_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx",
+	"parent",
+	"parenttype",
+	"parentfield",
+	"from",
+	"from_type",
+	"from_date",
+	"to",
+	"to_type",
+	"to_date",
+	"duration",
+	"log_owner",
+)
 
 
 class CRMStatusChangeLog(Document):
@@ -21,44 +45,163 @@ def get_duration(from_date, to_date):
 	return duration.total_seconds()
 
 
-def add_status_change_log(doc):
-	to_status_type = frappe.db.get_value("CRM Deal Status", doc.status, "type") if doc.status else None
-
-	if not doc.is_new():
-		previous_status = doc.get_doc_before_save().status if doc.get_doc_before_save() else None
-		previous_status_type = (
-			frappe.db.get_value("CRM Deal Status", previous_status, "type") if previous_status else None
-		)
-		if not doc.status_change_log and previous_status:
-			now_minus_one_minute = add_to_date(datetime.now(), minutes=-1)
-			doc.append(
-				"status_change_log",
-				{
-					"from": previous_status,
-					"from_type": previous_status_type or "",
-					"to": "",
-					"to_type": "",
-					"from_date": now_minus_one_minute,
-					"to_date": "",
-					"log_owner": frappe.session.user,
-				},
-			)
-		last_status_change = doc.status_change_log[-1]
-		last_status_change.to = doc.status
-		last_status_change.to_type = to_status_type or ""
-		last_status_change.to_date = datetime.now()
-		last_status_change.log_owner = frappe.session.user
-		last_status_change.duration = get_duration(last_status_change.from_date, last_status_change.to_date)
+def get_status_types() -> dict[str, str]:
+	"""Return `{status: type}` of the CRM Deal Statuses, cached until a status changes."""
+	return frappe.cache.get_value(
+		STATUS_TYPES_KEY,
+		generator=lambda: dict(frappe.get_all("CRM Deal Status", fields=["name", "type"], as_list=True)),
+	)
 
+
+def clear_status_types_cache():
+	frappe.cache.delete_value(STATUS_TYPES_KEY)
+
+
+def add_status_change_log(doc):
+	"""Open the status change log of a new `doc` at its status."""
+	status_types = get_status_types()
 	doc.append(
 		"status_change_log",
 		{
 			"from": doc.status,
-			"from_type": to_status_type or "",
+			"from_type": status_types.get(doc.status) or "",
 			"to": "",
 			"to_type": "",
-			"from_date": datetime.now(),
+			"from_date": now_datetime(),
 			"to_date": "",
 			"log_owner": frappe.session.user,
 		},
 	)
+
+
+def log_status_change(doc):
+	"""
+	Record the status change of a saved `doc` with `log_status_changes`, so the save appends to
+	the log in the database instead of rewriting the loaded rows, then reload the rows into `doc`.
+	"""
+	doc_before_save = doc.get_doc_before_save()
+	if not doc_before_save or doc_before_save.status == doc.status:
+		return
+
+	log_status_changes(doc.doctype, {doc.name: (doc_before_save.status, doc.status)})
+	doc.set(
+		"status_change_log",
+		frappe.db.get_values(
+			STATUS_LOG,
+			{"parent": doc.name, "parenttype": doc.doctype, "parentfield": "status_change_log"},
+			"*",
+			as_dict=True,
+			order_by="idx asc",
+		),
+	)
+
+
+def log_status_changes(doctype: str, changes: dict[str, tuple[str, str]]):
+	"""
+	Record status changes made without saving the documents, `{name: (old status, new status)}`.
+
+	Only the rows that change are touched: the open rows are closed with one update and the new
+	rows added with one insert, whatever the size of the logs.
+	"""
+	changes = {name: change for name, change in changes.items() if change[0] != change[1]}
+	if not changes:
+		return
+
+	status_types = get_status_types()
+	now = now_datetime()
+	user = frappe.session.user
+	names = tuple(changes)
+
+	last_rows = {}
+	for row in frappe.db.sql(
+		"""
+		select log.name, log.parent, log.idx, log.`to`, log.from_date
+		from `tabCRM Status Change Log` log
+		join (
+			select parent, max(idx) as idx from `tabCRM Status Change Log`
+			where parenttype = %(doctype)s and parentfield = 'status_change_log' and parent in %(names)s
+			group by parent
+		) last on last.parent = log.parent and last.idx = log.idx
+		where log.parenttype = %(doctype)s and log.parentfield = 'status_change_log'
+		""",
+		{"doctype": doctype, "names": names},
+		as_dict=True,
+	):
+		last_rows[row.parent] = row
+
+	creations = {}
+	if missing := [name for name in names if name not in last_rows]:
+		filters = {"name": ("in", missing)}
+		creations = dict(frappe.get_all(doctype, filters=filters, fields=["name", "creation"], as_list=True))
+
+	closing, rows = [], []
+	for name, (old_status, new_status) in changes.items():
+		last_row = last_rows.get(name)
+		idx = last_row.idx if last_row else 0
+		if last_row and not last_row.to:
+			closing.append((last_row, new_status))
+		elif not last_row and old_status:
+			# no log yet, the previous status is counted from the document's creation
+			from_date = creations.get(name) or now
+			idx += 1
+			rows.append(
+				_log_row(name, doctype, idx, now, user, old_status, status_types, from_date, new_status)
+			)
+
+		rows.append(_log_row(name, doctype, idx + 1, now, user, new_status, status_types, now))
+
+	if closing:
+		_close_rows(closing, status_types, now, user)
+	if rows:
+		frappe.db.bulk_insert(STATUS_LOG, STATUS_LOG_FIELDS, rows)
+
+
+def _log_row(parent, doctype, idx, now, user, status, status_types, from_date, to_status=None):
+	to_values = ("", "", None, 0)
+	if to_status:
+		to_values = (to_status, status_types.get(to_status) or "", now, get_duration(from_date, now))
+
+	return (
+		frappe.generate_hash(length=10),
+		now,
+		now,
+		user,
+		user,
+		0,
+		idx,
+		parent,
+		doctype,
+		"status_change_log",
+		status,
+		status_types.get(status) or "",
+		from_date,
+		*to_values,
+		user,
+	)
+
+
+def _close_rows(closing, status_types, now, user):
+	params = {"now": now, "user": user, "names": tuple(row.name for row, _ in closing)}
+	to, to_type, duration = [], [], []
+	for i, (row, status) in enumerate(closing):
+		params[f"n{i}"] = row.name
+		params[f"s{i}"] = status
+		params[f"t{i}"] = status_types.get(status) or ""
+		params[f"d{i}"] = get_duration(row.from_date, now)
+		to.append(f"when %(n{i})s then %(s{i})s")
+		to_type.append(f"when %(n{i})s then %(t{i})s")
+		duration.append(f"when %(n{i})s then %(d{i})s")
+
+	frappe.db.sql(
+		f"""
+		update `tabCRM Status Change Log` set
+			`to` = case name {" ".join(to)} end,
+			to_type = case name {" ".join(to_type)} end,
+			duration = case name {" ".join(duration)} end,
+			to_date = %(now)s,
+			log_owner = %(user)s,
+			modified = %(now)s
+		where name in %(names)s
+		""",
+		params,
+	)
@@ -0,0 +1,23 @@
+// Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("CRM WhatsApp Campaign", {
+	refresh(frm) {
+		if (frm.is_new()) return;
+
+		if (["Draft", "Paused", "Failed"].includes(frm.doc.status)) {
+			frm.add_custom_button(frm.doc.status == "Draft" ? __("Start") : __("Resume"), () =>
+				frm
+					.call("crm.integrations.interakt.campaign.start_campaign", { campaign: frm.doc.name })
+					.then(() => frm.reload_doc()),
+			);
+		}
+		if (["Queued", "Running"].includes(frm.doc.status)) {
+			frm.add_custom_button(__("Pause"), () =>
+				frm
+					.call("crm.integrations.interakt.campaign.pause_campaign", { campaign: frm.doc.name })
+					.then(() => frm.reload_doc()),
+			);
+		}
+	},
+});
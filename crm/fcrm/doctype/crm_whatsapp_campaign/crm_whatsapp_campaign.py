@@ -0,0 +1,50 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+
+class CRMWhatsAppCampaign(Document):
+	def validate(self):
+		self.validate_filters()
+		self.validate_body_fields()
+		if self.messages_per_second is not None and self.messages_per_second <= 0:
+			frappe.throw(_("Messages per Second must be greater than 0"))
+
+	def validate_filters(self):
+		filters = frappe.parse_json(self.filters or "{}")
+		if not isinstance(filters, dict | list):
+			frappe.throw(_("Filters must be a JSON object or list"))
+
+		# recipients are fixed when the campaign is saved, not when the job runs as another user
+		if isinstance(filters, dict):
+			for key, value in filters.items():
+				if isinstance(value, list):
+					filters[key] = [
+						v.replace("@me", frappe.session.user) if isinstance(v, str) else v for v in value
+					]
+				elif value == "@me":
+					filters[key] = frappe.session.user
+
+		self.filters = frappe.as_json(filters)
+
+	def validate_body_fields(self):
+		meta = frappe.get_meta(self.reference_doctype)
+		for field in self.get_body_fields():
+			if not meta.has_field(field):
+				frappe.throw(_("{0} is not a field of {1}").format(field, _(self.reference_doctype)))
+
+	def get_filters(self):
+		"""Recipient filters as a list, so the runner can add its checkpoint condition."""
+		filters = frappe.parse_json(self.filters or "{}")
+		if isinstance(filters, dict):
+			return [
+				[self.reference_doctype, key, *(value if isinstance(value, list) else ["=", value])]
+				for key, value in filters.items()
+			]
+		return list(filters)
+
+	def get_body_fields(self):
+		return [field.strip() for field in (self.body_fields or "").split(",") if field.strip()]
@@ -0,0 +1,102 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+
+from crm.integrations.interakt import campaign
+from crm.integrations.interakt.campaign import RateLimiter, run_campaign
+
+
+class TestRateLimiter(UnitTestCase):
+	def test_calls_are_spaced_across_threads(self):
+		limiter = RateLimiter(50)
+		with ThreadPoolExecutor(max_workers=8) as pool:
+			started = time.monotonic()
+			list(pool.map(lambda _: limiter.wait(), range(11)))
+
+		# ten intervals of 20ms after the first call
+		self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+	def test_no_rate_means_no_wait(self):
+		limiter = RateLimiter(0)
+		started = time.monotonic()
+		for _ in range(100):
+			limiter.wait()
+		self.assertLess(time.monotonic() - started, 0.05)
+
+
+class IntegrationTestCRMWhatsAppCampaign(IntegrationTestCase):
+	def setUp(self):
+		self.tag = frappe.generate_hash(length=8)
+		for i in range(5):
+			frappe.get_doc(
+				{
+					"doctype": "CRM Lead",
+					"first_name": f"Campaign {i}",
+					"organization": self.tag,
+					# the last two leads share a number, it is messaged once
+					"mobile_no": f"+91987654{min(i, 3):04d}",
+				}
+			).insert(ignore_permissions=True)
+
+		self.interakt = MagicMock(default_country_code="+91")
+		self.interakt.get_template_payload.side_effect = lambda phone, **kwargs: {"phoneNumber": phone}
+		self.interakt.post_template_payload.side_effect = lambda payload: {
+			"success": True,
+			"message_id": f"msg-{payload['phoneNumber']}",
+		}
+		patcher = patch.object(campaign.Interakt, "connect", return_value=self.interakt)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def make_campaign(self):
+		return frappe.get_doc(
+			{
+				"doctype": "CRM WhatsApp Campaign",
+				"campaign_name": self.tag,
+				"reference_doctype": "CRM Lead",
+				"filters": frappe.as_json({"organization": self.tag}),
+				"template_name": "seller_offer",
+				"body_fields": "first_name",
+				"messages_per_second": 1000,
+				"status": "Queued",
+			}
+		).insert(ignore_permissions=True)
+
+	def get_logs(self, doc):
+		return frappe.get_all(
+			"CRM WhatsApp Message",
+			filters={"campaign_id": doc.name},
+			fields=["phone_number", "status", "message_id"],
+		)
+
+	def test_campaign_sends_once_per_number(self):
+		doc = self.make_campaign()
+		run_campaign(doc.name)
+		doc.reload()
+
+		self.assertEqual(doc.status, "Completed")
+		self.assertEqual((doc.total_recipients, doc.sent_count, doc.failed_count), (5, 4, 0))
+		logs = self.get_logs(doc)
+		self.assertEqual(len(logs), 4)
+		self.assertTrue(all(log.status == "Sent" and log.message_id for log in logs))
+
+	def test_crashed_batch_is_not_sent_again(self):
+		doc = self.make_campaign()
+		with patch.object(campaign, "record_results", side_effect=RuntimeError("worker lost")):
+			run_campaign(doc.name)
+		self.assertEqual(frappe.db.get_value("CRM WhatsApp Campaign", doc.name, "status"), "Failed")
+
+		calls = self.interakt.post_template_payload.call_count
+		frappe.db.set_value("CRM WhatsApp Campaign", doc.name, "status", "Queued")
+		run_campaign(doc.name)
+		doc.reload()
+
+		self.assertEqual(self.interakt.post_template_payload.call_count, calls)
+		self.assertEqual((doc.status, doc.sent_count, doc.failed_count), ("Completed", 0, 4))
+		self.assertTrue(all(log.status == "Failed" for log in self.get_logs(doc)))
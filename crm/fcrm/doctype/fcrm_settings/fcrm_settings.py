@@ -2,12 +2,12 @@
 # For license information, please see license.txt
 
 import frappe
-import requests
 from frappe import _
 from frappe.custom.doctype.property_setter.property_setter import delete_property_setter, make_property_setter
 from frappe.model.document import Document
 
 from crm.install import after_install
+from crm.integrations import http_client
 
 
 class FCRMSettings(Document):
@@ -150,7 +150,7 @@ def get_exchange_rate(from_currency, to_currency, date=None):
 	api_used = "frankfurter"
 
 	api_endpoint = f"https://api.frankfurter.app/{date}?from={from_currency}&to={to_currency}"
-	res = requests.get(api_endpoint, timeout=5)
+	res = http_client.get("Frankfurter", api_endpoint, endpoint="rates", timeout=5)
 	if res.ok:
 		data = res.json()
 		return data["rates"][to_currency]
@@ -178,7 +178,9 @@ def get_exchange_rate(from_currency, to_currency, date=None):
 
 		api_endpoint = "https://api.exchangerate.host/convert"
 
-		res = requests.get(api_endpoint, params=params, timeout=5)
+		res = http_client.get(
+			"exchangerate.host", api_endpoint, endpoint="convert", params=params, timeout=5
+		)
 		if res.ok:
 			data = res.json()
 			return data["result"]
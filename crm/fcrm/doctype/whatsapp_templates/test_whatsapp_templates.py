@@ -0,0 +1,69 @@
+# Copyright (c) 2026, Frappe Technologies and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.fcrm.doctype.whatsapp_templates import whatsapp_templates
+from crm.fcrm.doctype.whatsapp_templates.whatsapp_templates import (
+	_bump_template_version,
+	get_cached_templates,
+)
+
+
+def make_template(name, body="Hello {{1}}"):
+	return frappe.get_doc(
+		{
+			"doctype": "WhatsApp Templates",
+			"template_name": name,
+			"template": body,
+			"body_text": body,
+			"footer": "ipshopy",
+			"variable_count": 1,
+		}
+	).insert(ignore_permissions=True)
+
+
+class IntegrationTestWhatsAppTemplates(IntegrationTestCase):
+	def setUp(self):
+		self.names = [f"cache_test_{frappe.generate_hash(length=6)}_{i}" for i in range(3)]
+		for name in self.names:
+			make_template(name)
+		_bump_template_version()
+
+	def count_queries(self, names):
+		with patch.object(whatsapp_templates.frappe, "get_all", wraps=frappe.get_all) as get_all:
+			templates = get_cached_templates(names)
+		return templates, get_all.call_count
+
+	def test_templates_are_loaded_in_one_query(self):
+		templates, queries = self.count_queries([*self.names, *self.names, "missing_template"])
+		self.assertEqual(queries, 1)
+		self.assertEqual(set(templates), set(self.names))
+		self.assertEqual(templates[self.names[0]].body, "Hello {{1}}")
+
+		# cached, including the unknown name
+		templates, queries = self.count_queries([*self.names, "missing_template"])
+		self.assertEqual(queries, 0)
+		self.assertEqual(len(templates), 3)
+
+	def test_saving_a_template_invalidates_the_cache(self):
+		self.count_queries(self.names)
+
+		doc = frappe.get_doc("WhatsApp Templates", self.names[0])
+		doc.body_text = "Hi {{1}}"
+		doc.save(ignore_permissions=True)
+		# runs after commit
+		_bump_template_version()
+
+		templates, queries = self.count_queries(self.names)
+		self.assertEqual(queries, 1)
+		self.assertEqual(templates[self.names[0]].body, "Hi {{1}}")
+
+	def test_cache_is_bounded(self):
+		with patch.object(whatsapp_templates, "TEMPLATE_CACHE_SIZE", 2):
+			self.count_queries(self.names)
+			_, cache = whatsapp_templates._template_cache[frappe.local.site]
+			self.assertEqual(len(cache), 2)
@@ -1,9 +1,103 @@
 # Copyright (c) 2024, Frappe Technologies and contributors
 # For license information, please see license.txt
 
+import threading
+from collections import OrderedDict
+
 import frappe
 from frappe.model.document import Document
 
+# Templates kept in memory by each worker, per site
+TEMPLATE_CACHE_SIZE = 1000
+# Changes whenever a template is saved or deleted, every worker then drops its cached templates
+TEMPLATE_VERSION_KEY = "crm:whatsapp_template_version"
+TEMPLATE_FIELDS = [
+	"name",
+	"template_name",
+	"template",
+	"body_text",
+	"header_text",
+	"footer",
+	"variable_count",
+]
+
+# site -> (version, OrderedDict of template name -> template or None if it does not exist)
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+
 
 class WhatsAppTemplates(Document):
-	pass
+	def on_update(self):
+		clear_template_cache()
+
+	def on_trash(self):
+		clear_template_cache()
+
+
+def clear_template_cache():
+	"""Invalidate cached templates on every worker once the current transaction commits."""
+	if frappe.flags.crm_whatsapp_template_cache_cleared:
+		return
+
+	frappe.flags.crm_whatsapp_template_cache_cleared = True
+	frappe.db.after_commit.add(_bump_template_version)
+
+
+def _bump_template_version():
+	frappe.flags.crm_whatsapp_template_cache_cleared = False
+	frappe.cache.set_value(TEMPLATE_VERSION_KEY, frappe.generate_hash(length=10))
+
+
+def get_cached_templates(names):
+	"""
+	Return the WhatsApp Templates with the given names as `{name: template}`, unknown names are left out.
+
+	Each template has `template_name`, `body` (the body text, or the template text for templates
+	not synced from Interakt), `template`, `header`, `footer` and `variable_count`. Templates not
+	cached by this worker yet are loaded together, so this makes at most one query. The returned
+	templates are shared, copy them before changing anything.
+	"""
+	names = {name for name in names if name}
+	if not names:
+		return {}
+
+	version = frappe.cache.get_value(TEMPLATE_VERSION_KEY)
+	site = getattr(frappe.local, "site", None)
+
+	with _template_cache_lock:
+		cached_version, cache = _template_cache.get(site, (None, None))
+		if cache is None or cached_version != version:
+			cache = OrderedDict()
+			_template_cache[site] = (version, cache)
+
+		templates = {}
+		for name in names:
+			if name in cache:
+				cache.move_to_end(name)
+				templates[name] = cache[name]
+
+	if missing := names - templates.keys():
+		rows = frappe.get_all(
+			"WhatsApp Templates", filters={"name": ("in", list(missing))}, fields=TEMPLATE_FIELDS
+		)
+		found = {row.name: _to_cached_template(row) for row in rows}
+
+		with _template_cache_lock:
+			for name in missing:
+				# unknown names are cached too, so a deleted template is not looked up again
+				templates[name] = cache[name] = found.get(name)
+			while len(cache) > TEMPLATE_CACHE_SIZE:
+				cache.popitem(last=False)
+
+	return {name: template for name, template in templates.items() if template}
+
+
+def _to_cached_template(row):
+	return frappe._dict(
+		template_name=row.template_name,
+		body=row.body_text or row.template or "",
+		template=row.template or "",
+		header=row.header_text or "",
+		footer=row.footer or "",
+		variable_count=row.variable_count or 0,
+	)
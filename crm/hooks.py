@@ -143,6 +143,8 @@ override_doctype_class = {
 doc_events = {
 	"Contact": {
 		"validate": ["crm.api.contact.validate"],
+		"on_update": ["crm.integrations.phone_index.index_document"],
+		"on_trash": ["crm.integrations.phone_index.unindex_document"],
 	},
 	"ToDo": {
 		"after_insert": ["crm.api.todo.after_insert"],
@@ -160,29 +162,63 @@ doc_events = {
 		"on_update": ["crm.api.whatsapp.on_update"],
 	},
 	"CRM Lead": {
-		"after_insert": ["crm.integrations.interakt.api.send_welcome_message_to_lead_hook"],
+		"after_insert": [
+			"crm.integrations.interakt.api.send_welcome_message_to_lead_hook",
+			"crm.api.lead_distribution.queue_imported_lead",
+		],
+		"on_update": ["crm.integrations.phone_index.index_document"],
+		"on_trash": ["crm.integrations.phone_index.unindex_document"],
 	},
 	"CRM Deal": {
 		"on_update": [
-			"crm.fcrm.doctype.erpnext_crm_settings.erpnext_crm_settings.create_customer_in_erpnext"
+			"crm.fcrm.doctype.erpnext_crm_settings.erpnext_crm_settings.create_customer_in_erpnext",
+			"crm.integrations.phone_index.index_document",
 		],
+		"on_trash": ["crm.integrations.phone_index.unindex_document"],
 	},
 	"User": {
 		"before_validate": ["crm.api.demo.validate_user"],
 		"validate_reset_password": ["crm.api.demo.validate_reset_password"],
 	},
+	"DocType": {
+		"on_update": ["crm.utils.link_graph.clear_link_graph"],
+		"on_trash": ["crm.utils.link_graph.clear_link_graph"],
+	},
+	"Custom Field": {
+		"on_update": ["crm.utils.link_graph.clear_link_graph"],
+		"on_trash": ["crm.utils.link_graph.clear_link_graph"],
+	},
+	"Property Setter": {
+		"on_update": ["crm.utils.link_graph.clear_link_graph"],
+		"on_trash": ["crm.utils.link_graph.clear_link_graph"],
+	},
 }
 
 # Scheduled Tasks
 # ---------------
 
 scheduler_events = {
-	"all": ["crm.api.event.trigger_offset_event_notifications"],
-	"hourly": ["crm.api.event.trigger_hourly_event_notifications"],
-	"daily": ["crm.api.event.trigger_daily_event_notifications"],
+	"all": [
+		"crm.api.event.trigger_offset_event_notifications",
+		"crm.integrations.outbox.kick_outbox",
+		"crm.integrations.interakt.status_updates.kick_status_updates",
+		"crm.fcrm.doctype.crm_service_level_agreement.sla_monitor.sweep_sla_breaches",
+	],
+	"hourly": [
+		"crm.api.event.trigger_hourly_event_notifications",
+		"crm.fcrm.doctype.crm_call_metrics.crm_call_metrics.rollup_call_metrics",
+	],
+	"daily": [
+		"crm.api.event.trigger_daily_event_notifications",
+		"crm.integrations.call_recordings.trim_recording_cache",
+	],
 	"weekly": ["crm.api.event.trigger_weekly_event_notifications"],
 	"daily_long": ["crm.lead_syncing.background_sync.sync_leads_from_sources_daily"],
-	"hourly_long": ["crm.lead_syncing.background_sync.sync_leads_from_sources_hourly"],
+	"hourly_long": [
+		"crm.lead_syncing.background_sync.sync_leads_from_sources_hourly",
+		"crm.integrations.call_recordings.fetch_pending_recordings",
+		"crm.integrations.interakt.api.sync_interakt_templates_job",
+	],
 	"monthly_long": ["crm.lead_syncing.background_sync.sync_leads_from_sources_monthly"],
 	"cron": {
 		"*/1 * * * *": ["crm.lead_syncing.background_sync.sync_leads_from_sources_5_minutes"],
@@ -260,7 +296,10 @@ ignore_links_on_delete = ["Failed Lead Sync Log"]
 # "crm.auth.validate"
 # ]
 
-after_migrate = ["crm.fcrm.doctype.fcrm_settings.fcrm_settings.after_migrate"]
+after_migrate = [
+	"crm.fcrm.doctype.fcrm_settings.fcrm_settings.after_migrate",
+	"crm.utils.link_graph.build_link_graphs",
+]
 
 standard_dropdown_items = [
 	{
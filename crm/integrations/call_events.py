@@ -0,0 +1,299 @@
+"""
+Ordered, idempotent application of telephony events to CRM Call Log.
+
+Providers (Smartflo, Exotel, Twilio) deliver ringing, answered and completed callbacks out of
+order and sometimes more than once. Every telephony handler funnels its events through
+`apply_call_event`, which serialises events per call on the call log row and merges them with
+`merge_call_event`, so a call only ever moves forward through its lifecycle.
+
+The row is only locked once it exists: `select ... for update` on a missing key takes a gap lock,
+and two first events of a call holding one each would deadlock on their inserts. A first event
+inserts with `upsert_call_log` instead, which merges into the row of a concurrent one.
+"""
+
+import hashlib
+import json
+
+import frappe
+
+from crm.integrations.call_recordings import enqueue_recording_fetch
+
+CALL_LOG = "CRM Call Log"
+
+# Position of each status in the call lifecycle. A call never moves to a lower rank, and
+# terminal statuses (the highest rank) are final.
+STATUS_RANK = {
+	"Initiated": 0,
+	"Queued": 1,
+	"Ringing": 2,
+	"In Progress": 3,
+	"Completed": 4,
+	"No Answer": 4,
+	"Busy": 4,
+	"Failed": 4,
+	"Canceled": 4,
+}
+TERMINAL_RANK = 4
+TERMINAL_STATUSES = tuple(status for status, rank in STATUS_RANK.items() if rank == TERMINAL_RANK)
+
+# Provider spellings mapped to the status options of CRM Call Log
+STATUS_ALIASES = {
+	"initiated": "Initiated",
+	"queued": "Queued",
+	"ringing": "Ringing",
+	"agent_ringing": "Ringing",
+	"in progress": "In Progress",
+	"in-progress": "In Progress",
+	"in_progress": "In Progress",
+	"answered": "In Progress",
+	"completed": "Completed",
+	"no answer": "No Answer",
+	"no-answer": "No Answer",
+	"no_answer": "No Answer",
+	"busy": "Busy",
+	"failed": "Failed",
+	"canceled": "Canceled",
+	"cancelled": "Canceled",
+}
+
+# Written once, by whichever event gets there first
+STICKY_FIELDS = ("start_time", "caller", "reference_doctype", "reference_docname")
+# Describe how the call ended, only accepted from terminal events
+TERMINAL_FIELDS = ("end_time", "duration", "recording_url")
+
+ROW_FIELDS = (
+	"name",
+	"status",
+	"type",
+	"telephony_medium",
+	"medium",
+	"from",
+	"to",
+	"caller",
+	"receiver",
+	"start_time",
+	"end_time",
+	"duration",
+	"recording_url",
+	"recording_file",
+	"note",
+	"reference_doctype",
+	"reference_docname",
+)
+
+EVENT_DEDUP_TTL = 24 * 60 * 60
+
+
+def normalize_status(status):
+	"""Return the CRM Call Log status for a provider status, or None if it is unknown."""
+	if not status:
+		return None
+	if status in STATUS_RANK:
+		return status
+	return STATUS_ALIASES.get(str(status).strip().lower())
+
+
+def get_status_rank(status):
+	return STATUS_RANK.get(normalize_status(status), -1)
+
+
+def is_terminal(status):
+	return get_status_rank(status) == TERMINAL_RANK
+
+
+def _is_blank(value):
+	return value is None or value == "" or value == 0
+
+
+def merge_call_event(current, status, values=None):
+	"""
+	Merge a call event into the current call log row and return the fields that change.
+
+	- status only moves to a higher rank, so stale or repeated events never downgrade a call
+	- sticky fields are only filled when empty
+	- terminal fields are only taken from terminal events, and the first terminal event wins
+	- other fields follow the latest non-stale event, and stale events may only fill gaps
+	"""
+	current = current or {}
+	values = values or {}
+
+	status = normalize_status(status)
+	current_rank = get_status_rank(current.get("status"))
+	new_rank = get_status_rank(status)
+	already_terminal = current_rank == TERMINAL_RANK
+
+	updates = {}
+	if status and new_rank > current_rank:
+		updates["status"] = status
+
+	is_stale = new_rank < current_rank or new_rank == -1
+	for field, value in values.items():
+		if field in ("name", "status") or _is_blank(value):
+			continue
+
+		existing = current.get(field)
+		if field in TERMINAL_FIELDS:
+			if new_rank != TERMINAL_RANK or (already_terminal and not _is_blank(existing)):
+				continue
+		elif field in STICKY_FIELDS or is_stale:
+			if not _is_blank(existing):
+				continue
+
+		if existing != value:
+			updates[field] = value
+
+	return updates
+
+
+def payload_digest(payload):
+	"""Stable fingerprint of a webhook payload, used to drop redelivered events."""
+	raw = json.dumps(payload or {}, sort_keys=True, default=str)
+	return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _dedup_key(call_id, event_key):
+	return f"crm:call_event:{call_id}:{event_key}"
+
+
+def is_duplicate_event(call_id, event_key):
+	if not event_key:
+		return False
+	return bool(frappe.cache.get_value(_dedup_key(call_id, event_key)))
+
+
+def mark_event_applied(call_id, event_key):
+	if event_key:
+		frappe.cache.set_value(_dedup_key(call_id, event_key), 1, expires_in_sec=EVENT_DEDUP_TTL)
+
+
+def get_call_log_row(call_id, for_update=False):
+	fields = ", ".join(f"`{field}`" for field in ROW_FIELDS)
+	rows = frappe.db.sql(
+		f"select {fields} from `tabCRM Call Log` where `name`=%s {'for update' if for_update else ''}",
+		call_id,
+		as_dict=True,
+	)
+	return rows[0] if rows else None
+
+
+def apply_call_event(call_id, status, values=None, *, defaults=None, on_create=None, event_key=None):
+	"""
+	Apply a telephony event to the call log `call_id`, creating the call log if needed.
+
+	:param call_id: Provider call identifier, stored in the unique `id` column (and used as name)
+	:param status: Provider or CRM status of the call after this event
+	:param values: Call log fields carried by this event
+	:param defaults: Fields only used when the call log is created by this event
+	:param on_create: Callback receiving the new document before insert, e.g. to link a lead
+	:param event_key: Event fingerprint (see `payload_digest`); repeated keys are skipped
+	:return: The call log row after the event
+	"""
+	if is_duplicate_event(call_id, event_key):
+		return get_call_log_row(call_id)
+
+	frappe.db.after_commit.add(lambda: mark_event_applied(call_id, event_key))
+
+	current = get_call_log_row(call_id) and get_call_log_row(call_id, for_update=True)
+	if not current:
+		current = upsert_call_log(call_id, status, values, defaults=defaults, on_create=on_create)
+	else:
+		updates = merge_call_event(current, status, values)
+		if updates:
+			frappe.db.set_value(CALL_LOG, current.name, updates)
+			current.update(updates)
+
+	if is_terminal(current.status) and current.recording_url and not current.recording_file:
+		enqueue_recording_fetch(current.name)
+
+	return current
+
+
+def upsert_call_log(call_id, status, values=None, *, defaults=None, on_create=None):
+	"""
+	Create the call log `call_id` with a single `insert ... on duplicate key update` statement.
+
+	If another worker inserts the same call first, the update clause merges this event into
+	that row with the same rules as `merge_call_event`, so the insert race cannot downgrade
+	the call. Returns the row as written; `row_count()` tells an insert (1) from a merge (2), and
+	only a merged row is read back.
+	"""
+	doc = _new_call_log(call_id, status, values, defaults, on_create)
+	row = doc.get_valid_dict(convert_dates_to_str=True)
+
+	columns = ", ".join(f"`{column}`" for column in row)
+	placeholders = ", ".join(["%s"] * len(row))
+	assignments = ", ".join(_merge_assignments(values or {}))
+	frappe.db.sql(
+		f"""insert into `tabCRM Call Log` ({columns}) values ({placeholders})
+		on duplicate key update {assignments}""",
+		tuple(row.values()),
+	)
+
+	if frappe.db.sql("select row_count()")[0][0] != 1:
+		return get_call_log_row(call_id)
+
+	for child in doc.get_all_children():
+		child.db_insert()
+
+	return frappe._dict({field: doc.get(field) for field in ROW_FIELDS})
+
+
+def _new_call_log(call_id, status, values, defaults, on_create):
+	status = normalize_status(status) or "Initiated"
+
+	doc = frappe.new_doc(CALL_LOG)
+	doc.update(defaults or {})
+	for field, value in (values or {}).items():
+		if _is_blank(value) or (field in TERMINAL_FIELDS and status not in TERMINAL_STATUSES):
+			continue
+		doc.set(field, value)
+
+	doc.id = doc.name = call_id
+	doc.status = status
+	if on_create:
+		on_create(doc)
+
+	doc.set_user_and_timestamp()
+	doc.set_parent_in_children()
+	doc._validate_mandatory()
+	return doc
+
+
+def _rank_sql(expr):
+	cases = " ".join(f"when {frappe.db.escape(status)} then {rank}" for status, rank in STATUS_RANK.items())
+	return f"(case {expr} {cases} else -1 end)"
+
+
+def _blank_sql(expr, field):
+	if field == "duration":
+		return f"ifnull({expr}, 0) = 0"
+	return f"ifnull({expr}, '') = ''"
+
+
+def _merge_assignments(values):
+	"""SQL version of `merge_call_event`, evaluated against the row that won the insert race."""
+	new_rank = _rank_sql("values(`status`)")
+	old_rank = _rank_sql("`status`")
+
+	assignments = []
+	for field in values:
+		if field in ("name", "status"):
+			continue
+
+		column, new = f"`{field}`", f"values(`{field}`)"
+		old_blank, new_blank = _blank_sql(column, field), _blank_sql(new, field)
+		if field in TERMINAL_FIELDS:
+			take_new = (
+				f"{new_rank} = {TERMINAL_RANK} and ({old_rank} < {TERMINAL_RANK} or {old_blank}) "
+				f"and not {new_blank}"
+			)
+		elif field in STICKY_FIELDS:
+			take_new = f"{old_blank} and not {new_blank}"
+		else:
+			take_new = f"not {new_blank} and (({new_rank} >= {old_rank} and {new_rank} >= 0) or {old_blank})"
+		assignments.append(f"{column} = if({take_new}, {new}, {column})")
+
+	# status goes last, the assignments above compare against the status before this event
+	assignments.append("`modified` = values(`modified`)")
+	assignments.append(f"`status` = if({new_rank} > {old_rank}, values(`status`), `status`)")
+	return assignments
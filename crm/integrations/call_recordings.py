@@ -0,0 +1,266 @@
+"""
+Local cache of call recordings.
+
+Providers host recordings on their own servers, where they are slow to load and expire after a
+while. Once a call log has a recording, a background job downloads it into a private File and
+links it from `CRM Call Log.recording_file`; the timeline then plays it through
+`stream_recording`, which supports HTTP range requests so the player can seek.
+
+Recording URLs arrive through webhooks, so only `https` URLs on the recording hosts of the call's
+provider (`RECORDING_HOSTS`) are downloaded, redirects included.
+
+Files are content addressed: a recording already in the cache (same content hash) is not stored
+again, the new call log gets its own File pointing at it. The cache is trimmed to
+`FCRM Settings.recording_cache_size`, oldest recordings first. Trimmed calls fall back to the
+provider URL.
+"""
+
+import hashlib
+import mimetypes
+import os
+from urllib.parse import urljoin, urlparse
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, now_datetime
+from werkzeug.utils import send_file
+
+from crm.integrations import http_client
+
+CALL_LOG = "CRM Call Log"
+
+DOWNLOAD_TIMEOUT = 60
+MAX_RECORDING_SIZE = 100 * 1024 * 1024
+MAX_FETCH_ATTEMPTS = 5
+# Pending recordings of calls older than this are not fetched anymore
+FETCH_WINDOW_DAYS = 3
+FETCH_BATCH_SIZE = 200
+MAX_REDIRECTS = 3
+
+# Hosts each telephony medium serves recordings from, a host matching one or ending in `.<host>`,
+# with the path prefix the recordings live under on shared storage hosts
+RECORDING_HOSTS = {
+	"Exotel": (
+		("exotel.com", "/"),
+		("exotel.in", "/"),
+		("s3-ap-southeast-1.amazonaws.com", "/exotelrecordings/"),
+		("exotelrecordings.s3.amazonaws.com", "/"),
+	),
+	"Tata Tele": (
+		("tatateleservices.com", "/"),
+		("tatatelebusiness.com", "/"),
+		("smartflo.ai", "/"),
+	),
+	"Twilio": (("api.twilio.com", "/"),),
+}
+
+
+def is_enabled():
+	return cint(frappe.db.get_single_value("FCRM Settings", "cache_call_recordings", cache=True))
+
+
+def get_recording_url(call_log):
+	"""URL of the cached recording of a call log, served by `stream_recording`."""
+	return f"/api/method/crm.integrations.call_recordings.stream_recording?call_log={call_log}"
+
+
+def enqueue_recording_fetch(call_log):
+	if not is_enabled():
+		return
+
+	frappe.enqueue(
+		fetch_recording,
+		queue="long",
+		call_log=call_log,
+		job_id=f"crm_call_recording::{call_log}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+	)
+
+
+def fetch_recording(call_log):
+	"""Download the recording of a call log into the cache, unless it is already there."""
+	call = frappe.db.get_value(
+		CALL_LOG, call_log, ["name", "recording_url", "recording_file", "telephony_medium"], as_dict=True
+	)
+	if not call or not call.recording_url or call.recording_file:
+		return
+
+	attempts_key = f"crm:call_recording_attempts:{call_log}"
+	if cint(frappe.cache.get_value(attempts_key)) >= MAX_FETCH_ATTEMPTS:
+		return
+
+	try:
+		content, content_type = download_recording(call.recording_url, call.telephony_medium)
+	except Exception:
+		frappe.log_error(
+			title="Call recording download failed", reference_doctype=CALL_LOG, reference_name=call_log
+		)
+		attempts = cint(frappe.cache.get_value(attempts_key)) + 1
+		frappe.cache.set_value(attempts_key, attempts, expires_in_sec=86400)
+		return
+
+	file_name = save_recording(call_log, call.recording_url, content, content_type)
+	frappe.db.set_value(CALL_LOG, call_log, "recording_file", file_name, update_modified=False)
+
+
+def download_recording(url, telephony_medium):
+	"""Download a recording from the hosts of its telephony medium, following redirects among them."""
+	for _redirect in range(MAX_REDIRECTS + 1):
+		validate_recording_url(url, telephony_medium)
+		with http_client.get(
+			"Recordings",
+			url,
+			endpoint="download",
+			stream=True,
+			timeout=DOWNLOAD_TIMEOUT,
+			allow_redirects=False,
+		) as response:
+			if response.is_redirect:
+				url = urljoin(url, response.headers.get("Location"))
+				continue
+
+			response.raise_for_status()
+			if cint(response.headers.get("Content-Length")) > MAX_RECORDING_SIZE:
+				raise ValueError("Recording is too large")
+
+			content = bytearray()
+			for chunk in response.iter_content(chunk_size=64 * 1024):
+				content.extend(chunk)
+				if len(content) > MAX_RECORDING_SIZE:
+					raise ValueError("Recording is too large")
+
+		if not content:
+			raise ValueError("Recording is empty")
+		return bytes(content), response.headers.get("Content-Type")
+
+	raise ValueError("Recording URL redirects too many times")
+
+
+def validate_recording_url(url, telephony_medium):
+	"""Raise unless `url` is an `https` URL on one of the recording hosts of the telephony medium."""
+	parsed = urlparse(url or "")
+	host = (parsed.hostname or "").lower()
+	path = parsed.path or "/"
+	if parsed.scheme == "https" and any(
+		(host == allowed or host.endswith(f".{allowed}")) and path.startswith(prefix)
+		for allowed, prefix in RECORDING_HOSTS.get(telephony_medium, ())
+	):
+		return
+	raise ValueError(f"Recording URL is not on a {telephony_medium or 'known'} recording host")
+
+
+def save_recording(call_log, url, content, content_type=None):
+	"""
+	Store recording content as a private File of the call log. Content already in the cache is not
+	stored again: the call log gets its own File on the existing file, so deleting either leaves the
+	other one playing.
+	"""
+	content_hash = hashlib.md5(content).hexdigest()
+	file = frappe.get_doc(
+		{
+			"doctype": "File",
+			"attached_to_doctype": CALL_LOG,
+			"attached_to_name": call_log,
+			"attached_to_field": "recording_file",
+			"is_private": 1,
+		}
+	)
+
+	existing = frappe.db.get_value(
+		"File",
+		{"content_hash": content_hash, "is_private": 1, "attached_to_doctype": CALL_LOG},
+		["file_name", "file_url", "file_size"],
+		as_dict=True,
+	)
+	if existing:
+		file.update({**existing, "content_hash": content_hash})
+	else:
+		extension = (
+			os.path.splitext(urlparse(url).path)[1]
+			or mimetypes.guess_extension((content_type or "").split(";")[0].strip())
+			or ".mp3"
+		)
+		file.update({"file_name": f"{content_hash}{extension}", "content": content})
+
+	file.insert(ignore_permissions=True)
+	return file.name
+
+
+def fetch_pending_recordings():
+	"""Scheduled job: fetch recordings the completion hook missed or could not download yet."""
+	if not is_enabled():
+		return
+
+	call_logs = frappe.get_all(
+		CALL_LOG,
+		filters={
+			"recording_url": ("is", "set"),
+			"recording_file": ("is", "not set"),
+			"modified": (">=", add_days(now_datetime(), -FETCH_WINDOW_DAYS)),
+		},
+		order_by="modified desc",
+		limit=FETCH_BATCH_SIZE,
+		pluck="name",
+	)
+
+	for call_log in call_logs:
+		fetch_recording(call_log)
+		frappe.db.commit()
+
+
+def trim_recording_cache():
+	"""Scheduled job: delete the oldest cached recordings until the cache fits its size limit."""
+	limit = cint(frappe.db.get_single_value("FCRM Settings", "recording_cache_size")) * 1024 * 1024
+	if not limit:
+		return
+
+	# newest first, everything past the limit goes; files sharing content are stored once on
+	# disk, so they are counted once
+	files = frappe.db.sql(
+		"""
+		select f.content_hash, max(f.file_size) as size, group_concat(f.name) as names
+		from `tabFile` f
+		where f.attached_to_doctype = %s and f.attached_to_field = 'recording_file'
+		group by f.content_hash
+		order by max(f.creation) desc
+		""",
+		CALL_LOG,
+		as_dict=True,
+	)
+
+	total = 0
+	for file in files:
+		total += cint(file.size)
+		if total <= limit:
+			continue
+
+		for name in file.names.split(","):
+			frappe.db.set_value(
+				CALL_LOG, {"recording_file": name}, "recording_file", None, update_modified=False
+			)
+			frappe.delete_doc("File", name, ignore_permissions=True, force=True)
+		frappe.db.commit()
+
+
+@frappe.whitelist()
+def stream_recording(call_log):
+	"""Serve the cached recording of a call log, with support for HTTP range requests."""
+	frappe.has_permission(CALL_LOG, doc=call_log, throw=True)
+
+	file_name = frappe.db.get_value(CALL_LOG, call_log, "recording_file")
+	if not file_name:
+		frappe.throw(_("Recording is not available"), frappe.DoesNotExistError)
+
+	file = frappe.get_doc("File", file_name)
+	path = file.get_full_path()
+	if not os.path.exists(path):
+		frappe.throw(_("Recording is not available"), frappe.DoesNotExistError)
+
+	return send_file(
+		path,
+		frappe.request.environ,
+		mimetype=mimetypes.guess_type(path)[0] or "audio/mpeg",
+		conditional=True,
+		max_age=86400,
+	)
@@ -4,7 +4,10 @@ import requests
 from frappe import _
 from frappe.integrations.utils import create_request_log
 
+from crm.integrations import http_client
 from crm.integrations.api import get_contact_by_phone_number
+from crm.integrations.call_events import apply_call_event, payload_digest
+from crm.integrations.telephony_log import get_log_settings, log_call_event
 
 # Endpoints for webhook
 
@@ -23,16 +26,20 @@ def handle_request(**kwargs):
 	if not is_integration_enabled():
 		return
 
-	request_log = create_request_log(
-		kwargs,
-		request_description="Exotel Call",
-		service_name="Exotel",
-		request_headers=frappe.request.headers,
-		is_remote_request=1,
-	)
+	# the whole request is only kept as an Integration Request while debug logging is on
+	request_log = None
+	if get_log_settings("Exotel")[1]:
+		request_log = create_request_log(
+			kwargs,
+			request_description="Exotel Call",
+			service_name="Exotel",
+			request_headers=frappe.request.headers,
+			is_remote_request=1,
+		)
 
 	try:
-		request_log.status = "Completed"
+		if request_log:
+			request_log.status = "Completed"
 		exotel_settings = get_exotel_settings()
 		if not exotel_settings.enabled:
 			return
@@ -44,25 +51,19 @@ def handle_request(**kwargs):
 		if status == "free":
 			return
 
-		if call_log := get_call_log(call_payload):
-			update_call_log(call_payload, call_log=call_log)
-		else:
-			create_call_log(
-				call_id=call_payload.get("CallSid"),
-				from_number=call_payload.get("CallFrom"),
-				to_number=call_payload.get("DialWhomNumber"),
-				medium=call_payload.get("To"),
-				status=get_call_log_status(call_payload),
-				agent=call_payload.get("AgentEmail"),
-			)
+		call_log = update_call_log(call_payload)
+		log_call_event("Exotel", "call_webhook", call_payload, call_log_status=call_log and call_log.status)
 	except Exception:
-		request_log.status = "Failed"
-		request_log.error = frappe.get_traceback()
+		if request_log:
+			request_log.status = "Failed"
+			request_log.error = frappe.get_traceback()
 		frappe.db.rollback()
 		frappe.log_error(title="Error while creating/updating call record")
+		log_call_event("Exotel", "call_webhook_failed", kwargs, level="error")
 		frappe.db.commit()
 	finally:
-		request_log.save(ignore_permissions=True)
+		if request_log:
+			request_log.save(ignore_permissions=True)
 		frappe.db.commit()
 
 
@@ -96,8 +97,10 @@ def make_a_call(to_number, from_number=None, caller_id=None):
 	record_call = frappe.db.get_single_value("CRM Exotel Settings", "record_call")
 
 	try:
-		response = requests.post(
+		response = http_client.post(
+			"Exotel",
 			endpoint,
+			endpoint="make_call",
 			data={
 				"From": from_number,
 				"To": to_number,
@@ -144,7 +147,7 @@ def get_exotel_endpoint(action=None, version="v1"):
 
 def get_all_exophones():
 	endpoint = get_exotel_endpoint("IncomingPhoneNumbers", "v2_beta")
-	response = requests.get(endpoint)
+	response = http_client.get("Exotel", endpoint, endpoint="incoming_phone_numbers")
 	return [phone.get("friendly_name") for phone in response.json().get("incoming_phone_numbers", [])]
 
 
@@ -185,25 +188,18 @@ def create_call_log(
 	status="Ringing",
 	call_type="Incoming",
 ):
-	call_log = frappe.new_doc("CRM Call Log")
-	call_log.id = call_id
-	call_log.to = to_number
-	call_log.medium = medium
-	call_log.type = call_type
-	call_log.status = status
-	call_log.telephony_medium = "Exotel"
-	setattr(call_log, "from", from_number)
-
-	if call_type == "Incoming":
-		call_log.receiver = agent
-	else:
-		call_log.caller = agent
+	values = {"from": from_number, "to": to_number, "medium": medium, "type": call_type}
+	values["receiver" if call_type == "Incoming" else "caller"] = agent
 
 	# link call log with lead/deal
 	contact_number = from_number if call_type == "Incoming" else to_number
-	link(contact_number, call_log)
-
-	call_log.save(ignore_permissions=True)
+	call_log = apply_call_event(
+		call_id,
+		status,
+		values,
+		defaults={"telephony_medium": "Exotel"},
+		on_create=lambda doc: link(contact_number, doc),
+	)
 	frappe.db.commit()
 	return call_log
 
@@ -259,30 +255,45 @@ def get_call_log_status(call_payload, direction="inbound"):
 	return status
 
 
-def update_call_log(call_payload, status="Ringing", call_log=None):
+def get_call_event(call_payload):
+	"""Return the call log status and fields carried by an Exotel status callback."""
 	direction = call_payload.get("Direction")
-	call_log = call_log or get_call_log(call_payload)
 	status = get_call_log_status(call_payload, direction)
+	values = {
+		# resetting this because call might be redirected to other number
+		"to": call_payload.get("DialWhomNumber") or call_payload.get("To"),
+		"duration": call_payload.get("DialCallDuration") or call_payload.get("ConversationDuration"),
+		"recording_url": call_payload.get("RecordingUrl"),
+		"start_time": call_payload.get("StartTime"),
+		"end_time": call_payload.get("EndTime"),
+	}
+	if direction == "incoming" and call_payload.get("AgentEmail"):
+		values["receiver"] = call_payload.get("AgentEmail")
+
+	return status, values
+
+
+def update_call_log(call_payload):
+	"""Apply an Exotel status callback to its call log, creating the call log on the first event."""
+	status, values = get_call_event(call_payload)
+	from_number = call_payload.get("CallFrom")
 	try:
-		if call_log:
-			call_log.status = status
-			# resetting this because call might be redirected to other number
-			call_log.to = call_payload.get("DialWhomNumber") or call_payload.get("To")
-			call_log.duration = (
-				call_payload.get("DialCallDuration") or call_payload.get("ConversationDuration") or 0
-			)
-			call_log.recording_url = (
-				call_payload.get("RecordingUrl") if call_payload.get("RecordingUrl") else ""
-			)
-			call_log.start_time = call_payload.get("StartTime")
-			call_log.end_time = call_payload.get("EndTime")
-
-			if direction == "incoming" and call_payload.get("AgentEmail"):
-				call_log.receiver = call_payload.get("AgentEmail")
-
-			call_log.save(ignore_permissions=True)
-			frappe.db.commit()
-			return call_log
+		call_log = apply_call_event(
+			call_payload.get("CallSid"),
+			status,
+			values,
+			defaults={
+				"from": from_number,
+				"medium": call_payload.get("To"),
+				"type": "Incoming",
+				"telephony_medium": "Exotel",
+				"receiver": call_payload.get("AgentEmail"),
+			},
+			on_create=lambda doc: link(from_number, doc),
+			event_key=payload_digest(call_payload),
+		)
+		frappe.db.commit()
+		return call_log
 	except Exception:
 		frappe.log_error(title="Error while updating call record")
 		frappe.db.commit()
@@ -0,0 +1,248 @@
+"""
+Shared HTTP client for outbound integrations (Interakt, Exotel, Tata Tele, Facebook, exchange rates).
+
+- one `requests.Session` per site, provider and worker process, so connections are pooled per
+  host and kept alive between calls instead of paying a TCP and TLS handshake on every request,
+  and no cookie set for one site is sent for another
+- a default timeout on every request
+- retries with exponential backoff; requests that are not idempotent (POST) are only retried
+  when the provider cannot have received them (connect timeout) or refused them (429, 503)
+- a circuit breaker per provider endpoint: after repeated failures calls fail fast with
+  `CircuitOpenError` for a cool-down period instead of piling up on a provider that is down
+- latency and error counters per provider endpoint, see `get_http_metrics`
+
+`CircuitOpenError` is a `requests.exceptions.ConnectionError`, so callers that already handle
+`requests` errors keep working unchanged.
+"""
+
+import os
+import random
+import threading
+import time
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 30
+POOL_MAXSIZE = 10
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+RETRY_STATUSES = (429, 502, 503, 504)
+# Statuses meaning the request was not processed, safe to retry for any method
+REFUSED_STATUSES = (429, 503)
+DEFAULT_RETRIES = 2
+BACKOFF_SECONDS = 0.5
+
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 30
+
+METRICS_TTL = 7 * 24 * 60 * 60
+SLOW_REQUEST_MS = 1000
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+	pass
+
+
+# (site, provider) -> requests.Session
+_sessions = {}
+_sessions_pid = None
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_session(provider):
+	"""Return the pooled session of a provider for the current site and process."""
+	global _sessions_pid
+
+	key = (getattr(frappe.local, "site", None), provider)
+	with _lock:
+		# sessions are not shared with forked workers
+		if _sessions_pid != os.getpid():
+			_sessions.clear()
+			_sessions_pid = os.getpid()
+
+		if key not in _sessions:
+			session = requests.Session()
+			adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+			session.mount("https://", adapter)
+			session.mount("http://", adapter)
+			_sessions[key] = session
+
+		return _sessions[key]
+
+
+class CircuitBreaker:
+	"""Consecutive-failure breaker: open after `threshold` failures, let one call through after the cool-down."""
+
+	def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+		self.threshold = threshold
+		self.cooldown = cooldown
+		self.failures = 0
+		self.opened_at = None
+		self.lock = threading.Lock()
+
+	def allow(self):
+		with self.lock:
+			if self.opened_at is None:
+				return True
+			if time.monotonic() - self.opened_at >= self.cooldown:
+				# half open: one trial call, a failure opens the breaker again
+				self.opened_at = time.monotonic()
+				return True
+			return False
+
+	def record(self, ok):
+		with self.lock:
+			if ok:
+				self.failures = 0
+				self.opened_at = None
+			else:
+				self.failures += 1
+				if self.failures >= self.threshold:
+					self.opened_at = time.monotonic()
+
+
+def get_breaker(provider, endpoint):
+	key = (provider, endpoint)
+	if key not in _breakers:
+		with _lock:
+			_breakers.setdefault(key, CircuitBreaker())
+	return _breakers[key]
+
+
+def request(
+	provider, method, url, *, endpoint=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, **kwargs
+):
+	"""
+	Make an HTTP request to an integration provider.
+
+	:param provider: Provider name, e.g. "Interakt"; selects the connection pool
+	:param endpoint: Short endpoint name for metrics and the circuit breaker, e.g. "send_message".
+	        Never pass the URL, it may contain ids or credentials.
+	:param retries: Retries after the first attempt, see the module docstring for which are retried
+	:return: `requests.Response`; HTTP error statuses are returned, not raised
+	"""
+	method = method.upper()
+	endpoint = endpoint or method.lower()
+	breaker = get_breaker(provider, endpoint)
+	session = get_session(provider)
+	idempotent = method in IDEMPOTENT_METHODS
+
+	attempt = 0
+	while True:
+		if not breaker.allow():
+			record_metrics(provider, endpoint, 0, error=True)
+			raise CircuitOpenError(f"{provider} {endpoint} is failing, retry later")
+
+		start = time.monotonic()
+		try:
+			response = session.request(method, url, timeout=timeout, **kwargs)
+		except requests.exceptions.RequestException as e:
+			elapsed = (time.monotonic() - start) * 1000
+			breaker.record(ok=False)
+			record_metrics(provider, endpoint, elapsed, error=True)
+
+			safe_to_retry = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+			if attempt < retries and safe_to_retry:
+				attempt += 1
+				sleep_before_retry(attempt)
+				continue
+			raise
+
+		elapsed = (time.monotonic() - start) * 1000
+		failed = response.status_code in RETRY_STATUSES or response.status_code >= 500
+		breaker.record(ok=not failed)
+		record_metrics(provider, endpoint, elapsed, error=failed)
+
+		safe_to_retry = idempotent or response.status_code in REFUSED_STATUSES
+		if failed and attempt < retries and safe_to_retry:
+			attempt += 1
+			sleep_before_retry(attempt, response.headers.get("Retry-After"))
+			continue
+
+		return response
+
+
+def get(provider, url, **kwargs):
+	return request(provider, "GET", url, **kwargs)
+
+
+def post(provider, url, **kwargs):
+	return request(provider, "POST", url, **kwargs)
+
+
+def get_json(provider, url, **kwargs):
+	"""GET a JSON document, raising `requests.HTTPError` for error statuses."""
+	response = get(provider, url, **kwargs)
+	response.raise_for_status()
+	return response.json()
+
+
+def sleep_before_retry(attempt, retry_after=None):
+	try:
+		delay = float(retry_after)
+	except (TypeError, ValueError):
+		delay = BACKOFF_SECONDS * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+	time.sleep(min(delay, 10))
+
+
+def _metrics_key(provider, endpoint):
+	return frappe.cache.make_key(f"crm:http_metrics:{provider}:{endpoint}")
+
+
+def _metrics_index_key():
+	return frappe.cache.make_key("crm:http_metrics")
+
+
+def record_metrics(provider, endpoint, elapsed_ms, error=False):
+	"""Add one request to the counters of a provider endpoint; metrics never fail the request."""
+	try:
+		key = _metrics_key(provider, endpoint)
+		pipe = frappe.cache.pipeline()
+		pipe.hincrby(key, "requests", 1)
+		pipe.hincrbyfloat(key, "total_ms", round(elapsed_ms, 2))
+		if error:
+			pipe.hincrby(key, "errors", 1)
+		if elapsed_ms >= SLOW_REQUEST_MS:
+			pipe.hincrby(key, "slow", 1)
+		pipe.sadd(_metrics_index_key(), f"{provider}:{endpoint}")
+		pipe.expire(key, METRICS_TTL)
+		pipe.execute()
+	except Exception:
+		pass
+
+
+@frappe.whitelist()
+def get_http_metrics():
+	"""Request count, error count, slow requests and average latency per provider endpoint."""
+	frappe.only_for("System Manager")
+
+	# read through the raw client like the counters are written: the `frappe.cache` helpers would
+	# prefix the keys a second time and unpickle the plain numbers
+	pipe = frappe.cache.pipeline()
+	pipe.smembers(_metrics_index_key())
+	members = sorted(frappe.safe_decode(member) for member in pipe.execute()[0])
+	endpoints = [member.split(":", 1) for member in members]
+	for provider, endpoint in endpoints:
+		pipe.hgetall(_metrics_key(provider, endpoint))
+
+	metrics = []
+	for (provider, endpoint), raw in zip(endpoints, pipe.execute(), strict=True):
+		values = {frappe.safe_decode(k): float(v) for k, v in raw.items()}
+		if not values:
+			continue
+
+		count = int(values.get("requests", 0))
+		metrics.append(
+			{
+				"provider": provider,
+				"endpoint": endpoint,
+				"requests": count,
+				"errors": int(values.get("errors", 0)),
+				"slow": int(values.get("slow", 0)),
+				"average_ms": values.get("total_ms", 0) / count if count else 0,
+			}
+		)
+	return metrics
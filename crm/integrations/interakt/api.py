@@ -1,8 +1,13 @@
+import hashlib
 import json
 import re
 
 import frappe
 from frappe import _
+from frappe.utils import add_to_date, cint, get_datetime, now_datetime
+
+from crm.fcrm.doctype.whatsapp_templates.whatsapp_templates import clear_template_cache, get_cached_templates
+from crm.integrations.outbox import queue_message
 
 from .interakt_handler import Interakt
 from .utils import (
@@ -11,6 +16,10 @@ from .utils import (
 	get_lead_phone_number,
 )
 
+# The scheduled template sync skips its run when templates were synced more recently than this
+TEMPLATE_SYNC_INTERVAL_MINUTES = 50
+MAX_TEMPLATE_PAGES = 100
+
 
 def send_welcome_message_to_lead_hook(doc, method):
 	"""
@@ -21,19 +30,112 @@ def send_welcome_message_to_lead_hook(doc, method):
 	:param method: Method name (after_insert)
 	"""
 	# Check if Interakt is enabled and auto-send is enabled
-	settings = frappe.get_single("CRM Interakt Settings")
+	settings = frappe.get_cached_doc("CRM Interakt Settings")
 	if not settings.enabled or not settings.send_welcome_on_lead_create:
 		return
-	
-	# Send welcome message directly (not enqueued to avoid job queue issues)
-	try:
-		send_welcome_message_to_lead(doc.name)
-	except Exception as e:
-		frappe.log_error(
-			title="Error in welcome message hook",
-			message=f"Lead: {doc.name}\nError: {str(e)}"
+
+	# Only queue the message here, the outbox worker sends it after the lead is committed
+	phone_number = doc.mobile_no or doc.phone
+	if not phone_number:
+		return
+
+	country_code, clean_phone = get_country_code_and_phone(
+		phone_number, settings.default_country_code or "+91"
+	)
+	full_name = " ".join(filter(None, [doc.first_name, doc.last_name])) or "Seller"
+	template_name, message = get_welcome_template(settings, doc.name, full_name)
+
+	queue_message(
+		"Interakt",
+		"CRM Lead",
+		doc.name,
+		clean_phone,
+		country_code=country_code,
+		template_name=template_name,
+		message=message,
+		idempotency_key=f"lead_welcome_{doc.name}",
+	)
+
+
+def get_welcome_template(settings, lead_name, full_name):
+	"""
+	Return the welcome template name and its arguments for a lead.
+
+	:param settings: CRM Interakt Settings
+	:return: Tuple of (template_name, dict of header_values, body_values, file_name, callback_data)
+	"""
+	welcome_template = getattr(settings, "welcome_template_name", None) or "seller_registration"
+	welcome_header_url = getattr(settings, "welcome_header_url", None) or ""
+	welcome_header_filename = getattr(settings, "welcome_header_filename", None) or ""
+
+	# Build header_values and file_name only if configured
+	return welcome_template, {
+		"header_values": [welcome_header_url] if welcome_header_url else None,
+		"body_values": [full_name],
+		"file_name": welcome_header_filename if welcome_header_filename else None,
+		"callback_data": f"lead_welcome_{lead_name}",
+	}
+
+
+def send_outbox_message(outbox):
+	"""
+	Send a `CRM Message Outbox` entry through Interakt and log it as a WhatsApp message.
+	Called by the outbox worker, see `crm.integrations.outbox`.
+	"""
+	interakt = Interakt.connect()
+	if not interakt:
+		return {"success": False, "error": "Interakt is not enabled", "retryable": False}
+
+	message = json.loads(outbox.message or "{}")
+	if outbox.message_type == "Text":
+		result = interakt.send_text_message(
+			phone_number=f"{outbox.country_code}{outbox.phone_number}",
+			message_text=message.get("message_text"),
+			callback_data=message.get("callback_data"),
+		)
+	else:
+		result = interakt.send_template_message(
+			phone_number=outbox.phone_number,
+			country_code=outbox.country_code,
+			template_name=outbox.template_name,
+			language_code=outbox.language_code or "en",
+			**message,
 		)
 
+	if result.get("success"):
+		result["whatsapp_message"] = create_whatsapp_message_log(
+			message_id=result.get("message_id"),
+			phone_number=outbox.phone_number,
+			country_code=outbox.country_code,
+			template_name=outbox.template_name,
+			template_language=outbox.language_code,
+			reference_doctype=outbox.reference_doctype,
+			reference_docname=outbox.reference_docname,
+			sent_by=outbox.sent_by,
+			status="Sent",
+			message_content=message.get("message_text"),
+		)
+
+	return result
+
+
+def outbox_message_failed(outbox):
+	"""Log an outbox entry that could not be sent as a failed WhatsApp message."""
+	message = json.loads(outbox.message or "{}")
+	create_whatsapp_message_log(
+		message_id=None,
+		phone_number=outbox.phone_number,
+		country_code=outbox.country_code,
+		template_name=outbox.template_name,
+		template_language=outbox.language_code,
+		reference_doctype=outbox.reference_doctype,
+		reference_docname=outbox.reference_docname,
+		sent_by=outbox.sent_by,
+		status="Failed",
+		message_content=message.get("message_text"),
+		error_message=outbox.error_message,
+	)
+
 
 @frappe.whitelist()
 def is_enabled():
@@ -71,13 +173,7 @@ def send_welcome_message_to_lead(lead_name):
 
 		# Get template settings from CRM Interakt Settings
 		settings = frappe.get_single("CRM Interakt Settings")
-		welcome_template = getattr(settings, "welcome_template_name", None) or "seller_registration"
-		welcome_header_url = getattr(settings, "welcome_header_url", None) or ""
-		welcome_header_filename = getattr(settings, "welcome_header_filename", None) or ""
-
-		# Build header_values and file_name only if configured
-		header_values = [welcome_header_url] if welcome_header_url else None
-		file_name = welcome_header_filename if welcome_header_filename else None
+		welcome_template, message = get_welcome_template(settings, lead_name, full_name)
 
 		# Send template message
 		result = interakt.send_template_message(
@@ -85,10 +181,7 @@ def send_welcome_message_to_lead(lead_name):
 			country_code=country_code,
 			template_name=welcome_template,
 			language_code="en",
-			header_values=header_values,
-			body_values=[full_name],
-			file_name=file_name,
-			callback_data=f"lead_welcome_{lead_name}",
+			**message,
 		)
 
 		if result.get("success"):
@@ -211,6 +304,7 @@ def create_whatsapp_message_log(
 	sent_by,
 	status="Pending",
 	message_content=None,
+	error_message=None,
 ):
 	"""Create a WhatsApp message log entry."""
 	try:
@@ -228,6 +322,8 @@ def create_whatsapp_message_log(
 				"reference_docname": reference_docname,
 				"sent_by": sent_by,
 				"message_content": message_content,
+				"error_message": error_message,
+				"failed_at": frappe.utils.now() if status == "Failed" else None,
 			}
 		)
 		doc.insert(ignore_permissions=True)
@@ -258,21 +354,27 @@ def get_message_status(message_id):
 
 
 @frappe.whitelist()
-def get_whatsapp_messages(reference_doctype, reference_docname):
+def get_whatsapp_messages(reference_doctype, reference_docname, limit=None, before=None):
 	"""
 	Get all WhatsApp messages for a specific document (Lead/Deal/Contact).
 	Returns data in format compatible with frontend WhatsAppArea component.
 	
 	:param reference_doctype: DocType (e.g., 'CRM Lead')
 	:param reference_docname: Document name (e.g., 'LEAD-00001')
-	:return: List of messages in frontend-compatible format
+	:param limit: Only return the latest `limit` messages
+	:param before: Only return messages created before this (`creation` of the oldest message loaded)
+	:return: List of messages in frontend-compatible format, oldest first
 	"""
+	filters = {
+		"reference_doctype": reference_doctype,
+		"reference_docname": reference_docname,
+	}
+	if before:
+		filters["creation"] = ("<", before)
+
 	messages = frappe.get_all(
 		"CRM WhatsApp Message",
-		filters={
-			"reference_doctype": reference_doctype,
-			"reference_docname": reference_docname,
-		},
+		filters=filters,
 		fields=[
 			"name",
 			"message_id",
@@ -290,8 +392,13 @@ def get_whatsapp_messages(reference_doctype, reference_docname):
 			"delivered_at",
 			"read_at",
 		],
-		order_by="creation asc",
+		order_by="creation desc",
+		limit=cint(limit) or None,
 	)
+	messages.reverse()
+
+	# Load every template used in the conversation at once
+	templates = get_cached_templates(msg.template_name for msg in messages)
 
 	# Transform to frontend format
 	formatted_messages = []
@@ -318,18 +425,11 @@ def get_whatsapp_messages(reference_doctype, reference_docname):
 		# Add template details if it's a template message
 		if msg.template_name:
 			formatted_msg["template_name"] = msg.template_name
-			# Look up full template body from WhatsApp Templates for hover preview
-			tpl_body = ""
-			tpl_header = ""
-			tpl_footer = ""
-			if frappe.db.exists("WhatsApp Templates", msg.template_name):
-				tpl = frappe.get_doc("WhatsApp Templates", msg.template_name)
-				tpl_body = tpl.body_text or tpl.template or ""
-				tpl_header = tpl.header_text or ""
-				tpl_footer = tpl.footer or ""
-			formatted_msg["template_body"] = tpl_body
-			formatted_msg["header"] = tpl_header
-			formatted_msg["footer"] = tpl_footer
+			# Full template body from WhatsApp Templates for hover preview
+			tpl = templates.get(msg.template_name) or {}
+			formatted_msg["template_body"] = tpl.get("body", "")
+			formatted_msg["header"] = tpl.get("header", "")
+			formatted_msg["footer"] = tpl.get("footer", "")
 		
 		formatted_messages.append(formatted_msg)
 
@@ -499,103 +599,198 @@ def _normalize_buttons(buttons_raw):
 def sync_interakt_templates():
 	"""
 	Sync WhatsApp templates from Interakt to local WhatsApp Templates doctype.
-	Fetches all templates and upserts them locally.
+	Fetches every page of templates and only writes new and changed ones, see `sync_templates`.
 	"""
 	interakt = Interakt.connect()
 	if not interakt:
 		frappe.throw(_("Interakt is not enabled"))
 
-	result = interakt.get_templates()
+	return sync_templates(interakt)
 
-	# Log raw JSON response to console
-	print("="*80)
-	print("[INTERAKT SYNC TEMPLATES] Raw API Response:")
-	print(json.dumps(result, indent=2, default=str))
-	print("="*80)
-	frappe.logger().info(f"[INTERAKT SYNC TEMPLATES] Response: {json.dumps(result, indent=2, default=str)}")
 
-	if not result.get("success"):
-		return {
-			"success": False,
-			"error": result.get("error", "Failed to fetch templates from Interakt"),
-		}
+def sync_interakt_templates_job():
+	"""Scheduled job: sync templates, unless they were synced a moment ago (e.g. by hand)."""
+	interakt = Interakt.connect()
+	if not interakt:
+		return
 
-	# Extract actual template list from nested response
-	templates = _extract_templates_from_response(result)
-	print(f"[INTERAKT SYNC] Extracted {len(templates)} templates to sync")
-	synced = 0
-	errors = []
+	synced_at = frappe.db.get_single_value("CRM Interakt Settings", "templates_synced_at")
+	if synced_at and get_datetime(synced_at) > add_to_date(
+		now_datetime(), minutes=-TEMPLATE_SYNC_INTERVAL_MINUTES
+	):
+		return
 
-	for tpl in templates:
-		try:
-			template_name = tpl.get("name") or tpl.get("display_name")
-			if not template_name:
-				continue
-
-			body_text = tpl.get("body") or ""
-			variable_count = _count_body_variables(body_text)
-			buttons_json = _normalize_buttons(tpl.get("buttons"))
-
-			# Map Interakt approval_status to local status
-			approval_status = tpl.get("approval_status", "")
-			status_map = {
-				"APPROVED": "APPROVED",
-				"PENDING": "PENDING",
-				"REJECTED": "REJECTED",
-			}
-			local_status = status_map.get(approval_status, approval_status or "PENDING")
-
-			# Map header_format
-			header_format = tpl.get("header_format") or ""
-			if header_format and header_format.upper() in ("TEXT", "IMAGE", "DOCUMENT", "VIDEO"):
-				header_format = header_format.upper()
-			else:
-				header_format = ""
-
-			values = {
-				"status": local_status,
-				"category": tpl.get("category") or "",
-				"language_code": tpl.get("language") or "en",
-				"template": body_text,
-				"body_text": body_text,
-				"footer": tpl.get("footer") or "",
-				"header_text": tpl.get("header") or "",
-				"header_type": header_format or "",
-				"header_format": header_format,
-				"interakt_template_id": tpl.get("id") or "",
-				"buttons": buttons_json or "",
-				"variable_count": variable_count,
-				"last_synced": frappe.utils.now(),
-			}
+	sync_templates(interakt)
 
-			if frappe.db.exists("WhatsApp Templates", template_name):
-				doc = frappe.get_doc("WhatsApp Templates", template_name)
-				doc.update(values)
-				doc.save(ignore_permissions=True)
-			else:
-				doc = frappe.get_doc({
-					"doctype": "WhatsApp Templates",
-					"template_name": template_name,
-					**values,
-				})
-				doc.insert(ignore_permissions=True)
 
-			synced += 1
+def sync_templates(interakt):
+	"""
+	Bring WhatsApp Templates in line with the templates on Interakt, in one transaction.
 
+	A hash of the synced fields is kept on each template, templates whose hash did not change
+	are not written at all. New templates are bulk inserted and changed ones bulk updated,
+	bypassing document validation. Templates that came from Interakt but are not returned
+	anymore are flagged as stale instead of deleted, old messages still render with them.
+	"""
+	started_at = now_datetime()
+	templates, error = fetch_all_templates(interakt)
+	if error:
+		return {"success": False, "error": error}
+
+	existing = {
+		row.name: row
+		for row in frappe.get_all(
+			"WhatsApp Templates", fields=["name", "content_hash", "is_stale", "interakt_template_id"]
+		)
+	}
+
+	new_rows, updates, errors = [], {}, []
+	for template_name, tpl in templates.items():
+		try:
+			values = _template_values(tpl)
 		except Exception as e:
-			tpl_name = tpl.get("name", "unknown")
-			frappe.log_error(
-				title=f"Error syncing template: {tpl_name}",
-				message=str(e),
-			)
-			errors.append(f"{tpl_name}: {str(e)}")
+			frappe.log_error(title=f"Error syncing template: {template_name}", message=str(e))
+			errors.append(f"{template_name}: {str(e)}")
+			continue
+
+		values["content_hash"] = _template_hash(values)
+		values["is_stale"] = 0
+		values["last_synced"] = started_at
+
+		row = existing.get(template_name)
+		if not row:
+			new_rows.append((template_name, values))
+		elif row.content_hash != values["content_hash"] or row.is_stale:
+			updates[template_name] = values
+
+	stale = [
+		name
+		for name, row in existing.items()
+		if row.interakt_template_id and not row.is_stale and name not in templates
+	]
 
-	frappe.db.commit()
+	try:
+		_insert_templates(new_rows, started_at)
+		if updates:
+			frappe.db.bulk_update("WhatsApp Templates", updates, modified=started_at)
+		if stale:
+			frappe.db.sql(
+				"update `tabWhatsApp Templates` set is_stale = 1, modified = %s where name in %s",
+				(started_at, tuple(stale)),
+			)
+		frappe.db.set_single_value("CRM Interakt Settings", "templates_synced_at", started_at)
+		clear_template_cache()
+		frappe.db.commit()
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(title="Interakt template sync failed", message=str(e))
+		return {"success": False, "error": str(e)}
 
 	return {
 		"success": True,
-		"synced": synced,
+		"synced": len(templates) - len(errors),
 		"total": len(templates),
+		"added": len(new_rows),
+		"updated": len(updates),
+		"stale": len(stale),
 		"errors": errors,
 	}
 
+
+def fetch_all_templates(interakt):
+	"""
+	Page through the templates on Interakt.
+
+	:return: Tuple of (dict of template name -> template, error message or None)
+	"""
+	templates, offset = {}, 0
+	for _page in range(MAX_TEMPLATE_PAGES):
+		result = interakt.get_templates(offset=offset)
+		if not result.get("success"):
+			return None, result.get("error") or "Failed to fetch templates from Interakt"
+
+		page = _extract_templates_from_response(result)
+		new = {}
+		for tpl in page:
+			name = tpl.get("name") or tpl.get("display_name")
+			if name and name not in templates:
+				new[name] = tpl
+
+		# an empty page, or the same page again when the offset is ignored
+		if not new:
+			break
+
+		templates.update(new)
+		offset += len(page)
+		total = _get_template_count(result)
+		if total is not None and offset >= total:
+			break
+
+	return templates, None
+
+
+def _get_template_count(result):
+	"""Total number of templates, when Interakt's response includes it."""
+	raw_templates = result.get("templates")
+	if raw_templates and isinstance(raw_templates, list) and isinstance(raw_templates[0], dict):
+		if "count" in raw_templates[0] and "results" in raw_templates[0]:
+			return cint(raw_templates[0]["count"])
+	return None
+
+
+def _template_values(tpl):
+	"""WhatsApp Templates fields of an Interakt template."""
+	body_text = tpl.get("body") or ""
+
+	# Map Interakt approval_status to local status
+	approval_status = tpl.get("approval_status", "")
+	status_map = {
+		"APPROVED": "APPROVED",
+		"PENDING": "PENDING",
+		"REJECTED": "REJECTED",
+	}
+	local_status = status_map.get(approval_status, approval_status or "PENDING")
+
+	# Map header_format
+	header_format = tpl.get("header_format") or ""
+	if header_format and header_format.upper() in ("TEXT", "IMAGE", "DOCUMENT", "VIDEO"):
+		header_format = header_format.upper()
+	else:
+		header_format = ""
+
+	return {
+		"status": local_status,
+		"category": tpl.get("category") or "",
+		"language_code": tpl.get("language") or "en",
+		"template": body_text,
+		"body_text": body_text,
+		"footer": tpl.get("footer") or "",
+		"header_text": tpl.get("header") or "",
+		"header_type": header_format or "",
+		"header_format": header_format,
+		"interakt_template_id": tpl.get("id") or "",
+		"buttons": _normalize_buttons(tpl.get("buttons")) or "",
+		"variable_count": _count_body_variables(body_text),
+	}
+
+
+def _template_hash(values):
+	return hashlib.md5(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _insert_templates(new_rows, now):
+	if not new_rows:
+		return
+
+	fields = ["name", "creation", "modified", "owner", "modified_by", "docstatus", "idx", "template_name"]
+	value_fields = list(new_rows[0][1])
+	user = frappe.session.user
+	frappe.db.bulk_insert(
+		"WhatsApp Templates",
+		fields + value_fields,
+		[
+			(name, now, now, user, user, 0, 0, name, *(values[field] for field in value_fields))
+			for name, values in new_rows
+		],
+	)
+
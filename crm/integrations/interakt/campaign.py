@@ -0,0 +1,328 @@
+"""
+Bulk WhatsApp template campaigns through Interakt.
+
+A `CRM WhatsApp Campaign` sends one template to every lead or deal matching its filters. The
+`run_campaign` job walks the recipients in name order, one batch at a time:
+
+1. read the batch with its phone numbers and body fields in one query, skipping numbers this
+   campaign already messaged
+2. insert a Pending `CRM WhatsApp Message` log per recipient in one statement, move the campaign
+   checkpoint (`last_processed`) past the batch and commit
+3. send the batch from a pool of worker threads, paced to the campaign's messages per second;
+   the threads only make HTTP requests, the database is only used from the job itself
+4. write the results back to the logs in one statement and commit
+
+A job that dies mid batch resumes after the checkpoint. Logs the interrupted batch left Pending
+are marked Failed rather than sent again, so a recipient is never messaged twice.
+
+Campaign logs are bulk inserted, so unlike single messages they are not pushed to open
+timelines in realtime.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+import requests
+from frappe import _
+from frappe.utils import cint, flt, now_datetime
+
+from .interakt_handler import Interakt, is_retryable
+from .utils import get_country_code_and_phone
+
+CAMPAIGN = "CRM WhatsApp Campaign"
+MESSAGE = "CRM WhatsApp Message"
+
+BATCH_SIZE = 500
+MAX_WORKERS = 16
+INTERRUPTED_ERROR = "Interrupted before the result was recorded, not sent again"
+
+LOG_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx",
+	"status",
+	"direction",
+	"phone_number",
+	"country_code",
+	"template_name",
+	"template_language",
+	"reference_doctype",
+	"reference_docname",
+	"sent_by",
+	"callback_data",
+	"campaign_id",
+)
+
+
+class RateLimiter:
+	"""Spaces calls from any number of threads `1 / rate` seconds apart."""
+
+	def __init__(self, rate):
+		self.interval = 1 / rate if rate and rate > 0 else 0
+		self.next_at = time.monotonic()
+		self.lock = threading.Lock()
+
+	def wait(self):
+		if not self.interval:
+			return
+
+		with self.lock:
+			now = time.monotonic()
+			at = max(self.next_at, now)
+			self.next_at = at + self.interval
+
+		if at > now:
+			time.sleep(at - now)
+
+
+@frappe.whitelist()
+def start_campaign(campaign):
+	"""Queue a draft, paused or failed campaign; a paused or failed campaign resumes where it stopped."""
+	doc = frappe.get_doc(CAMPAIGN, campaign)
+	doc.check_permission("write")
+
+	if doc.status in ("Queued", "Running", "Completed"):
+		frappe.throw(_("Campaign is already {0}").format(_(doc.status)))
+	if not Interakt.connect():
+		frappe.throw(_("Interakt is not enabled"))
+
+	doc.db_set({"status": "Queued", "error_message": None})
+	frappe.enqueue(
+		run_campaign,
+		queue="long",
+		timeout=6 * 60 * 60,
+		campaign=doc.name,
+		job_id=f"crm_whatsapp_campaign::{doc.name}",
+		deduplicate=True,
+		enqueue_after_commit=True,
+	)
+	return doc.status
+
+
+@frappe.whitelist()
+def pause_campaign(campaign):
+	"""Stop a campaign after its current batch."""
+	doc = frappe.get_doc(CAMPAIGN, campaign)
+	doc.check_permission("write")
+
+	if doc.status in ("Queued", "Running"):
+		doc.db_set("status", "Paused")
+	return doc.status
+
+
+def run_campaign(campaign):
+	doc = frappe.get_doc(CAMPAIGN, campaign)
+	if doc.status not in ("Queued", "Running"):
+		return
+
+	interakt = Interakt.connect()
+	if not interakt:
+		doc.db_set({"status": "Failed", "error_message": _("Interakt is not enabled")})
+		return
+
+	if not doc.started_at:
+		total = frappe.db.count(doc.reference_doctype, doc.get_filters())
+		doc.db_set({"started_at": now_datetime(), "total_recipients": total})
+	doc.db_set("status", "Running")
+	fail_interrupted_messages(doc)
+	frappe.db.commit()
+
+	seen = set(frappe.get_all(MESSAGE, filters={"campaign_id": doc.name}, pluck="phone_number"))
+	limiter = RateLimiter(flt(doc.messages_per_second))
+	workers = min(max(cint(doc.workers), 1), MAX_WORKERS)
+
+	try:
+		with ThreadPoolExecutor(max_workers=workers) as pool:
+			while frappe.db.get_value(CAMPAIGN, doc.name, "status") == "Running":
+				recipients = get_recipients(doc)
+				if not recipients:
+					doc.db_set({"status": "Completed", "completed_at": now_datetime()})
+					break
+
+				messages = prepare_messages(doc, recipients, seen, interakt)
+				doc.db_set("last_processed", recipients[-1].name)
+				frappe.db.commit()
+
+				payloads = [message.payload for message in messages]
+				results = list(pool.map(lambda payload: send(interakt, limiter, payload), payloads))
+				record_results(doc, messages, results)
+				frappe.db.commit()
+	except Exception as e:
+		frappe.db.rollback()
+		frappe.log_error(title="WhatsApp campaign error", message=f"Campaign: {doc.name}\nError: {e!s}")
+		doc.db_set({"status": "Failed", "error_message": str(e)})
+
+	frappe.db.commit()
+
+
+def get_recipients(doc):
+	filters = doc.get_filters()
+	if doc.last_processed:
+		filters.append(["name", ">", doc.last_processed])
+
+	# the campaign runs in a background job, recipients are the records its owner may see
+	return frappe.get_list(
+		doc.reference_doctype,
+		filters=filters,
+		fields=["name", "mobile_no", "phone", *doc.get_body_fields()],
+		order_by="name asc",
+		limit=BATCH_SIZE,
+		user=doc.owner,
+	)
+
+
+def prepare_messages(doc, recipients, seen, interakt):
+	"""Insert a Pending log for every recipient not messaged yet, and build their payloads."""
+	messages = []
+	for recipient in recipients:
+		country_code, phone_number = get_country_code_and_phone(
+			recipient.mobile_no or recipient.phone, interakt.default_country_code
+		)
+		if not phone_number or phone_number in seen:
+			continue
+		seen.add(phone_number)
+
+		messages.append(
+			frappe._dict(
+				reference_docname=recipient.name,
+				phone_number=phone_number,
+				country_code=country_code,
+				payload=interakt.get_template_payload(
+					phone_number,
+					country_code=country_code,
+					template_name=doc.template_name,
+					language_code=doc.language_code or "en",
+					header_values=[doc.header_url] if doc.header_url else None,
+					body_values=[str(recipient.get(field) or "") for field in doc.get_body_fields()] or None,
+					file_name=doc.file_name,
+					callback_data=f"whatsapp_campaign_{doc.name}",
+				),
+			)
+		)
+
+	if messages:
+		insert_logs(doc, messages)
+	return messages
+
+
+def insert_logs(doc, messages):
+	now = now_datetime()
+	names = reserve_log_names(doc.reference_doctype, len(messages))
+	rows = []
+	for message, name in zip(messages, names, strict=True):
+		message.name = name
+		rows.append(
+			(
+				name,
+				now,
+				now,
+				doc.owner,
+				doc.owner,
+				0,
+				0,
+				"Pending",
+				"Outgoing",
+				message.phone_number,
+				message.country_code,
+				doc.template_name,
+				doc.language_code or "en",
+				doc.reference_doctype,
+				message.reference_docname,
+				doc.owner,
+				f"whatsapp_campaign_{doc.name}",
+				doc.name,
+			)
+		)
+
+	frappe.db.bulk_insert(MESSAGE, LOG_FIELDS, rows)
+
+
+def reserve_log_names(reference_doctype, count):
+	"""Take `count` consecutive names from the naming series of CRM WhatsApp Message in one go."""
+	prefix = f"WHATSAPP-{reference_doctype}-"
+	frappe.db.sql(
+		"insert into `tabSeries` (name, current) values (%s, 0) on duplicate key update name = name",
+		prefix,
+	)
+	current = cint(frappe.db.sql("select current from `tabSeries` where name = %s for update", prefix)[0][0])
+	frappe.db.sql("update `tabSeries` set current = current + %s where name = %s", (count, prefix))
+	return [f"{prefix}{i:05d}" for i in range(current + 1, current + count + 1)]
+
+
+def send(interakt, limiter, payload):
+	"""Send one payload; runs in a worker thread, so no database access here."""
+	limiter.wait()
+	try:
+		return interakt.post_template_payload(payload)
+	except requests.exceptions.RequestException as e:
+		return {"success": False, "error": str(e), "retryable": is_retryable(e)}
+	except Exception as e:
+		return {"success": False, "error": str(e)}
+
+
+def record_results(doc, messages, results):
+	if not messages:
+		return
+
+	now = now_datetime()
+	status, message_id, error, names = [], [], [], []
+	params = {"now": now}
+	for i, (message, result) in enumerate(zip(messages, results, strict=True)):
+		names.append(message.name)
+		params[f"n{i}"] = message.name
+		params[f"s{i}"] = "Sent" if result.get("success") else "Failed"
+		params[f"m{i}"] = result.get("message_id")
+		params[f"e{i}"] = None if result.get("success") else str(result.get("error") or "")[:1000]
+		status.append(f"when %(n{i})s then %(s{i})s")
+		message_id.append(f"when %(n{i})s then %(m{i})s")
+		error.append(f"when %(n{i})s then %(e{i})s")
+
+	params["names"] = tuple(names)
+	# assignments run left to right, so the timestamps below already see the new status
+	frappe.db.sql(
+		f"""
+		update `tabCRM WhatsApp Message` set
+			status = case name {" ".join(status)} end,
+			message_id = case name {" ".join(message_id)} end,
+			error_message = case name {" ".join(error)} end,
+			sent_at = if(status = 'Sent', %(now)s, sent_at),
+			failed_at = if(status = 'Failed', %(now)s, failed_at),
+			modified = %(now)s
+		where name in %(names)s
+		""",
+		params,
+	)
+
+	sent = sum(1 for result in results if result.get("success"))
+	frappe.db.sql(
+		"""
+		update `tabCRM WhatsApp Campaign`
+		set sent_count = sent_count + %s, failed_count = failed_count + %s, modified = %s
+		where name = %s
+		""",
+		(sent, len(results) - sent, now, doc.name),
+	)
+
+
+def fail_interrupted_messages(doc):
+	"""Mark logs a previous run left Pending as Failed; they may have been delivered already."""
+	now = now_datetime()
+	frappe.db.sql(
+		"""
+		update `tabCRM WhatsApp Message`
+		set status = 'Failed', error_message = %s, failed_at = %s, modified = %s
+		where campaign_id = %s and status = 'Pending'
+		""",
+		(INTERRUPTED_ERROR, now, now, doc.name),
+	)
+	if interrupted := frappe.db.sql("select row_count()")[0][0]:
+		frappe.db.sql(
+			"update `tabCRM WhatsApp Campaign` set failed_count = failed_count + %s where name = %s",
+			(interrupted, doc.name),
+		)
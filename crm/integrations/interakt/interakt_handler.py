@@ -3,6 +3,16 @@ import requests
 from frappe import _
 from frappe.utils.password import get_decrypted_password
 
+from crm.integrations import http_client
+
+
+def is_retryable(error):
+	"""Whether a failed request may succeed later: network errors, rate limiting and server errors."""
+	response = getattr(error, "response", None)
+	if response is None:
+		return True
+	return response.status_code == 429 or response.status_code >= 500
+
 
 class Interakt:
 	"""Interakt connector for WhatsApp messaging."""
@@ -55,6 +65,46 @@ class Interakt:
 		if not self.api_key:
 			frappe.throw(_("Interakt API Key is not configured"))
 
+		payload = self.get_template_payload(
+			phone_number,
+			country_code=country_code,
+			template_name=template_name,
+			language_code=language_code,
+			header_values=header_values,
+			body_values=body_values,
+			button_values=button_values,
+			file_name=file_name,
+			callback_data=callback_data,
+			campaign_id=campaign_id,
+		)
+
+		try:
+			return self.post_template_payload(payload)
+		except requests.exceptions.RequestException as e:
+			frappe.log_error(
+				title="Interakt API Error",
+				message=f"Error sending message: {str(e)}\nPayload: {payload}",
+			)
+			return {
+				"success": False,
+				"error": str(e),
+				"retryable": is_retryable(e),
+			}
+
+	def get_template_payload(
+		self,
+		phone_number,
+		country_code=None,
+		template_name=None,
+		language_code="en",
+		header_values=None,
+		body_values=None,
+		button_values=None,
+		file_name=None,
+		callback_data=None,
+		campaign_id=None,
+	):
+		"""Build the Interakt request payload of a template message, see `send_template_message`."""
 		# Clean phone number (remove spaces, dashes, etc.)
 		phone_number = "".join(filter(str.isdigit, str(phone_number)))
 		
@@ -92,41 +142,40 @@ class Interakt:
 		if file_name:
 			payload["template"]["fileName"] = file_name
 
-		# Make API request
+		return payload
+
+	def post_template_payload(self, payload):
+		"""
+		Send a payload built by `get_template_payload`.
+
+		Does not touch the database, so it can be called from worker threads. Request errors
+		are raised as `requests.exceptions.RequestException`.
+		"""
 		url = f"{self.base_url}/public/message/"
 		headers = {
 			"Authorization": f"Basic {self.api_key}",
 			"Content-Type": "application/json",
 		}
 
-		try:
-			response = requests.post(url, json=payload, headers=headers, timeout=30)
-			response.raise_for_status()
-			
-			result = response.json()
-			
-			if result.get("result"):
-				return {
-					"success": True,
-					"message_id": result.get("id"),
-					"message": result.get("message", "Message sent successfully"),
-				}
-			else:
-				return {
-					"success": False,
-					"error": result.get("message", "Failed to send message"),
-				}
-				
-		except requests.exceptions.RequestException as e:
-			frappe.log_error(
-				title="Interakt API Error",
-				message=f"Error sending message: {str(e)}\nPayload: {payload}",
-			)
+		response = http_client.post(
+			"Interakt", url, endpoint="send_template_message", json=payload, headers=headers, timeout=30
+		)
+		response.raise_for_status()
+
+		result = response.json()
+		if result.get("result"):
 			return {
-				"success": False,
-				"error": str(e),
+				"success": True,
+				"message_id": result.get("id"),
+				"message": result.get("message", "Message sent successfully"),
 			}
 
+		return {
+			"success": False,
+			"error": result.get("message", "Failed to send message"),
+			"retryable": False,
+		}
+
 	def track_user(
 		self,
 		phone_number,
@@ -174,7 +223,9 @@ class Interakt:
 		}
 
 		try:
-			response = requests.post(url, json=payload, headers=headers, timeout=30)
+			response = http_client.post(
+				"Interakt", url, endpoint="track_user", json=payload, headers=headers, timeout=30
+			)
 			response.raise_for_status()
 			return {"success": True, "data": response.json()}
 		except requests.exceptions.RequestException as e:
@@ -236,7 +287,9 @@ class Interakt:
 		}
 
 		try:
-			response = requests.post(url, json=payload, headers=headers, timeout=30)
+			response = http_client.post(
+				"Interakt", url, endpoint="track_event", json=payload, headers=headers, timeout=30
+			)
 			response.raise_for_status()
 			return {"success": True, "data": response.json()}
 		except requests.exceptions.RequestException as e:
@@ -295,7 +348,9 @@ class Interakt:
 			frappe.logger().info(f"Sending text message to Interakt API. URL: {url}")
 			frappe.logger().info(f"Payload: {payload}")
 			
-			response = requests.post(url, json=payload, headers=headers, timeout=30)
+			response = http_client.post(
+				"Interakt", url, endpoint="send_text_message", json=payload, headers=headers, timeout=30
+			)
 			
 			# Log the response for debugging
 			frappe.logger().info(f"Interakt API Response Status: {response.status_code}")
@@ -315,6 +370,7 @@ class Interakt:
 				return {
 					"success": False,
 					"error": result.get("message", "Failed to send message"),
+					"retryable": False,
 				}
 				
 		except requests.exceptions.RequestException as e:
@@ -351,6 +407,7 @@ class Interakt:
 			return {
 				"success": False,
 				"error": error_message,
+				"retryable": is_retryable(e),
 			}
 
 	def get_templates(self, offset=0, autosubmitted_for="all", language="all"):
@@ -384,7 +441,9 @@ class Interakt:
 			frappe.logger().info(f"Query Params: {params}")
 			
 			# Use GET request with params, not POST with json
-			response = requests.get(url, params=params, headers=headers, timeout=30)
+			response = http_client.get(
+				"Interakt", url, endpoint="get_templates", params=params, headers=headers, timeout=30
+			)
 			
 			# Log the response for debugging
 			frappe.logger().info(f"Interakt API Response Status: {response.status_code}")
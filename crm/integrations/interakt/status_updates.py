@@ -0,0 +1,249 @@
+"""
+Coalesced WhatsApp message status updates.
+
+Interakt sends a separate webhook for sent, delivered and read, for every message; a campaign
+produces bursts of them. The webhook only appends the event to a redis list. A `flush_status_updates`
+job waits `FLUSH_WINDOW_SECONDS` so the burst collects, keeps the most advanced status of
+each message and writes the whole batch with one `UPDATE ... CASE`, then notifies every affected
+conversation once.
+
+A flush moves the buffer to a processing list and deletes it only once the updates are
+committed; a flush that fails puts its events back, and processing lists left behind by a killed
+job are put back by `kick_status_updates`. A job runs at most `MAX_FLUSH_ROUNDS` windows, then
+hands over to a new one so a steady stream of webhooks cannot run it into the queue timeout.
+
+Events for a message id no row has yet are held for `UNMATCHED_GRACE_SECONDS` and retried on
+every kick: campaign messages only get their id once their whole batch is sent.
+
+A status never moves backwards, so late or repeated events are harmless.
+"""
+
+import json
+import time
+
+import frappe
+from frappe.utils import get_datetime, now_datetime
+from redis.exceptions import ResponseError
+
+BUFFER_KEY = "crm:whatsapp_status_updates"
+PROCESSING_KEY = f"{BUFFER_KEY}:processing"
+UNMATCHED_KEY = f"{BUFFER_KEY}:unmatched"
+FLUSH_JOB_ID = "crm_whatsapp_status_updates"
+FLUSH_WINDOW_SECONDS = 2
+MAX_FLUSH_ROUNDS = 60
+BATCH_SIZE = 500
+# Processing lists older than this belong to a job that died
+STALE_PROCESSING_SECONDS = 15 * 60
+UNMATCHED_GRACE_SECONDS = 30 * 60
+
+# Map Interakt status to our status
+STATUS_MAP = {
+	"sent": "Sent",
+	"delivered": "Delivered",
+	"read": "Read",
+	"failed": "Failed",
+}
+
+# Position of each status in a message's life, a message never moves to a lower rank
+STATUS_RANK = {
+	"Pending": 0,
+	"Sent": 1,
+	"Failed": 2,
+	"Delivered": 3,
+	"Read": 4,
+}
+
+
+def queue_status_update(data):
+	"""Buffer a status webhook's data and make sure a flush job is coming."""
+	message_id = data.get("message_id")
+	if not message_id:
+		return
+
+	status = (data.get("status") or "").lower()
+	event = {
+		"message_id": message_id,
+		"status": STATUS_MAP.get(status, "Sent"),
+		"delivered_at": data.get("delivered_at_utc") if status == "delivered" else None,
+		"read_at": data.get("read_at_utc") if status == "read" else None,
+		"queued_at": time.time(),
+	}
+	frappe.cache.rpush(BUFFER_KEY, json.dumps(event))
+	start_flush()
+
+
+def start_flush():
+	frappe.enqueue(
+		"crm.integrations.interakt.status_updates.flush_status_updates",
+		queue="short",
+		job_id=FLUSH_JOB_ID,
+		deduplicate=True,
+	)
+
+
+def kick_status_updates():
+	"""
+	Scheduled job: put back the events of flushes that died and the unmatched events, and flush
+	events a job did not pick up, e.g. when they came in while it was finishing.
+	"""
+	for key in frappe.cache.get_keys(f"{PROCESSING_KEY}:"):
+		key = frappe.safe_decode(key)
+		if time.time() - int(key.rsplit(":", 2)[-2]) > STALE_PROCESSING_SECONDS:
+			restore_events(key)
+	restore_events(frappe.cache.make_key(UNMATCHED_KEY))
+
+	if frappe.cache.llen(BUFFER_KEY):
+		start_flush()
+
+
+def flush_status_updates():
+	"""Apply buffered status updates, until the buffer stays empty for a window."""
+	for _round in range(MAX_FLUSH_ROUNDS):
+		time.sleep(FLUSH_WINDOW_SECONDS)
+		processing_key, events = take_buffered_events()
+		if not events:
+			return
+
+		try:
+			unmatched = []
+			updates = coalesce(events)
+			for i in range(0, len(updates), BATCH_SIZE):
+				unmatched += apply_status_updates(updates[i : i + BATCH_SIZE])
+				frappe.db.commit()
+		except Exception:
+			frappe.db.rollback()
+			restore_events(processing_key)
+			raise
+
+		hold_unmatched(unmatched)
+		frappe.cache.pipeline().delete(processing_key).execute()
+
+	# still busy: carry on in a new job, this one counts as running and would be deduplicated
+	frappe.enqueue("crm.integrations.interakt.status_updates.flush_status_updates", queue="short")
+
+
+def take_buffered_events():
+	"""
+	Atomically move every buffered event to a processing list, events pushed meanwhile go to the
+	next flush.
+
+	:return: Tuple of (redis key of the processing list, events)
+	"""
+	processing_key = frappe.cache.make_key(
+		f"{PROCESSING_KEY}:{int(time.time())}:{frappe.generate_hash(length=8)}"
+	)
+	pipe = frappe.cache.pipeline()
+	try:
+		pipe.rename(frappe.cache.make_key(BUFFER_KEY), processing_key).execute()
+	except ResponseError:
+		# nothing buffered
+		return processing_key, []
+
+	events = pipe.lrange(processing_key, 0, -1).execute()[0]
+	return processing_key, [json.loads(event) for event in events]
+
+
+def restore_events(key):
+	"""Move the events of a list, by its redis key, back to the buffer."""
+	pipe = frappe.cache.pipeline()
+	events = pipe.lrange(key, 0, -1).delete(key).execute()[0]
+	if events:
+		frappe.cache.pipeline().rpush(frappe.cache.make_key(BUFFER_KEY), *events).execute()
+
+
+def hold_unmatched(updates):
+	"""Keep the updates of messages with no row yet for `kick_status_updates`, within their grace period."""
+	events = [
+		json.dumps(update)
+		for update in updates
+		if time.time() - (update.get("queued_at") or 0) < UNMATCHED_GRACE_SECONDS
+	]
+	if events:
+		frappe.cache.pipeline().rpush(frappe.cache.make_key(UNMATCHED_KEY), *events).execute()
+
+
+def coalesce(events):
+	"""Keep the most advanced status of each message, and the first timestamp of each kind."""
+	updates = {}
+	for event in events:
+		update = updates.setdefault(event["message_id"], {"message_id": event["message_id"], "status": None})
+		if STATUS_RANK.get(event["status"], 0) > STATUS_RANK.get(update["status"], -1):
+			update["status"] = event["status"]
+		for field in ("delivered_at", "read_at"):
+			if event.get(field) and not update.get(field):
+				update[field] = event[field]
+		# the first event of a message starts its grace period when it matches no row
+		if event.get("queued_at"):
+			update["queued_at"] = min(update.get("queued_at") or event["queued_at"], event["queued_at"])
+	return list(updates.values())
+
+
+def apply_status_updates(updates):
+	"""
+	Write a batch of coalesced updates with one statement and notify their conversations.
+
+	:return: The updates whose message id matches no message
+	"""
+	if not updates:
+		return []
+
+	params = {"now": now_datetime(), "message_ids": tuple(update["message_id"] for update in updates)}
+	status_cases, delivered_cases, read_cases = [], [], []
+	for i, update in enumerate(updates):
+		params[f"id{i}"] = update["message_id"]
+		params[f"s{i}"] = update["status"]
+		params[f"r{i}"] = STATUS_RANK.get(update["status"], 0)
+		status_cases.append(f"when %(id{i})s then if(%(r{i})s > {_rank_sql('status')}, %(s{i})s, status)")
+		if update.get("delivered_at"):
+			params[f"d{i}"] = get_datetime(update["delivered_at"])
+			delivered_cases.append(f"when %(id{i})s then ifnull(delivered_at, %(d{i})s)")
+		if update.get("read_at"):
+			params[f"t{i}"] = get_datetime(update["read_at"])
+			read_cases.append(f"when %(id{i})s then ifnull(read_at, %(t{i})s)")
+
+	assignments = [f"status = case message_id {' '.join(status_cases)} else status end"]
+	if delivered_cases:
+		assignments.append(
+			f"delivered_at = case message_id {' '.join(delivered_cases)} else delivered_at end"
+		)
+	if read_cases:
+		assignments.append(f"read_at = case message_id {' '.join(read_cases)} else read_at end")
+	assignments.append("modified = %(now)s")
+
+	frappe.db.sql(
+		f"""
+		update `tabCRM WhatsApp Message`
+		set {", ".join(assignments)}
+		where message_id in %(message_ids)s
+		""",
+		params,
+	)
+
+	rows = frappe.db.sql(
+		"""
+		select message_id, reference_doctype, reference_docname
+		from `tabCRM WhatsApp Message`
+		where message_id in %(message_ids)s
+		""",
+		params,
+	)
+	conversations = {
+		(reference_doctype, reference_docname) for _id, reference_doctype, reference_docname in rows
+	}
+	for reference_doctype, reference_docname in conversations:
+		frappe.publish_realtime(
+			"whatsapp_message",
+			{
+				"reference_doctype": reference_doctype,
+				"reference_name": reference_docname,
+			},
+			after_commit=True,
+		)
+
+	matched = {row[0] for row in rows}
+	return [update for update in updates if update["message_id"] not in matched]
+
+
+def _rank_sql(column):
+	cases = " ".join(f"when {frappe.db.escape(status)} then {rank}" for status, rank in STATUS_RANK.items())
+	return f"(case {column} {cases} else -1 end)"
@@ -9,6 +9,9 @@ import frappe
 from frappe import _
 import json
 
+from crm.integrations import phone_index
+from crm.integrations.interakt.status_updates import queue_status_update
+
 
 @frappe.whitelist(allow_guest=True)
 def handle_webhook():
@@ -81,8 +84,7 @@ def handle_message_received(webhook_data):
 		clean_phone = phone_number.lstrip("+")
 		
 		# Get default country code from settings
-		settings = frappe.get_single("CRM Interakt Settings")
-		default_country_code = settings.default_country_code or "+91"
+		default_country_code = phone_index.get_default_country_code()
 		country_code_digits = default_country_code.lstrip("+")
 		
 		if clean_phone.startswith(country_code_digits):
@@ -92,7 +94,8 @@ def handle_message_received(webhook_data):
 		reference_doctype, reference_docname = find_document_by_phone(clean_phone)
 		
 		if not reference_doctype:
-			frappe.logger().error(f"WhatsApp Webhook Matching Failed: No document found for phone: {phone_number} (cleaned: {clean_phone})")
+			phone_index.record_unmatched_phone(phone_number, "WhatsApp", message.get("message"))
+			frappe.db.commit()
 			return
 		
 		frappe.logger().info(f"WhatsApp Webhook Matched: {reference_doctype} {reference_docname} for phone: {phone_number}")
@@ -158,62 +161,17 @@ def handle_status_update(webhook_data):
 			"delivered_at_utc": "2022-06-03T05:58:00.000000"
 		}
 	}
+
+	Events are buffered and applied in batches, see `crm.integrations.interakt.status_updates`.
 	"""
 	try:
 		data = webhook_data.get("data", {})
-		message_id = data.get("message_id")
-		status = data.get("status", "").lower()
-		
-		if not message_id:
+		if not data.get("message_id"):
 			frappe.logger().error("No message_id in status update")
 			return
-		
-		# Find message by message_id
-		message_name = frappe.db.get_value(
-			"CRM WhatsApp Message",
-			{"message_id": message_id},
-			"name"
-		)
-		
-		if not message_name:
-			frappe.logger().info(f"Message not found: {message_id}")
-			return
-		
-		# Update status
-		doc = frappe.get_doc("CRM WhatsApp Message", message_name)
-		
-		# Map Interakt status to our status
-		status_map = {
-			"sent": "Sent",
-			"delivered": "Delivered",
-			"read": "Read",
-			"failed": "Failed"
-		}
-		
-		new_status = status_map.get(status, "Sent")
-		doc.status = new_status
-		
-		# Update timestamps
-		if status == "delivered" and data.get("delivered_at_utc"):
-			doc.delivered_at = data.get("delivered_at_utc")
-		elif status == "read" and data.get("read_at_utc"):
-			doc.read_at = data.get("read_at_utc")
-		
-		doc.save(ignore_permissions=True)
-		frappe.db.commit()
-		
-		# Send real-time update
-		frappe.publish_realtime(
-			"whatsapp_message",
-			{
-				"reference_doctype": doc.reference_doctype,
-				"reference_name": doc.reference_docname,
-			},
-			after_commit=True
-		)
-		
-		frappe.logger().info(f"Status updated: {message_name} -> {new_status}")
-		
+
+		queue_status_update(data)
+
 	except Exception as e:
 		frappe.log_error(
 			title="Error handling status update",
@@ -223,62 +181,7 @@ def handle_status_update(webhook_data):
 
 def find_document_by_phone(phone_number):
 	"""
-	Find Lead/Deal/Contact by phone number.
+	Find Lead/Deal/Contact by phone number, see `crm.integrations.phone_index`.
 	Returns: (doctype, docname) or (None, None)
 	"""
-	# Get default country code from settings
-	settings = frappe.get_single("CRM Interakt Settings")
-	default_country_code = settings.default_country_code or "+91"
-	country_code_digits = default_country_code.lstrip("+")
-
-	# Try different phone number formats
-	phone_variants = [
-		phone_number,
-		phone_number.lstrip("0"),
-		f"0{phone_number}",
-		f"{default_country_code}{phone_number}",
-		f"{country_code_digits}{phone_number}",
-	]
-	
-	frappe.logger().info(f"Searching for document with phone variants: {phone_variants}")
-	
-	# Search in CRM Lead
-	for variant in phone_variants:
-		lead = frappe.db.get_value(
-			"CRM Lead",
-			{"mobile_no": variant},
-			"name"
-		)
-		if lead:
-			return ("CRM Lead", lead)
-		
-		# Also check phone field
-		lead = frappe.db.get_value(
-			"CRM Lead",
-			{"phone": variant},
-			"name"
-		)
-		if lead:
-			return ("CRM Lead", lead)
-	
-	# Search in CRM Deal
-	for variant in phone_variants:
-		deal = frappe.db.get_value(
-			"CRM Deal",
-			{"mobile_no": variant},
-			"name"
-		)
-		if deal:
-			return ("CRM Deal", deal)
-	
-	# Search in Contact
-	for variant in phone_variants:
-		contact = frappe.db.get_value(
-			"Contact",
-			{"mobile_no": variant},
-			"name"
-		)
-		if contact:
-			return ("Contact", contact)
-	
-	return (None, None)
+	return phone_index.find_document_by_phone(phone_number)
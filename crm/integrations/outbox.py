@@ -0,0 +1,215 @@
+"""
+Outbound message queue.
+
+Document hooks must not talk to messaging providers: a lead import or a burst of webhook leads
+would then wait on provider latency with the transaction open. Instead they call
+`queue_message`, which only inserts a `CRM Message Outbox` row. A single worker job per site
+(`process_outbox`, on the long queue) drains the outbox in order, paces each provider to its
+rate limit and retries failed sends with exponential backoff.
+
+Providers plug in through `PROVIDERS`: `send` receives the outbox document and returns a dict
+with `success`, and on success optionally `message_id` and `whatsapp_message`; on failure
+`error` and `retryable`. `on_failure` is called once a message is given up on.
+"""
+
+import random
+import time
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+OUTBOX = "CRM Message Outbox"
+
+PROVIDERS = {
+	"Interakt": {
+		"send": "crm.integrations.interakt.api.send_outbox_message",
+		"on_failure": "crm.integrations.interakt.api.outbox_message_failed",
+	},
+}
+
+# Messages per second sent to each provider
+RATE_LIMITS = {"Interakt": 5}
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 60 * 60
+CLAIM_BATCH_SIZE = 100
+# Messages still "Sending" after this long were claimed by a worker that died
+STALE_SENDING_MINUTES = 15
+
+WORKER_JOB_ID = "crm_message_outbox"
+
+_last_sent_at = {}
+
+
+def queue_message(
+	provider,
+	reference_doctype,
+	reference_docname,
+	phone_number,
+	country_code=None,
+	message_type="Template",
+	template_name=None,
+	language_code="en",
+	message=None,
+	sent_by=None,
+	idempotency_key=None,
+):
+	"""
+	Add a message to the outbox; it is sent by the outbox worker after the current transaction commits.
+
+	:param message: Provider arguments of the message, e.g. template header and body values
+	:param idempotency_key: Messages with a key already in the outbox are not queued again
+	:return: Name of the outbox entry, or None if it was already queued
+	"""
+	if idempotency_key and frappe.db.exists(OUTBOX, {"idempotency_key": idempotency_key}):
+		return None
+
+	doc = frappe.get_doc(
+		{
+			"doctype": OUTBOX,
+			"provider": provider,
+			"message_type": message_type,
+			"status": "Queued",
+			"next_attempt_at": now_datetime(),
+			"reference_doctype": reference_doctype,
+			"reference_docname": reference_docname,
+			"phone_number": phone_number,
+			"country_code": country_code,
+			"template_name": template_name,
+			"language_code": language_code,
+			"message": frappe.as_json(message or {}),
+			"sent_by": sent_by or frappe.session.user,
+			"idempotency_key": idempotency_key,
+		}
+	)
+	doc.insert(ignore_permissions=True)
+
+	# once per transaction, a bulk import queues thousands of messages
+	if not frappe.flags.crm_outbox_worker_pending:
+		frappe.flags.crm_outbox_worker_pending = True
+		frappe.db.after_commit.add(start_worker)
+
+	return doc.name
+
+
+def start_worker():
+	frappe.flags.crm_outbox_worker_pending = False
+	frappe.enqueue(
+		"crm.integrations.outbox.process_outbox",
+		queue="long",
+		job_id=WORKER_JOB_ID,
+		deduplicate=True,
+	)
+
+
+def kick_outbox():
+	"""Scheduled job: start the worker for retries that are due, and for messages left behind."""
+	release_stale_messages()
+	if frappe.db.exists(OUTBOX, {"status": "Queued", "next_attempt_at": ("<=", now_datetime())}):
+		start_worker()
+
+
+def process_outbox():
+	"""Outbox worker: send due messages until none are left."""
+	release_stale_messages()
+	while names := claim_messages():
+		for name in names:
+			send_message(name)
+
+
+def claim_messages(limit=CLAIM_BATCH_SIZE):
+	names = frappe.db.sql_list(
+		"""
+		select name from `tabCRM Message Outbox`
+		where status = 'Queued' and next_attempt_at <= %s
+		order by next_attempt_at
+		limit %s
+		for update skip locked
+		""",
+		(now_datetime(), limit),
+	)
+	if names:
+		frappe.db.sql(
+			"update `tabCRM Message Outbox` set status = 'Sending', modified = %s where name in %s",
+			(now_datetime(), tuple(names)),
+		)
+	frappe.db.commit()
+	return names
+
+
+def release_stale_messages():
+	frappe.db.sql(
+		"update `tabCRM Message Outbox` set status = 'Queued' where status = 'Sending' and modified < %s",
+		add_to_date(now_datetime(), minutes=-STALE_SENDING_MINUTES),
+	)
+	frappe.db.commit()
+
+
+def send_message(name):
+	doc = frappe.get_doc(OUTBOX, name)
+	provider = PROVIDERS.get(doc.provider)
+	if not provider:
+		record_failure(doc, {"error": f"Unknown provider {doc.provider}", "retryable": False})
+		return
+
+	throttle(doc.provider)
+	try:
+		result = frappe.get_attr(provider["send"])(doc)
+	except Exception as e:
+		frappe.log_error(title="Outbox message error", message=f"Outbox: {name}\nError: {e!s}")
+		result = {"success": False, "error": str(e), "retryable": True}
+
+	if result.get("success"):
+		doc.db_set(
+			{
+				"status": "Sent",
+				"attempts": doc.attempts + 1,
+				"message_id": result.get("message_id"),
+				"whatsapp_message": result.get("whatsapp_message"),
+				"sent_at": now_datetime(),
+				"error_message": None,
+			}
+		)
+	else:
+		record_failure(doc, result)
+
+	frappe.db.commit()
+
+
+def record_failure(doc, result):
+	attempts = doc.attempts + 1
+	error = str(result.get("error") or "Failed to send message")
+
+	if result.get("retryable", True) and attempts < MAX_ATTEMPTS:
+		doc.db_set(
+			{
+				"status": "Queued",
+				"attempts": attempts,
+				"next_attempt_at": add_to_date(now_datetime(), seconds=get_backoff(attempts)),
+				"error_message": error,
+			}
+		)
+		return
+
+	doc.db_set({"status": "Failed", "attempts": attempts, "error_message": error})
+	if on_failure := PROVIDERS.get(doc.provider, {}).get("on_failure"):
+		frappe.get_attr(on_failure)(doc)
+
+
+def get_backoff(attempts):
+	"""Seconds to wait before the next attempt: exponential, capped, with jitter."""
+	delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+	return int(delay * random.uniform(0.8, 1.2))
+
+
+def throttle(provider):
+	"""Sleep as long as needed to keep sends to a provider within its rate limit."""
+	rate = RATE_LIMITS.get(provider)
+	if not rate:
+		return
+
+	wait = _last_sent_at.get(provider, 0) + 1 / rate - time.monotonic()
+	if wait > 0:
+		time.sleep(wait)
+	_last_sent_at[provider] = time.monotonic()
@@ -0,0 +1,221 @@
+"""
+Phone number index of leads, deals and contacts.
+
+Inbound messages only carry the sender's number, written however the provider formats it. Every
+phone field in `INDEXED_FIELDS` is kept in `CRM Phone Index` as a normalized national number,
+so `find_document_by_phone` resolves a sender with one indexed query. Routes are cached per
+number, including misses, and senders that match nothing are recorded in `CRM Unmatched Phone`.
+
+The index is maintained by document hooks and can be rebuilt with `rebuild_phone_index`, which
+is needed after changing the default country code.
+"""
+
+import hashlib
+
+import frappe
+from frappe.utils import now_datetime
+
+PHONE_INDEX = "CRM Phone Index"
+UNMATCHED_PHONE = "CRM Unmatched Phone"
+
+# Indexed phone fields, a number on several records resolves to the first one in this order
+INDEXED_FIELDS = (
+	("CRM Lead", "mobile_no"),
+	("CRM Lead", "phone"),
+	("CRM Deal", "mobile_no"),
+	("Contact", "mobile_no"),
+)
+
+# National numbers have at least this many digits, shorter ones keep their leading country code
+MIN_NATIONAL_DIGITS = 10
+ROUTE_CACHE_TTL = 24 * 60 * 60
+NO_MATCH = "-"
+REBUILD_BATCH_SIZE = 5000
+
+INDEX_COLUMNS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"idx",
+	"phone",
+	"priority",
+	"reference_doctype",
+	"reference_docname",
+	"phone_field",
+)
+
+
+def get_default_country_code():
+	return frappe.db.get_single_value("CRM Interakt Settings", "default_country_code", cache=True) or "+91"
+
+
+def normalize_phone(phone, default_country_code=None):
+	"""
+	Digits of the national number, so `+91 98765-43210`, `098765 43210` and `919876543210` all
+	give `9876543210`. Numbers of other countries keep their country code.
+	"""
+	digits = "".join(filter(str.isdigit, str(phone or ""))).lstrip("0")
+	code = (default_country_code or get_default_country_code()).lstrip("+")
+	if code and digits.startswith(code) and len(digits) - len(code) >= MIN_NATIONAL_DIGITS:
+		digits = digits[len(code) :]
+	return digits
+
+
+def find_document_by_phone(phone_number):
+	"""
+	Lead, deal or contact with the given phone number.
+
+	:return: Tuple of (doctype, name), or (None, None) if no record has the number
+	"""
+	phone = normalize_phone(phone_number)
+	if not phone:
+		return None, None
+
+	key = _route_key(phone)
+	if route := frappe.cache.get_value(key):
+		return (None, None) if route == NO_MATCH else tuple(route)
+
+	rows = frappe.db.sql(
+		"""
+		select reference_doctype, reference_docname from `tabCRM Phone Index`
+		where phone = %s
+		order by priority, modified desc
+		limit 1
+		""",
+		phone,
+	)
+	route = tuple(rows[0]) if rows else None
+	frappe.cache.set_value(key, route or NO_MATCH, expires_in_sec=ROUTE_CACHE_TTL)
+	return route or (None, None)
+
+
+def record_unmatched_phone(phone_number, source, message=None):
+	"""Count a message from a number that matches no record."""
+	phone = normalize_phone(phone_number)
+	if not phone:
+		return
+
+	now = now_datetime()
+	frappe.db.sql(
+		"""
+		insert into `tabCRM Unmatched Phone`
+			(name, creation, modified, owner, modified_by, docstatus, idx,
+			phone, source, message_count, first_seen, last_seen, last_message)
+		values (%(name)s, %(now)s, %(now)s, 'Administrator', 'Administrator', 0, 0,
+			%(phone)s, %(source)s, 1, %(now)s, %(now)s, %(message)s)
+		on duplicate key update
+			message_count = message_count + 1,
+			last_seen = values(last_seen),
+			last_message = values(last_message),
+			modified = values(modified)
+		""",
+		{"name": phone, "phone": phone, "source": source, "message": message, "now": now},
+	)
+
+
+def index_document(doc, method=None):
+	"""Document hook: re-index the phone fields of a lead, deal or contact when they change."""
+	fields = _indexed_fields(doc.doctype)
+	if not fields or not any(doc.has_value_changed(field) for _, field in fields):
+		return
+
+	old_phones = unindex_document(doc)
+	rows = [
+		_index_row(doc.doctype, doc.name, field, priority, phone)
+		for priority, field in fields
+		if (phone := normalize_phone(doc.get(field)))
+	]
+	if rows:
+		frappe.db.bulk_insert(PHONE_INDEX, INDEX_COLUMNS, rows, ignore_duplicates=True)
+
+	new_phones = {row[7] for row in rows}
+	if new_phones:
+		frappe.db.delete(UNMATCHED_PHONE, {"phone": ("in", list(new_phones))})
+	_clear_routes(old_phones | new_phones)
+
+
+def unindex_document(doc, method=None):
+	"""Document hook: drop the index rows of a deleted lead, deal or contact. Returns their phones."""
+	if not _indexed_fields(doc.doctype):
+		return set()
+
+	filters = {"reference_doctype": doc.doctype, "reference_docname": doc.name}
+	phones = set(frappe.get_all(PHONE_INDEX, filters=filters, pluck="phone"))
+	if phones:
+		frappe.db.delete(PHONE_INDEX, filters)
+		_clear_routes(phones)
+	return phones
+
+
+def index_new_documents(docs):
+	"""Index the phone fields of new documents written without their hooks, e.g. in bulk."""
+	default_country_code = get_default_country_code()
+	rows = [
+		_index_row(doc.doctype, doc.name, field, priority, phone)
+		for doc in docs
+		for priority, field in _indexed_fields(doc.doctype)
+		if (phone := normalize_phone(doc.get(field), default_country_code))
+	]
+	if not rows:
+		return
+
+	frappe.db.bulk_insert(PHONE_INDEX, INDEX_COLUMNS, rows, ignore_duplicates=True)
+	phones = {row[7] for row in rows}
+	frappe.db.delete(UNMATCHED_PHONE, {"phone": ("in", list(phones))})
+	_clear_routes(phones)
+
+
+def rebuild_phone_index():
+	"""Rebuild the whole index from the indexed phone fields."""
+	frappe.db.delete(PHONE_INDEX)
+	default_country_code = get_default_country_code()
+
+	for priority, (doctype, field) in enumerate(INDEXED_FIELDS):
+		last_name = ""
+		while True:
+			records = frappe.get_all(
+				doctype,
+				filters=[[field, "is", "set"], ["name", ">", last_name]],
+				fields=["name", field],
+				order_by="name asc",
+				limit=REBUILD_BATCH_SIZE,
+			)
+			if not records:
+				break
+
+			rows = [
+				_index_row(doctype, record.name, field, priority, phone)
+				for record in records
+				if (phone := normalize_phone(record.get(field), default_country_code))
+			]
+			if rows:
+				frappe.db.bulk_insert(PHONE_INDEX, INDEX_COLUMNS, rows, ignore_duplicates=True)
+			frappe.db.commit()
+			last_name = records[-1].name
+
+	frappe.cache.delete_keys("crm:phone_route:")
+
+
+def _indexed_fields(doctype):
+	return [(priority, field) for priority, (dt, field) in enumerate(INDEXED_FIELDS) if dt == doctype]
+
+
+def _index_row(doctype, name, field, priority, phone):
+	now = now_datetime()
+	row_name = hashlib.md5(f"{doctype}|{name}|{field}".encode()).hexdigest()
+	return (row_name, now, now, "Administrator", "Administrator", 0, 0, phone, priority, doctype, name, field)
+
+
+def _route_key(phone):
+	return f"crm:phone_route:{phone}"
+
+
+def _clear_routes(phones):
+	"""Drop cached routes now, and again after commit in case they were cached from the old rows meanwhile."""
+	keys = [_route_key(phone) for phone in phones]
+	if keys:
+		frappe.cache.delete_value(keys)
+		frappe.db.after_commit.add(lambda: frappe.cache.delete_value(keys))
@@ -3,10 +3,12 @@
 import uuid
 import json
 import frappe
-import requests
 from frappe import _
 
+from crm.integrations import http_client
 from crm.integrations.api import get_contact_by_phone_number
+from crm.integrations.call_events import apply_call_event, is_terminal, payload_digest
+from crm.integrations.telephony_log import log_call_event
 from crm.fcrm.doctype.crm_tata_tele_settings.crm_tata_tele_settings import TataTeleSettings
 
 
@@ -198,54 +200,37 @@ def _map_status(payload):
 	missed_agent = _extract_missed_agent(payload)
 	hangup_cause = _extract_hangup_cause(payload)
 
-	# Debug logging
-	frappe.logger().info(
-		f"[SMARTFLOW STATUS MAPPING] call_status='{call_status}', "
-		f"end_dt={end_dt}, answer_dt={answer_dt}, billsec={billsec}, duration={duration}, "
-		f"call_connected={call_connected}, answered_agent='{answered_agent}', "
-		f"missed_agent='{missed_agent}', hangup_cause='{hangup_cause}'"
-	)
-
 	# Provider statuses for in-progress calls
 	if call_status in ("ringing", "agent_ringing"):
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Ringing")
 		return "Ringing"
 
 	if call_status in ("answered", "connected", "in_progress", "active"):
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: In Progress")
 		return "In Progress"
 
 	# Explicit provider status for completed
 	if call_status in ("completed", "hangup", "ended", "disconnected"):
 		# Check if call was actually answered and connected
 		if answered_agent and (answer_dt or call_connected or billsec > 0):
-			frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Completed (answered with agent)")
 			return "Completed"
 		
 		# Check if explicitly missed
 		if missed_agent:
-			frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: No answer (missed agent)")
 			return "No answer"
 		
 		# No answer/duration = not answered
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: No answer (ended without answer)")
 		return "No answer"
 
 	# Explicit no answer statuses
 	if call_status in ("no_answer", "missed", "not_answered"):
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: No answer")
 		return "No answer"
 
 	if call_status in ("failed",):
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Failed")
 		return "Failed"
 
 	if call_status in ("busy",):
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Busy")
 		return "Busy"
 
 	if call_status in ("cancelled", "canceled"):
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Cancelled")
 		return "Cancelled"
 
 	# FINAL heuristic when call has ended
@@ -254,40 +239,31 @@ def _map_status(payload):
 		if hangup_cause:
 			cause_lower = str(hangup_cause).lower()
 			if "cancel" in cause_lower or "user" in cause_lower:
-				frappe.logger().info(f"[SMARTFLOW STATUS MAPPING] Returning: Cancelled (hangup_cause: {hangup_cause})")
 				return "Cancelled"
 			if "busy" in cause_lower:
-				frappe.logger().info(f"[SMARTFLOW STATUS MAPPING] Returning: Busy (hangup_cause: {hangup_cause})")
 				return "Busy"
 			if "no answer" in cause_lower or "missed" in cause_lower or "timeout" in cause_lower:
-				frappe.logger().info(f"[SMARTFLOW STATUS MAPPING] Returning: No answer (hangup_cause: {hangup_cause})")
 				return "No answer"
 		
 		# Check if answered with duration
 		if answered_agent and (answer_dt or call_connected or billsec > 0 or duration > 0):
-			frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Completed (heuristic - answered with duration)")
 			return "Completed"
 		
 		# Check if missed
 		if missed_agent:
-			frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: No answer (heuristic - missed)")
 			return "No answer"
 		
 		# Has duration but no answered_agent = still completed
 		if billsec > 0 or duration > 0:
-			frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Completed (heuristic - has duration)")
 			return "Completed"
 		
 		# Ended without answer
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: No answer (heuristic - ended without answer/duration)")
 		return "No answer"
 
 	# Call in progress if agent answered
 	if payload.get("answered_agent_number") or payload.get("answer_agent_number") or answered_agent:
-		frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: In Progress (has answered agent)")
 		return "In Progress"
 
-	frappe.logger().info("[SMARTFLOW STATUS MAPPING] Returning: Initiated (default)")
 	return "Initiated"
 
 
@@ -308,13 +284,13 @@ def validate_webhook_token():
 		settings = TataTeleSettings.get_settings()
 		
 		if not settings:
-			frappe.logger().error("[SMARTFLOW AUTH] Settings not found")
+			log_call_event("Smartflo", "auth_failed", level="error", reason="settings not found")
 			return False
 		
 		expected = (settings.get_password("webhook_token") or "").strip()
 		
 		if not expected:
-			frappe.logger().warning("[SMARTFLOW AUTH] No webhook token configured - allowing all requests")
+			# No webhook token configured - allowing all requests
 			return True
 		
 		# Try multiple header names
@@ -326,10 +302,13 @@ def validate_webhook_token():
 		).strip()
 		
 		if not auth_header:
-			frappe.logger().error("[SMARTFLOW AUTH] No authorization header found")
-			# Log all headers for debugging
-			headers_dict = {k: v for k, v in frappe.request.headers.items()}
-			frappe.logger().error(f"[SMARTFLOW AUTH] All headers: {headers_dict}")
+			log_call_event(
+				"Smartflo",
+				"auth_failed",
+				level="warning",
+				reason="no authorization header",
+				headers=sorted(frappe.request.headers.keys()),
+			)
 			return False
 		
 		# Extract token from various formats
@@ -345,26 +324,20 @@ def validate_webhook_token():
 		
 		# Compare tokens
 		if received_token == expected:
-			frappe.logger().info("[SMARTFLOW AUTH] Token validated successfully")
 			return True
-		else:
-			frappe.logger().error(
-				f"[SMARTFLOW AUTH] Token mismatch - "
-				f"Expected length: {len(expected)}, Received length: {len(received_token)}"
-			)
-			# TEMPORARY: Log full tokens for debugging (remove after fixing)
-			frappe.logger().error(f"[SMARTFLOW AUTH DEBUG] Expected token: {expected}")
-			frappe.logger().error(f"[SMARTFLOW AUTH DEBUG] Received token: {received_token}")
-			
-			# Also log partial for quick comparison
-			if len(expected) > 8:
-				frappe.logger().error(f"[SMARTFLOW AUTH] Expected starts with: {expected[:4]}...{expected[-4:]}")
-			if len(received_token) > 8:
-				frappe.logger().error(f"[SMARTFLOW AUTH] Received starts with: {received_token[:4]}...{received_token[-4:]}")
-			return False
 
-	except Exception as e:
-		frappe.logger().error(f"[SMARTFLOW AUTH] Exception: {str(e)}")
+		# never log the tokens themselves, lengths are enough to spot a malformed header
+		log_call_event(
+			"Smartflo",
+			"auth_failed",
+			level="warning",
+			reason="token mismatch",
+			expected_length=len(expected),
+			received_length=len(received_token),
+		)
+		return False
+
+	except Exception:
 		frappe.log_error(frappe.get_traceback(), "Smartflow Auth Error")
 		return False
 
@@ -372,75 +345,72 @@ def validate_webhook_token():
 def _find_or_create_call_log(ref_id, agent_no=None, customer_no=None):
 	"""
 	tabCRM Call Log has UNIQUE column `id`.
-We store outbound ref_id in `id` so all webhook events update same row.
+	We store outbound ref_id in `id` so all webhook events update same row.
+
+	The row is written with a single upsert (no intermediate commits or re-reads),
+	and an existing call log is never moved back to Initiated.
 	"""
-	name = frappe.db.get_value("CRM Call Log", {"id": ref_id}, "name")
-	if name:
-		return frappe.get_doc("CRM Call Log", name)
-
-	doc = frappe.new_doc("CRM Call Log")
-	doc.telephony_medium = "Tata Tele"
-	doc.medium = "Smartflow"
-	doc.type = "Outgoing"
-	doc.id = ref_id
-	doc.status = "Initiated"
-	doc.start_time = frappe.utils.now_datetime()
-	
-	# Set caller to current user ONLY if they exist in User doctype
-	try:
-		current_user = frappe.session.user
-		if current_user and current_user != "Guest":
-			# Verify user exists before setting
-			if frappe.db.exists("User", current_user):
-				doc.caller = current_user
-			else:
-				frappe.logger().warning(f"[SMARTFLOW] User {current_user} not found, skipping caller field")
-	except Exception as e:
-		frappe.logger().warning(f"[SMARTFLOW] Could not set caller: {str(e)}")
+	defaults = {
+		"telephony_medium": "Tata Tele",
+		"medium": "Smartflow",
+		"type": "Outgoing",
+		"start_time": frappe.utils.now_datetime(),
+	}
+	if frappe.session.user != "Guest":
+		defaults["caller"] = frappe.session.user
 
 	# store numbers as last 10 digits
-	agent_no = _only_last_10(agent_no)
-	customer_no = _only_last_10(customer_no)
+	values = {"from": _only_last_10(agent_no), "to": _only_last_10(customer_no)}
+	return apply_call_event(ref_id, "Initiated", values, defaults=defaults, on_create=_link_call_log)
 
-	if agent_no:
-		# "from" is reserved: use db.set_value after insert OR setattr safely
-		try:
-			setattr(doc, "from", agent_no)
-		except Exception:
-			pass
-	if customer_no:
-		try:
-			setattr(doc, "to", customer_no)
-		except Exception:
-			pass
 
-	# optional linking by customer number
+def _link_call_log(doc):
+	"""Link a new outbound call log with the lead/deal/contact of the customer number."""
+	customer_no = doc.get("to")
+	if not customer_no:
+		return
 	try:
-		if customer_no:
-			contact = get_contact_by_phone_number(customer_no) or {}
-			if contact.get("name"):
-				doc.reference_doctype = "Contact"
-				doc.reference_docname = contact.get("name")
-				if contact.get("lead"):
-					doc.reference_doctype = "CRM Lead"
-					doc.reference_docname = contact.get("lead")
-				elif contact.get("deal"):
-					doc.reference_doctype = "CRM Deal"
-					doc.reference_docname = contact.get("deal")
+		contact = get_contact_by_phone_number(customer_no) or {}
+		if contact.get("name"):
+			doc.reference_doctype = "Contact"
+			doc.reference_docname = contact.get("name")
+			if contact.get("lead"):
+				doc.reference_doctype = "CRM Lead"
+				doc.reference_docname = contact.get("lead")
+			elif contact.get("deal"):
+				doc.reference_doctype = "CRM Deal"
+				doc.reference_docname = contact.get("deal")
 	except Exception as e:
-		frappe.logger().warning(f"[SMARTFLOW] Could not link contact: {str(e)}")
+		log_call_event("Smartflo", "link_failed", level="warning", number=customer_no, error=str(e))
 
-	doc.insert(ignore_permissions=True)
-	frappe.db.commit()
 
-	# ensure "from" is saved (safe for reserved field)
-	if agent_no:
-		frappe.db.set_value("CRM Call Log", doc.name, "from", agent_no)
-	if customer_no:
-		frappe.db.set_value("CRM Call Log", doc.name, "to", customer_no)
-	frappe.db.commit()
+def _call_event_values(payload, status):
+	"""Call log fields carried by an outbound webhook event."""
+	values = {
+		"from": _extract_agent(payload),
+		"to": _extract_customer(payload),
+		"start_time": _extract_start(payload),
+	}
+
+	if is_terminal(status):
+		values["end_time"] = _extract_end(payload) or frappe.utils.now_datetime()
+		values["duration"] = _extract_duration(payload)
+		values["recording_url"] = _extract_recording(payload)
 
-	return frappe.get_doc("CRM Call Log", doc.name)
+	# save call_id and hangup_cause into note (max 140 chars for Text field)
+	note_parts = []
+	if call_id := _extract_call_id(payload):
+		note_parts.append(f"call_id={call_id}")
+	if hangup_cause := _extract_hangup_cause(payload):
+		note_parts.append(f"hangup={str(hangup_cause)[:50]}")
+	if answered_agent := _extract_answered_agent(payload):
+		note_parts.append(f"agent={str(answered_agent)[:30]}")
+	if missed_agent := _extract_missed_agent(payload):
+		note_parts.append(f"missed={str(missed_agent)[:30]}")
+	if note_parts:
+		values["note"] = ", ".join(note_parts)[:140]
+
+	return values
 
 
 def _publish_realtime(ref_id, doc, payload):
@@ -455,9 +425,6 @@ def _publish_realtime(ref_id, doc, payload):
 	}
 	
 	frappe.publish_realtime("tata_tele_call", data)
-	
-	# Also log for debugging
-	frappe.logger().info(f"[TATA TELE REALTIME] Published: {data}")
 
 
 # =========================================================
@@ -508,6 +475,8 @@ def make_a_call(to_number, from_number=None):
 		agent_no=_only_last_10(agent_number),
 		customer_no=_only_last_10(to_number)
 	)
+	# release the row before the provider starts calling back
+	frappe.db.commit()
 
 	payload = {
 		"agent_number": agent_number,
@@ -519,9 +488,11 @@ def make_a_call(to_number, from_number=None):
 
 	headers = {"Authorization": f"Bearer {api_token}", "Content-Type": "application/json"}
 
-	resp = requests.post(api_endpoint, json=payload, headers=headers, timeout=60)
+	resp = http_client.post(
+		"Tata Tele", api_endpoint, endpoint="click_to_call", json=payload, headers=headers, timeout=60
+	)
 	if resp.status_code not in (200, 201):
-		frappe.db.set_value("CRM Call Log", doc.name, "status", "Failed")
+		apply_call_event(doc.name, "Failed", {"end_time": frappe.utils.now_datetime()})
 		frappe.db.commit()
 		frappe.throw(_("Tata Tele API Error: {0}").format(resp.text), title=_("API Error"))
 
@@ -563,48 +534,29 @@ def webhook_handler():
 
 	try:
 		if not is_integration_enabled():
-			frappe.logger().warning("[SMARTFLOW] Integration not enabled")
+			log_call_event("Smartflo", "integration_disabled", level="warning")
 			frappe.local.response.http_status_code = 503
 			return {"success": False, "message": "Integration not enabled"}
 
 		# Validate authentication
 		if not validate_webhook_token():
-			frappe.logger().error("[SMARTFLOW] Webhook authentication FAILED - returning 401")
 			frappe.local.response.http_status_code = 401
 			return {"success": False, "error": "Unauthorized", "message": "Invalid or missing webhook token"}
 
-		frappe.logger().info("[SMARTFLOW] Webhook authenticated successfully")
-
 		payload = _get_json()
-
-		# DEBUG: print full webhook payload
-		frappe.logger().info("[SMARTFLOW OUTBOUND WEBHOOK] Payload:\n" + json.dumps(payload, indent=2))
-
-		# DEBUG: quick key fields
-		frappe.logger().info(
-			"[SMARTFLOW] call_status="
-			+ str(payload.get("call_status"))
-			+ " direction=" + str(payload.get("direction"))
-			+ " end_stamp=" + str(payload.get("end_stamp"))
-			+ " answer_stamp=" + str(payload.get("answer_stamp"))
-			+ " answer_agent_number=" + str(payload.get("answer_agent_number"))
-			+ " billsec=" + str(payload.get("billsec"))
-		)
-
 		ref_id = _extract_ref_id(payload)
 		
-		# Enhanced logging for debugging
-		frappe.logger().info(f"[SMARTFLOW] Extracted ref_id: {ref_id}")
-		frappe.logger().info(f"[SMARTFLOW] Payload keys: {list(payload.keys())}")
-		
 		if not ref_id:
-			# Log the full payload for debugging when ref_id is missing
-			frappe.logger().warning(f"[SMARTFLOW] ref_id missing! This might be an inbound call or test webhook.")
-			frappe.logger().warning(f"[SMARTFLOW] Payload: {json.dumps(payload, indent=2)}")
-			
 			# Check if this is an inbound call (has different structure)
 			call_type = payload.get("call_type") or payload.get("type") or payload.get("direction") or "unknown"
-			frappe.logger().info(f"[SMARTFLOW] Call type/direction: {call_type}")
+			log_call_event(
+				"Smartflo",
+				"ref_id_missing",
+				payload,
+				level="warning",
+				call_type=call_type,
+				payload_keys=sorted(payload.keys()),
+			)
 			
 			# Return 200 OK to acknowledge receipt, but don't process
 			return {
@@ -614,93 +566,32 @@ def webhook_handler():
 				"payload_keys": list(payload.keys())
 			}
 
-		agent_no = _extract_agent(payload)
-		customer_no = _extract_customer(payload)
-
-		# find/create by id=ref_id
-		doc = _find_or_create_call_log(ref_id, agent_no=agent_no, customer_no=customer_no)
-
-		frappe.logger().info(f"[SMARTFLOW] Found/Created Call Log: {doc.name}, Current Status: {doc.status}")
-
 		new_status = _map_status(payload)
-		
-		frappe.logger().info(f"[SMARTFLOW] Mapped Status: {new_status}")
 
-		start_time = _extract_start(payload) or doc.start_time or frappe.utils.now_datetime()
-		end_time = _extract_end(payload)
-		duration = _extract_duration(payload)
-		recording_url = _extract_recording(payload)
-		call_id = _extract_call_id(payload)
-		
-		# Extract additional fields
-		answered_agent = _extract_answered_agent(payload)
-		missed_agent = _extract_missed_agent(payload)
-		hangup_cause = _extract_hangup_cause(payload)
-		call_connected = _extract_call_connected(payload)
-		
-		frappe.logger().info(
-			f"[SMARTFLOW] Extracted - Duration: {duration}, End Time: {end_time}, "
-			f"Recording: {recording_url}, Answered Agent: {answered_agent}, "
-			f"Missed Agent: {missed_agent}, Hangup Cause: {hangup_cause}, "
-			f"Call Connected: {call_connected}"
+		# events are merged in lifecycle order, late or repeated events never downgrade the call
+		doc = apply_call_event(
+			ref_id,
+			new_status,
+			_call_event_values(payload, new_status),
+			defaults={
+				"telephony_medium": "Tata Tele",
+				"medium": "Smartflow",
+				"type": "Outgoing",
+				"start_time": frappe.utils.now_datetime(),
+			},
+			on_create=_link_call_log,
+			event_key=payload_digest(payload),
 		)
-
-		updates = {"status": new_status}
-
-		# numbers (always last 10 digits)
-		if agent_no:
-			updates["from"] = _only_last_10(agent_no)
-		if customer_no:
-			updates["to"] = _only_last_10(customer_no)
-
-		# start time only if empty
-		if not doc.start_time:
-			updates["start_time"] = start_time
-
-		# final state => end time
-		if new_status in ("Completed", "No answer", "Failed", "Busy", "Cancelled"):
-			updates["end_time"] = end_time or frappe.utils.now_datetime()
-
-		# duration: save on final states
-		if duration is not None and new_status in ("Completed", "No answer"):
-			updates["duration"] = duration
-
-		# recording: only on completed
-		if recording_url and new_status == "Completed":
-			updates["recording_url"] = recording_url
-
-		# save call_id and hangup_cause into note (max 140 chars for Text field)
-		note_parts = []
-		if call_id:
-			note_parts.append(f"call_id={call_id}")
-		if hangup_cause:
-			# Truncate hangup cause if too long
-			cause_str = str(hangup_cause)[:50]
-			note_parts.append(f"hangup={cause_str}")
-		if answered_agent:
-			# Truncate agent name if too long
-			agent_str = str(answered_agent)[:30]
-			note_parts.append(f"agent={agent_str}")
-		if missed_agent:
-			missed_str = str(missed_agent)[:30]
-			note_parts.append(f"missed={missed_str}")
-		
-		if note_parts:
-			# Join and ensure total length is under 140 chars
-			note_text = ", ".join(note_parts)
-			updates["note"] = note_text[:140]
-
-		# apply updates safely (because "from" is reserved)
-		for k, v in updates.items():
-			if k == "from":
-				frappe.db.set_value("CRM Call Log", doc.name, "from", v)
-			else:
-				frappe.db.set_value("CRM Call Log", doc.name, k, v)
-
 		frappe.db.commit()
-		doc.reload()
-		
-		frappe.logger().info(f"[SMARTFLOW] Updates Applied - Final Status: {doc.status}, Duration: {doc.duration}, End Time: {doc.end_time}")
+
+		log_call_event(
+			"Smartflo",
+			"outbound_webhook",
+			payload,
+			mapped_status=new_status,
+			call_log=doc.name,
+			call_log_status=doc.status,
+		)
 
 		_publish_realtime(ref_id, doc, payload)
 
@@ -713,7 +604,6 @@ def webhook_handler():
 		}
 	
 	except Exception as e:
-		frappe.logger().error(f"[SMARTFLOW] Exception in webhook_handler: {str(e)}")
 		frappe.log_error(frappe.get_traceback(), "Smartflow Webhook Error")
 		frappe.local.response.http_status_code = 500
 		return {
@@ -876,7 +766,9 @@ def hangup_call(call_id: str, ref_id: str = None):
 	}
 
 	try:
-		resp = requests.post(url, json=payload, headers=headers, timeout=30)
+		resp = http_client.post(
+			"Tata Tele", url, endpoint="hangup", json=payload, headers=headers, timeout=30
+		)
 	except Exception:
 		frappe.log_error(frappe.get_traceback(), "Smartflo Hangup API Error")
 		frappe.throw(_("Failed to connect to Tata Tele API"))
@@ -888,18 +780,15 @@ def hangup_call(call_id: str, ref_id: str = None):
 
 	# 🔄 Update CRM Call Log if ref_id provided
 	if ref_id:
-		name = frappe.db.get_value("CRM Call Log", {"id": ref_id}, "name")
-		if name:
-			frappe.db.set_value("CRM Call Log", name, {
-				"status": "Cancelled",
-				"end_time": frappe.utils.now_datetime()
-			})
+		if frappe.db.exists("CRM Call Log", {"id": ref_id}):
+			# a completion webhook may have already closed the call, which then stays as is
+			call_log = apply_call_event(ref_id, "Canceled", {"end_time": frappe.utils.now_datetime()})
 			frappe.db.commit()
 			
 			# Publish real-time update
 			frappe.publish_realtime("tata_tele_call", {
 				"ref_id": ref_id,
-				"status": "Cancelled",
+				"status": call_log.status,
 				"call_id": call_id,
 			})
 
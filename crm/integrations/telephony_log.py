@@ -0,0 +1,136 @@
+"""
+Structured, sampled event log for telephony webhooks.
+
+Each event is written as one JSON line with a few key fields to `logs/crm_telephony.log`.
+Routine events are sampled at the provider's configured rate, warnings and errors are always
+written, and the full payload is only captured while the provider's debug switch is on.
+Records go through an in-memory queue and are written by a background thread, so webhook
+requests never wait on log I/O.
+"""
+
+import atexit
+import json
+import logging
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+
+import frappe
+
+# Provider name -> settings doctype holding `log_sample_rate` and `debug_payload_logging`
+PROVIDER_SETTINGS = {
+	"Smartflo": "CRM Tata Tele Settings",
+	"Exotel": "CRM Exotel Settings",
+}
+
+# Payload keys worth keeping on every event line
+KEY_FIELDS = (
+	"ref_id",
+	"call_id",
+	"uuid",
+	"call_status",
+	"direction",
+	"billsec",
+	"hangup_cause_key",
+	"CallSid",
+	"Status",
+	"Direction",
+	"CallType",
+	"DialCallStatus",
+)
+
+SECRET_MARKERS = ("token", "secret", "password", "authorization", "api_key", "apikey")
+REDACTED = "********"
+
+LOG_BUFFER_SIZE = 10000
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+class BufferedQueueHandler(QueueHandler):
+	"""Queue handler that drops records instead of blocking when the buffer is full."""
+
+	def enqueue(self, record):
+		try:
+			self.queue.put_nowait(record)
+		except Full:
+			pass
+
+
+def get_telephony_logger():
+	"""Return the async telephony logger of the current site."""
+	site = getattr(frappe.local, "site", None) or ""
+	if logger := _loggers.get(site):
+		return logger
+
+	with _loggers_lock:
+		if logger := _loggers.get(site):
+			return logger
+
+		target = frappe.logger("crm_telephony", allow_site=bool(site), file_count=5)
+		queue = Queue(maxsize=LOG_BUFFER_SIZE)
+		listener = QueueListener(queue, *target.handlers, respect_handler_level=True)
+		listener.start()
+		atexit.register(listener.stop)
+
+		logger = logging.getLogger(f"crm.telephony.{site or 'default'}")
+		logger.setLevel(logging.INFO)
+		logger.propagate = False
+		logger.addHandler(BufferedQueueHandler(queue))
+
+		_loggers[site] = logger
+		return logger
+
+
+def redact(value):
+	"""Replace values of secret looking keys, recursively."""
+	if isinstance(value, dict):
+		return {
+			k: REDACTED if any(marker in str(k).lower() for marker in SECRET_MARKERS) else redact(v)
+			for k, v in value.items()
+		}
+	if isinstance(value, list | tuple):
+		return [redact(v) for v in value]
+	return value
+
+
+def get_log_settings(provider):
+	doctype = PROVIDER_SETTINGS.get(provider)
+	if not doctype:
+		return 100, False
+
+	try:
+		sample_rate = frappe.db.get_single_value(doctype, "log_sample_rate", cache=True)
+		debug = frappe.db.get_single_value(doctype, "debug_payload_logging", cache=True)
+	except Exception:
+		return 100, False
+
+	return (100 if sample_rate is None else sample_rate), bool(debug)
+
+
+def log_call_event(provider, event, payload=None, level="info", **fields):
+	"""
+	Write one telephony event.
+
+	:param provider: Provider name, e.g. "Smartflo" or "Exotel"
+	:param event: Short event name, e.g. "outbound_webhook" or "auth_failed"
+	:param payload: Webhook payload; only its key fields are logged unless debug is on
+	:param level: "info" events are sampled, "warning" and "error" are always written
+	:param fields: Extra fields for this event, e.g. the mapped status
+	"""
+	sample_rate, debug = get_log_settings(provider)
+	if level == "info" and not debug and random.random() * 100 >= sample_rate:
+		return
+
+	record = {"provider": provider, "event": event}
+	if isinstance(payload, dict):
+		record.update({key: payload[key] for key in KEY_FIELDS if payload.get(key) not in (None, "")})
+	record.update(fields)
+	if debug and payload is not None:
+		record["payload"] = payload
+
+	get_telephony_logger().log(
+		logging.getLevelName(level.upper()), json.dumps(redact(record), default=str, sort_keys=True)
+	)
@@ -5,6 +5,8 @@ from frappe import _
 from werkzeug.wrappers import Response
 
 from crm.integrations.api import get_contact_by_phone_number
+from crm.integrations.call_events import apply_call_event
+from crm.integrations.call_recordings import enqueue_recording_fetch
 
 from .twilio_handler import IncomingCall, Twilio, TwilioCallDetails
 
@@ -72,13 +74,15 @@ def twilio_incoming_call_handler(**kwargs):
 def create_call_log(call_details: TwilioCallDetails):
 	details = call_details.to_dict()
 
-	call_log = frappe.get_doc({**details, "doctype": "CRM Call Log", "telephony_medium": "Twilio"})
-
 	# link call log with lead/deal
 	contact_number = details.get("from") if details.get("type") == "Incoming" else details.get("to")
-	link(contact_number, call_log)
-
-	call_log.save(ignore_permissions=True)
+	call_log = apply_call_event(
+		details.pop("id"),
+		details.pop("status"),
+		details,
+		defaults={"telephony_medium": "Twilio"},
+		on_create=lambda doc: link(contact_number, doc),
+	)
 	frappe.db.commit()
 	return call_log
 
@@ -105,12 +109,15 @@ def update_call_log(call_sid, status=None):
 
 	try:
 		call_details = twilio.get_call_info(call_sid)
-		call_log = frappe.get_doc("CRM Call Log", call_sid)
-		call_log.status = TwilioCallDetails.get_call_status(status or call_details.status)
-		call_log.duration = call_details.duration
-		call_log.start_time = get_datetime_from_timestamp(call_details.start_time)
-		call_log.end_time = get_datetime_from_timestamp(call_details.end_time)
-		call_log.save(ignore_permissions=True)
+		call_log = apply_call_event(
+			call_sid,
+			TwilioCallDetails.get_call_status(status or call_details.status),
+			{
+				"duration": call_details.duration,
+				"start_time": get_datetime_from_timestamp(call_details.start_time),
+				"end_time": get_datetime_from_timestamp(call_details.end_time),
+			},
+		)
 		frappe.db.commit()
 		return call_log
 	except Exception:
@@ -126,6 +133,7 @@ def update_recording_info(**kwargs):
 		call_sid = args.CallSid
 		update_call_log(call_sid)
 		frappe.db.set_value("CRM Call Log", call_sid, "recording_url", recording_url)
+		enqueue_recording_fetch(call_sid)
 	except Exception:
 		frappe.log_error(title=_("Failed to capture Twilio recording"))
 
@@ -1,15 +1,25 @@
 import frappe
+import requests
 from frappe.exceptions import ValidationError
-from frappe.integrations.utils import make_get_request
+from frappe.utils import get_datetime
+
+from crm.api.lead_distribution import distribute_leads
+from crm.integrations.http_client import get_json
+from crm.lead_syncing.ingest import insert_leads
 
 FB_GRAPH_API_BASE = "https://graph.facebook.com"
 FB_GRAPH_API_VERSION = "v23.0"
+LEADS_PAGE_SIZE = 500
 
 
 class DuplicateLeadError(ValidationError):
 	pass
 
 
+def get_created_timestamp(lead: dict) -> int:
+	return int(get_datetime(lead["created_time"]).timestamp())
+
+
 def get_fb_graph_api_url(endpoint: str) -> str:
 	if endpoint.startswith("/"):
 		endpoint = endpoint[1:]
@@ -33,12 +43,47 @@ class FacebookSyncSource:
 		return get_fb_graph_api_url(endpoint)
 
 	def sync(self):
-		leads = self.fetch_leads()
-		for lead in leads:
-			self.sync_single_lead(lead)
+		for leads in self.fetch_leads():
+			self.sync_leads(leads)
 		self.update_last_synced_at()
 
-	def sync_single_lead(self, lead, raise_exception=False):
+	def sync_leads(self, leads):
+		"""
+		Create the leads of a page in bulk, see `crm.lead_syncing.ingest`. Leads an earlier sync
+		already created are skipped, duplicates and failures are logged.
+		"""
+		synced = set(
+			frappe.get_all(
+				"CRM Lead",
+				filters={"facebook_lead_id": ("in", [lead["id"] for lead in leads])},
+				pluck="facebook_lead_id",
+			)
+		)
+		leads = [lead for lead in leads if lead["id"] not in synced]
+		crm_leads = [self.get_crm_lead_data(lead) for lead in leads]
+		duplicates = self.find_duplicate_leads(crm_leads, self.get_form_questions_mapping())
+
+		new_leads = []
+		for i, lead in enumerate(leads):
+			if i in duplicates:
+				self.create_failure_log(lead, "Duplicate")
+			else:
+				new_leads.append(i)
+
+		names, failures = insert_leads([crm_leads[i] for i in new_leads])
+		for i, traceback in failures.items():
+			self.create_failure_log(leads[new_leads[i]], traceback=traceback)
+		self.distribute_leads(names)
+
+	def distribute_leads(self, names):
+		"""Give the new leads owners from the source's distribution team, if it has one."""
+		team = frappe.db.get_value(
+			"Lead Sync Source", self.source_name or {"facebook_lead_form": self.form_id}, "distribution_team"
+		)
+		if team and names:
+			distribute_leads(names, team)
+
+	def get_crm_lead_data(self, lead):
 		question_to_field_map = self.get_form_questions_mapping()
 		lead_data = {item["name"]: item["values"][0] for item in lead["field_data"]}
 		crm_lead_data = {
@@ -47,15 +92,22 @@ class FacebookSyncSource:
 		crm_lead_data["source"] = "Facebook"
 		crm_lead_data["facebook_lead_id"] = lead["id"]
 		crm_lead_data["facebook_form_id"] = self.form_id
+		return crm_lead_data
+
+	def sync_single_lead(self, lead, raise_exception=False):
+		question_to_field_map = self.get_form_questions_mapping()
+		crm_lead_data = self.get_crm_lead_data(lead)
 
 		try:
 			self.validate_duplicate_lead(crm_lead_data, question_to_field_map)
-			return frappe.get_doc(
+			lead = frappe.get_doc(
 				{
 					"doctype": "CRM Lead",
 					**crm_lead_data,
 				}
 			).insert(ignore_permissions=True)
+			self.distribute_leads([lead.name])
+			return lead
 		except (frappe.UniqueValidationError, DuplicateLeadError):
 			self.create_failure_log(lead, "Duplicate")
 			if raise_exception:
@@ -66,23 +118,69 @@ class FacebookSyncSource:
 				raise
 
 	def fetch_leads(self):
+		"""
+		Yield the leads created since the last sync, one page at a time.
+
+		The sync checkpoint holds the creation time of the newest lead synced and, while a sync is
+		unfinished, the Graph cursor of the next page. It moves past a page when the next one is
+		requested, that is after the caller processed it, and is committed right away, so a sync
+		that dies resumes at the page it was on.
+		"""
 		url = self.get_api_url(f"/{self.form_id}/leads")
+		checkpoint = self.get_checkpoint()
+		since = checkpoint.get("since")
+		if not since and self.last_synced_at:
+			since = int(frappe.utils.data.get_timestamp(self.last_synced_at))
+
 		params = {
 			"access_token": self.access_token,
 			"fields": "id,created_time,field_data",
-			"limit": 100000,  # TODO: pagination
+			"limit": LEADS_PAGE_SIZE,
 		}
-
-		filtering = []
-		if self.last_synced_at:
-			timestamp = frappe.utils.data.get_timestamp(self.last_synced_at)
-			filtering.append({"field": "time_created", "operator": "GREATER_THAN", "value": timestamp})
+		if since:
+			# leads created in the same second as the newest one synced are fetched again and skipped
+			filtering = [{"field": "time_created", "operator": "GREATER_THAN", "value": since - 1}]
 			params["filtering"] = frappe.as_json(filtering)
 
-		return make_get_request(
-			url,
-			params=params,
-		).get("data", [])
+		after = checkpoint.get("after")
+		latest = checkpoint.get("latest") or since
+		while True:
+			try:
+				response = get_json("Facebook", url, endpoint="leads", params={**params, "after": after})
+			except requests.exceptions.HTTPError:
+				if not after:
+					raise
+				# the cursor expired, start over; leads synced already are skipped
+				after = None
+				continue
+
+			leads = response.get("data", [])
+			if leads:
+				yield leads
+				latest = max(latest or 0, *(get_created_timestamp(lead) for lead in leads))
+
+			paging = response.get("paging", {})
+			after = paging.get("cursors", {}).get("after")
+			if not leads or not after or not paging.get("next"):
+				break
+			self.save_checkpoint({"since": since, "after": after, "latest": latest})
+
+		self.save_checkpoint({"since": latest})
+
+	def get_checkpoint(self):
+		checkpoint = frappe.db.get_value(
+			"Lead Sync Source", self.source_name or {"facebook_lead_form": self.form_id}, "sync_checkpoint"
+		)
+		return frappe.parse_json(checkpoint or "{}")
+
+	def save_checkpoint(self, checkpoint):
+		frappe.db.set_value(
+			"Lead Sync Source",
+			self.source_name or {"facebook_lead_form": self.form_id},
+			"sync_checkpoint",
+			frappe.as_json(checkpoint),
+		)
+		frappe.db.commit()
 
 	def get_form_questions_mapping(self):
 		if self.form_questions_mapping:
@@ -138,6 +236,40 @@ class FacebookSyncSource:
 		if frappe.db.exists("CRM Lead", validation_filters):
 			raise DuplicateLeadError
 
+	def find_duplicate_leads(self, leads: list[dict], field_mapping: dict) -> set[int]:
+		"""
+		Indexes of the leads `validate_duplicate_lead` would reject, checked with one query for the
+		whole list. A lead repeating an earlier one of the list is a duplicate too.
+		"""
+		fields = list(dict.fromkeys(field_mapping.values()))
+		if not fields:
+			return set()
+
+		def key(values):
+			return tuple(str(values.get(field) or "") for field in fields)
+
+		existing = set()
+		if leads:
+			columns = ", ".join(f"ifnull(`{field}`, '')" for field in fields)
+			rows = ", ".join(["(" + ", ".join(["%s"] * len(fields)) + ")"] * len(leads))
+			existing = {
+				key(dict(zip(fields, row, strict=True)))
+				for row in frappe.db.sql(
+					f"""
+					select {", ".join(f"`{field}`" for field in fields)} from `tabCRM Lead`
+					where facebook_form_id = %s and ({columns}) in ({rows})
+					""",
+					[self.form_id, *(value for lead in leads for value in key(lead))],
+				)
+			}
+
+		duplicates = set()
+		for i, lead in enumerate(leads):
+			if key(lead) in existing:
+				duplicates.add(i)
+			existing.add(key(lead))
+		return duplicates
+
 
 @frappe.whitelist()
 def fetch_and_store_pages_from_facebook(access_token: str) -> list[dict]:
@@ -149,7 +281,9 @@ def fetch_and_store_pages_from_facebook(access_token: str) -> list[dict]:
 		frappe.throw(frappe._("Invalid access token provided for Facebook."))
 
 	url = get_fb_graph_api_url("/me/accounts")
-	pages = make_get_request(url, params={"access_token": access_token}).get("data", [])
+	pages = get_json("Facebook", url, endpoint="accounts", params={"access_token": access_token}).get(
+		"data", []
+	)
 	for page in pages:
 		page_id = page["id"]
 		already_synced = frappe.db.exists("Facebook Page", page_id)
@@ -164,7 +298,7 @@ def fetch_and_store_pages_from_facebook(access_token: str) -> list[dict]:
 def get_fb_account_details(access_token: str) -> dict:
 	url = get_fb_graph_api_url("me")
 	try:
-		response = make_get_request(url, params={"access_token": access_token})
+		response = get_json("Facebook", url, endpoint="me", params={"access_token": access_token})
 	except Exception as _:
 		frappe.throw(frappe._("Please check your access token"))
 	return response
@@ -186,8 +320,10 @@ def create_facebook_page_in_db(page: dict, account_details: dict) -> None:
 def fetch_and_store_leadgen_forms_from_facebook(page_id: str, page_access_token: str) -> list[dict]:
 	fields = "id,name,questions"
 	url = get_fb_graph_api_url(f"/{page_id}/leadgen_forms")
-	forms = make_get_request(
+	forms = get_json(
+		"Facebook",
 		url,
+		endpoint="leadgen_forms",
 		params={
 			"access_token": page_access_token,
 			"fields": fields,
@@ -23,10 +23,12 @@ class LeadSyncSource(Document):
 		background_sync_frequency: DF.Literal[
 			"Every 5 Minutes", "Every 10 Minutes", "Every 15 Minutes", "Hourly", "Daily", "Monthly"
 		]
+		distribution_team: DF.Link | None
 		enabled: DF.Check
 		facebook_lead_form: DF.Link | None
 		facebook_page: DF.Link | None
 		last_synced_at: DF.Datetime | None
+		sync_checkpoint: DF.JSON | None
 		type: DF.Literal["Facebook"]
 	# end: auto-generated types
 
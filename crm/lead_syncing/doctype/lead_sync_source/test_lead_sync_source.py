@@ -1,9 +1,16 @@
 # Copyright (c) 2025, Frappe Technologies Pvt. Ltd. and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
+import requests
 from frappe.tests import IntegrationTestCase
 
+from crm.lead_syncing.doctype.lead_sync_source import facebook
+from crm.lead_syncing.doctype.lead_sync_source.facebook import FacebookSyncSource
+from crm.lead_syncing.ingest import insert_leads
+
 # On IntegrationTestCase, the doctype test records and all
 # link-field test record dependencies are recursively loaded
 # Use these module variables to add/remove to/from that list
@@ -17,4 +24,127 @@ class IntegrationTestLeadSyncSource(IntegrationTestCase):
 	Use this class for testing interactions between multiple components.
 	"""
 
-	pass
+	def setUp(self):
+		self.tag = frappe.generate_hash(length=8)
+		with patch(
+			"crm.lead_syncing.doctype.lead_sync_source.lead_sync_source.fetch_and_store_pages_from_facebook"
+		):
+			self.source = frappe.get_doc(
+				{"doctype": "Lead Sync Source", "name": f"Facebook {self.tag}", "access_token": "token"}
+			).insert(ignore_permissions=True)
+
+		patcher = patch.object(
+			FacebookSyncSource,
+			"get_form_questions_mapping",
+			return_value={"full_name": "first_name", "email": "email"},
+		)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		self.pages = {
+			None: self.make_page(["1", "2"], after="c1"),
+			"c1": self.make_page(["3"]),
+		}
+
+	def make_page(self, ids, after=None):
+		leads = [
+			{
+				"id": f"{self.tag}-{lead_id}",
+				"created_time": f"2026-01-0{lead_id}T10:00:00+0000",
+				"field_data": [
+					{"name": "full_name", "values": [f"Lead {lead_id}"]},
+					{"name": "email", "values": [f"{self.tag}-{lead_id}@example.com"]},
+				],
+			}
+			for lead_id in ids
+		]
+		paging = {"cursors": {"after": after or "end"}}
+		if after:
+			paging["next"] = f"https://graph.facebook.com/next?after={after}"
+		return {"data": leads, "paging": paging}
+
+	def get_synced_leads(self):
+		filters = {"facebook_lead_id": ("like", f"{self.tag}-%")}
+		return frappe.get_all("CRM Lead", filters=filters, pluck="name")
+
+	def get_checkpoint(self):
+		return frappe.parse_json(frappe.db.get_value("Lead Sync Source", self.source.name, "sync_checkpoint"))
+
+	def sync(self):
+		FacebookSyncSource("token", self.tag, source_name=self.source.name).sync()
+
+	def test_sync_resumes_from_checkpoint(self):
+		def get_json(provider, url, endpoint=None, params=None):
+			if params.get("after"):
+				raise requests.exceptions.ConnectionError("Facebook went away")
+			return self.pages[None]
+
+		with patch.object(facebook, "get_json", side_effect=get_json):
+			self.assertRaises(requests.exceptions.ConnectionError, self.sync)
+
+		self.assertEqual(len(self.get_synced_leads()), 2)
+		self.assertEqual(self.get_checkpoint().after, "c1")
+
+		with patch.object(
+			facebook, "get_json", side_effect=lambda *args, params, **kwargs: self.pages[params["after"]]
+		) as api:
+			self.sync()
+
+		self.assertEqual([call.kwargs["params"]["after"] for call in api.call_args_list], ["c1"])
+		self.assertEqual(len(self.get_synced_leads()), 3)
+		checkpoint = self.get_checkpoint()
+		self.assertIsNone(checkpoint.get("after"))
+		self.assertEqual(checkpoint.since, facebook.get_created_timestamp(self.pages["c1"]["data"][0]))
+
+	def test_page_duplicates_are_logged_not_inserted(self):
+		page = self.make_page(["1", "2", "3"])
+		# lead 2 repeats lead 1, lead 3 repeats a lead created before the sync
+		page["data"][1]["field_data"] = page["data"][0]["field_data"]
+		FacebookSyncSource("token", self.tag, source_name=self.source.name).sync_single_lead(
+			{**self.make_page(["3"])["data"][0], "id": f"{self.tag}-existing"}
+		)
+
+		with patch.object(facebook, "get_json", return_value=page):
+			self.sync()
+
+		# lead 1 and the lead created before
+		self.assertEqual(len(self.get_synced_leads()), 2)
+		filters = {"source": self.source.name, "type": "Duplicate"}
+		self.assertEqual(frappe.db.count("Failed Lead Sync Log", filters), 2)
+
+
+class IntegrationTestLeadIngestion(IntegrationTestCase):
+	def test_insert_leads_defers_side_effects(self):
+		tag = frappe.generate_hash(length=8)
+		leads = [
+			{"first_name": "Ingested", "last_name": tag, "email": f"{tag}@example.com"},
+			{"first_name": "Invalid", "email": "not an email"},
+		]
+
+		with patch.object(frappe, "enqueue") as enqueue:
+			names, failures = insert_leads(leads)
+
+		self.assertEqual(list(failures), [1])
+		self.assertEqual(enqueue.call_args.kwargs["names"], names)
+
+		lead = frappe.get_doc("CRM Lead", names[0])
+		self.assertEqual(lead.lead_name, f"Ingested {tag}")
+		self.assertEqual(lead.status_change_log[0]["from"], lead.status)
+
+	def test_a_bad_lead_does_not_keep_the_page_out(self):
+		tag = frappe.generate_hash(length=8)
+		leads = [
+			{"first_name": "Ingested", "facebook_lead_id": f"{tag}-1"},
+			{"first_name": "x" * 200},
+			# fails the unique index only when written
+			{"first_name": "Repeated", "facebook_lead_id": f"{tag}-1"},
+		]
+
+		with patch.object(frappe, "enqueue"):
+			names, failures = insert_leads(leads)
+
+		self.assertEqual(sorted(failures), [1, 2])
+		self.assertEqual(
+			frappe.get_all("CRM Lead", filters={"name": ("in", names)}, pluck="facebook_lead_id"),
+			[f"{tag}-1"],
+		)
@@ -0,0 +1,188 @@
+"""
+Bulk lead ingestion for lead sync sources.
+
+`CRM Lead.insert()` does a lot per lead: an SLA lookup, the gravatar check of the email, the
+status change log, agent assignment and every `after_insert` and `on_update` hook (welcome
+message, phone index, assignment rules, notifications). A sync page of hundreds of leads paid
+for all of it inline.
+
+`insert_leads` only does what a lead needs to exist: name, defaults, the derived name and
+title fields, the mandatory, length, select and email checks, content sanitizing and the first
+status change log row, all in memory. A page is then written with one insert per table, lead by
+lead if that fails, so one bad lead does not keep the page out. The rest runs in
+`apply_side_effects`, from a background job queued after the page commits.
+
+`benchmark` compares both paths on a test site, in leads per second:
+
+	bench --site test.localhost execute crm.lead_syncing.ingest.benchmark --kwargs "{'count': 500}"
+"""
+
+import time
+import traceback
+
+import frappe
+from frappe.utils import has_gravatar, validate_email_address
+
+from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import add_status_change_log
+
+LEAD = "CRM Lead"
+SIDE_EFFECTS_BATCH_SIZE = 100
+
+
+def insert_leads(leads):
+	"""
+	Insert CRM Leads from a list of field value dicts, deferring their side effects.
+
+	:return: Tuple of (names of the inserted leads, `{index: traceback}` of leads that failed)
+	"""
+	docs, indexes, failures = [], {}, {}
+	for i, lead in enumerate(leads):
+		try:
+			doc = prepare_lead(lead)
+		except Exception:
+			failures[i] = frappe.get_traceback(with_context=True)
+			continue
+		docs.append(doc)
+		indexes[doc.name] = i
+
+	if not docs:
+		return [], failures
+
+	errors = insert_each(docs)
+	for name, error in errors.items():
+		failures[indexes[name]] = "".join(traceback.format_exception(error))
+	names = [doc.name for doc in docs if doc.name not in errors]
+	if not names:
+		return [], failures
+
+	for i in range(0, len(names), SIDE_EFFECTS_BATCH_SIZE):
+		frappe.enqueue(
+			"crm.lead_syncing.ingest.run_side_effects",
+			names=names[i : i + SIDE_EFFECTS_BATCH_SIZE],
+			enqueue_after_commit=True,
+		)
+	return names, failures
+
+
+def prepare_lead(lead):
+	"""Build a new lead ready to be written, running the checks `insert()` would."""
+	doc = frappe.new_doc(LEAD)
+	doc.update(lead)
+	doc.set_full_name()
+	doc.set_lead_name()
+	doc.set_title()
+	if doc.email:
+		validate_email_address(doc.email, throw=True)
+
+	add_status_change_log(doc)
+	doc.set_new_name()
+	doc.set_parent_in_children()
+	doc.set_user_and_timestamp()
+	for row in [doc, *doc.get_all_children()]:
+		row._validate_length()
+		row._validate_selects()
+		row._sanitize_content()
+	doc._validate_mandatory()
+	return doc
+
+
+def insert_docs(docs):
+	"""Write documents of one doctype and their child rows with one insert per table."""
+	tables = {}
+	for doc in docs:
+		for row in [doc, *doc.get_all_children()]:
+			values = row.get_valid_dict(convert_dates_to_str=True)
+			tables.setdefault(row.doctype, (list(values), []))[1].append(tuple(values.values()))
+
+	for doctype, (fields, rows) in tables.items():
+		frappe.db.bulk_insert(doctype, fields, rows)
+
+
+def insert_each(docs):
+	"""
+	Write `docs` with `insert_docs`, one by one if the batch fails, so one bad document costs only
+	its own insert.
+
+	:return: `{name: error}` of the documents that could not be written
+	"""
+	savepoint = f"insert_{frappe.generate_hash(length=8)}"
+	frappe.db.savepoint(savepoint)
+	try:
+		insert_docs(docs)
+		return {}
+	except Exception:
+		frappe.db.rollback(save_point=savepoint)
+
+	errors = {}
+	for doc in docs:
+		frappe.db.savepoint(savepoint)
+		try:
+			insert_docs([doc])
+		except Exception as e:
+			frappe.db.rollback(save_point=savepoint)
+			errors[doc.name] = e
+	return errors
+
+
+def run_side_effects(names):
+	"""Background job: run the deferred insert side effects of ingested leads, one commit each."""
+	for name in frappe.get_all(LEAD, filters={"name": ("in", names)}, pluck="name"):
+		try:
+			apply_side_effects(frappe.get_doc(LEAD, name))
+			frappe.db.commit()
+		except Exception:
+			frappe.db.rollback()
+			frappe.log_error(
+				title="Lead ingestion side effects failed", reference_doctype=LEAD, reference_name=name
+			)
+
+
+def apply_side_effects(doc):
+	"""What `insert()` would have done after writing the lead."""
+	doc.set_sla()
+	doc.apply_sla()
+	if doc.email and not doc.image:
+		doc.image = has_gravatar(doc.email)
+	doc.db_update()
+
+	doc.run_method("after_insert")
+	doc.run_method("on_update")
+	doc.notify_update()
+
+
+def benchmark(count=200):
+	"""
+	Insert `count` test leads through `insert()` and through `insert_leads`, then roll back.
+
+	:return: Leads per second of `insert()`, of `insert_leads` alone, and of `insert_leads` with
+		the deferred side effects included
+	"""
+	tag = frappe.generate_hash(length=6)
+
+	def make_leads(path):
+		return [
+			{"first_name": f"Benchmark {i}", "email": f"{tag}-{path}-{i}@example.com"} for i in range(count)
+		]
+
+	try:
+		started = time.perf_counter()
+		for lead in make_leads("insert"):
+			frappe.get_doc({"doctype": LEAD, **lead}).insert(ignore_permissions=True)
+		insert = time.perf_counter() - started
+
+		started = time.perf_counter()
+		names, _ = insert_leads(make_leads("bulk"))
+		bulk = time.perf_counter() - started
+
+		started = time.perf_counter()
+		for name in names:
+			apply_side_effects(frappe.get_doc(LEAD, name))
+		side_effects = time.perf_counter() - started
+	finally:
+		frappe.db.rollback()
+
+	return {
+		"insert": round(count / insert, 1),
+		"insert_leads": round(count / bulk, 1),
+		"insert_leads_with_side_effects": round(count / (bulk + side_effects), 1),
+	}
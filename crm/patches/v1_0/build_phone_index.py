@@ -0,0 +1,5 @@
+from crm.integrations.phone_index import rebuild_phone_index
+
+
+def execute():
+	rebuild_phone_index()
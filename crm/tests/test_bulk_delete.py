@@ -0,0 +1,51 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.api.bulk_delete import delete_docs
+
+
+class IntegrationTestBulkDelete(IntegrationTestCase):
+	def make_lead_with_note(self, i):
+		lead = frappe.get_doc({"doctype": "CRM Lead", "first_name": f"Delete {i}"}).insert(
+			ignore_permissions=True
+		)
+		note = frappe.get_doc(
+			{
+				"doctype": "FCRM Note",
+				"title": f"Note {i}",
+				"reference_doctype": "CRM Lead",
+				"reference_docname": lead.name,
+			}
+		).insert(ignore_permissions=True)
+		return lead.name, note.name
+
+	def test_dry_run_reports_without_deleting(self):
+		lead, note = self.make_lead_with_note(0)
+
+		plan = delete_docs("CRM Lead", [lead], dry_run=True)
+
+		self.assertTrue(frappe.db.exists("CRM Lead", lead))
+		self.assertEqual(plan["deletable"], 1)
+		self.assertIn(
+			{"doctype": "FCRM Note", "name": note, "title": "Note 0", "action": "Unlink"}, plan["linked_docs"]
+		)
+
+	def test_linked_documents_are_unlinked(self):
+		leads, notes = zip(*(self.make_lead_with_note(i) for i in range(3)), strict=True)
+
+		result = delete_docs("CRM Lead", list(leads))
+
+		self.assertEqual(result["deleted"], 3)
+		self.assertFalse(frappe.db.exists("CRM Lead", {"name": ("in", leads)}))
+		references = frappe.get_all("FCRM Note", filters={"name": ("in", notes)}, pluck="reference_docname")
+		self.assertEqual(set(references), {""})
+
+	def test_linked_documents_are_deleted_on_request(self):
+		lead, note = self.make_lead_with_note(0)
+
+		delete_docs("CRM Lead", [lead], delete_linked=True)
+
+		self.assertFalse(frappe.db.exists("FCRM Note", note))
@@ -0,0 +1,40 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.api.bulk_status import update_status
+
+
+class IntegrationTestBulkStatus(IntegrationTestCase):
+	def make_leads(self, count, status="New"):
+		return [
+			frappe.get_doc({"doctype": "CRM Lead", "first_name": f"Bulk {i}", "status": status})
+			.insert(ignore_permissions=True)
+			.name
+			for i in range(count)
+		]
+
+	def test_leads_move_and_log_their_status(self):
+		names = self.make_leads(3)
+		contacted = self.make_leads(1, status="Contacted")
+
+		result = update_status("CRM Lead", names + contacted, "Contacted")
+
+		self.assertEqual(result["updated"], 3)
+		statuses = frappe.get_all("CRM Lead", filters={"name": ("in", names)}, pluck="status", distinct=True)
+		self.assertEqual(statuses, ["Contacted"])
+		log = frappe.get_all(
+			"CRM Status Change Log",
+			filters={"parenttype": "CRM Lead", "parent": names[0]},
+			fields=["from", "to"],
+			order_by="idx",
+		)
+		self.assertEqual(
+			[(row["from"], row.to or "") for row in log], [("New", "Contacted"), ("Contacted", "")]
+		)
+
+	def test_unknown_status_is_rejected(self):
+		names = self.make_leads(1)
+		self.assertRaises(frappe.ValidationError, update_status, "CRM Lead", names, "No Such Status")
@@ -0,0 +1,299 @@
+import itertools
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+
+from crm.integrations.call_events import (
+	apply_call_event,
+	is_duplicate_event,
+	mark_event_applied,
+	merge_call_event,
+	normalize_status,
+	payload_digest,
+	upsert_call_log,
+)
+from crm.integrations.exotel.handler import get_call_event as get_exotel_call_event
+from crm.integrations.tata_tele.handler import _call_event_values, _map_status
+
+# Recorded Smartflo click-to-call webhooks for one call
+SMARTFLO_OUTBOUND_CALL = [
+	{
+		"ref_id": "3f1c8a6e-7f0e-4c55-9a55-1f0f4b1a1d01",
+		"call_id": "1737111360.123456",
+		"call_status": "ringing",
+		"agent_number": "+919876543210",
+		"destination_number": "9123456789",
+		"start_stamp": "2025-01-17 16:36:00",
+	},
+	{
+		"ref_id": "3f1c8a6e-7f0e-4c55-9a55-1f0f4b1a1d01",
+		"call_id": "1737111360.123456",
+		"call_status": "answered",
+		"answer_agent_number": "+919876543210",
+		"destination_number": "9123456789",
+		"start_stamp": "2025-01-17 16:36:00",
+		"answer_stamp": "2025-01-17 16:36:08",
+	},
+	{
+		"ref_id": "3f1c8a6e-7f0e-4c55-9a55-1f0f4b1a1d01",
+		"call_id": "1737111360.123456",
+		"call_status": "completed",
+		"answered_agent": {"name": "Agent One", "agent_number": "+919876543210"},
+		"answered_agent_number": "+919876543210",
+		"customer_no_with_prefix": "+919123456789",
+		"start_stamp": "2025-01-17 16:36:00",
+		"answer_stamp": "2025-01-17 16:36:08",
+		"end_stamp": "2025-01-17 16:36:50",
+		"billsec": "42",
+		"call_connected": "1",
+		"recording_url": "https://recordings.example.com/1737111360.123456.mp3",
+	},
+]
+
+# Recorded Exotel passthru / status callbacks for one incoming call
+EXOTEL_INCOMING_CALL = [
+	{
+		"CallSid": "b6cf3b0e3a1a6f7c0b2d4e5f6a7b1838",
+		"CallFrom": "09123456789",
+		"To": "08047091234",
+		"Direction": "incoming",
+		"CallType": "call-attempt",
+		"Status": "ringing",
+		"DialWhomNumber": "09876543210",
+		"StartTime": "2025-01-17 16:40:00",
+	},
+	{
+		"CallSid": "b6cf3b0e3a1a6f7c0b2d4e5f6a7b1838",
+		"CallFrom": "09123456789",
+		"To": "08047091234",
+		"Direction": "incoming",
+		"CallType": "call-attempt",
+		"Status": "in-progress",
+		"DialWhomNumber": "09876543210",
+		"StartTime": "2025-01-17 16:40:00",
+	},
+	{
+		"CallSid": "b6cf3b0e3a1a6f7c0b2d4e5f6a7b1838",
+		"CallFrom": "09123456789",
+		"To": "08047091234",
+		"Direction": "incoming",
+		"CallType": "completed",
+		"DialCallStatus": "completed",
+		"DialWhomNumber": "09876543210",
+		"DialCallDuration": "65",
+		"RecordingUrl": "https://recordings.exotel.com/b6cf3b0e.mp3",
+		"StartTime": "2025-01-17 16:40:00",
+		"EndTime": "2025-01-17 16:41:12",
+	},
+]
+
+
+def smartflo_events(payloads):
+	events = []
+	for payload in payloads:
+		status = _map_status(payload)
+		events.append((payload["ref_id"], status, _call_event_values(payload, status)))
+	return events
+
+
+def exotel_events(payloads):
+	return [(payload["CallSid"], *get_exotel_call_event(payload)) for payload in payloads]
+
+
+class CallLogReplayStore:
+	"""In-memory call log table where each row is locked while an event is merged, like `for update`."""
+
+	def __init__(self):
+		self.rows = {}
+		self.locks = {}
+		self.table_lock = threading.Lock()
+
+	def apply(self, call_id, status, values):
+		with self.table_lock:
+			lock = self.locks.setdefault(call_id, threading.Lock())
+
+		with lock:
+			row = self.rows.setdefault(call_id, {})
+			row.update(merge_call_event(row, status, values))
+
+
+def replay(events, concurrency=8):
+	store = CallLogReplayStore()
+	with ThreadPoolExecutor(max_workers=concurrency) as pool:
+		for future in [pool.submit(store.apply, *event) for event in events]:
+			future.result()
+	return store.rows
+
+
+def in_new_connection(fn, *args):
+	"""Run `fn` on a connection of its own, in its own thread, and commit."""
+	site, sites_path = frappe.local.site, frappe.local.sites_path
+
+	def run():
+		frappe.init(site, sites_path=sites_path)
+		frappe.connect()
+		try:
+			result = fn(*args)
+			frappe.db.commit()
+			return result
+		finally:
+			frappe.destroy()
+
+	with ThreadPoolExecutor(max_workers=1) as pool:
+		return pool.submit(run).result()
+
+
+class TestCallEventStateMachine(UnitTestCase):
+	def test_normalize_status(self):
+		self.assertEqual(normalize_status("No answer"), "No Answer")
+		self.assertEqual(normalize_status("Cancelled"), "Canceled")
+		self.assertEqual(normalize_status("in-progress"), "In Progress")
+		self.assertIsNone(normalize_status("free"))
+
+	def test_completed_call_is_never_downgraded(self):
+		row = {"status": "Completed", "duration": 42}
+		self.assertEqual(merge_call_event(row, "Ringing", {"duration": 0}), {})
+		self.assertEqual(merge_call_event(row, "In Progress", {}), {})
+
+	def test_first_terminal_event_wins(self):
+		row = {"status": "Completed", "duration": 42, "end_time": "2025-01-17 16:36:50"}
+		updates = merge_call_event(row, "No Answer", {"duration": 0, "end_time": "2025-01-17 16:37:00"})
+		self.assertEqual(updates, {})
+
+	def test_stale_event_only_fills_gaps(self):
+		row = {"status": "In Progress", "to": "9876543210"}
+		updates = merge_call_event(row, "Ringing", {"to": "1111111111", "from": "9123456789"})
+		self.assertEqual(updates, {"from": "9123456789"})
+
+	def test_terminal_fields_need_terminal_event(self):
+		updates = merge_call_event({"status": "Ringing"}, "In Progress", {"duration": 10})
+		self.assertEqual(updates, {"status": "In Progress"})
+
+	def test_replay_in_any_order_gives_same_row(self):
+		for events in (smartflo_events(SMARTFLO_OUTBOUND_CALL), exotel_events(EXOTEL_INCOMING_CALL)):
+			expected = replay(events, concurrency=1)
+			for permutation in itertools.permutations(events):
+				self.assertEqual(replay(permutation, concurrency=1), expected)
+
+			(row,) = expected.values()
+			self.assertEqual(row["status"], "Completed")
+			self.assertTrue(row["duration"])
+			self.assertTrue(row["recording_url"])
+
+	def test_concurrent_replay_with_redelivery(self):
+		calls = []
+		for i in range(20):
+			for payloads, to_events in (
+				(SMARTFLO_OUTBOUND_CALL, smartflo_events),
+				(EXOTEL_INCOMING_CALL, exotel_events),
+			):
+				calls.append(
+					[(f"{call_id}-{i}", status, values) for call_id, status, values in to_events(payloads)]
+				)
+
+		expected = {}
+		for events in calls:
+			expected.update(replay(events, concurrency=1))
+
+		rng = random.Random(26)
+		# every event delivered up to three times, interleaved across calls
+		deliveries = [event for events in calls for event in events for _ in range(rng.randint(1, 3))]
+		rng.shuffle(deliveries)
+
+		self.assertEqual(replay(deliveries, concurrency=16), expected)
+
+
+class IntegrationTestCallEvents(IntegrationTestCase):
+	def test_replay_through_call_log(self):
+		events = smartflo_events(SMARTFLO_OUTBOUND_CALL)
+		for i, permutation in enumerate(itertools.permutations(events)):
+			for call_id, status, values in permutation:
+				apply_call_event(
+					f"{call_id}-{i}",
+					status,
+					values,
+					defaults={"telephony_medium": "Tata Tele", "type": "Outgoing"},
+				)
+
+			row = frappe.db.get_value(
+				"CRM Call Log",
+				f"{events[0][0]}-{i}",
+				["status", "duration", "recording_url", "from", "to"],
+				as_dict=True,
+			)
+			self.assertEqual(row.status, "Completed")
+			self.assertEqual(row.duration, 42)
+			self.assertEqual(row.recording_url, "https://recordings.example.com/1737111360.123456.mp3")
+			self.assertEqual(row["from"], "9876543210")
+			self.assertEqual(row.to, "9123456789")
+
+	def test_redelivered_event_is_applied_once(self):
+		call_id, status, values = smartflo_events(SMARTFLO_OUTBOUND_CALL)[2]
+		first = apply_call_event(
+			call_id, status, values, defaults={"type": "Outgoing"}, event_key="completed"
+		)
+		again = apply_call_event(call_id, status, values, event_key="completed")
+		self.assertEqual(first.status, again.status)
+		self.assertEqual(frappe.db.count("CRM Call Log", {"id": call_id}), 1)
+
+	def test_applied_event_is_recognised_as_duplicate(self):
+		call_id = frappe.generate_hash(length=10)
+		self.assertFalse(is_duplicate_event(call_id, "completed"))
+		mark_event_applied(call_id, "completed")
+		self.assertTrue(is_duplicate_event(call_id, "completed"))
+
+	def test_upsert_race_merges_into_existing_row(self):
+		call_id, status, values = smartflo_events(SMARTFLO_OUTBOUND_CALL)[2]
+		created = upsert_call_log(call_id, status, values, defaults={"type": "Outgoing"})
+		self.assertEqual(created["from"], "9876543210")
+
+		# a late "ringing" event that lost the insert race goes through the update clause
+		merged = upsert_call_log(
+			call_id,
+			"Ringing",
+			{"to": "1111111111", "duration": 5},
+			defaults={"type": "Outgoing", "from": "9876543210"},
+		)
+		self.assertEqual(merged.status, "Completed")
+		self.assertEqual(merged.to, "9123456789")
+		self.assertEqual(merged.duration, 42)
+
+	def test_new_call_log_needs_its_mandatory_fields(self):
+		call_id, status, values = smartflo_events(SMARTFLO_OUTBOUND_CALL)[0]
+		self.assertRaises(frappe.MandatoryError, upsert_call_log, f"{call_id}-untyped", status, values)
+		self.assertFalse(frappe.db.exists("CRM Call Log", f"{call_id}-untyped"))
+
+	def test_concurrent_replay_through_call_log(self):
+		call_id = f"concurrent-{frappe.generate_hash(length=8)}"
+		self.addCleanup(in_new_connection, lambda: frappe.db.delete("CRM Call Log", {"name": call_id}))
+		events = [
+			(call_id, status, values) for _ref_id, status, values in smartflo_events(SMARTFLO_OUTBOUND_CALL)
+		]
+		# every event delivered twice, in random order, all at once: the first events race to insert
+		deliveries = events * 2
+		random.Random(26).shuffle(deliveries)
+		barrier = threading.Barrier(len(deliveries))
+
+		def deliver(call_id, status, values):
+			barrier.wait()
+			apply_call_event(
+				call_id,
+				status,
+				values,
+				defaults={"telephony_medium": "Tata Tele", "type": "Outgoing"},
+				event_key=payload_digest(values),
+			)
+
+		with ThreadPoolExecutor(max_workers=len(deliveries)) as pool:
+			for future in [pool.submit(in_new_connection, deliver, *event) for event in deliveries]:
+				future.result()
+
+		fields = ["status", "duration", "recording_url", "to"]
+		row = in_new_connection(lambda: frappe.db.get_value("CRM Call Log", call_id, fields, as_dict=True))
+		self.assertEqual(row.status, "Completed")
+		self.assertEqual(row.duration, 42)
+		self.assertEqual(row.recording_url, "https://recordings.example.com/1737111360.123456.mp3")
+		self.assertEqual(row.to, "9123456789")
@@ -0,0 +1,91 @@
+import os
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.fcrm.doctype.crm_call_log.crm_call_log import parse_call_log
+from crm.integrations import call_recordings
+from crm.integrations.call_recordings import (
+	download_recording,
+	fetch_recording,
+	get_recording_url,
+	trim_recording_cache,
+	validate_recording_url,
+)
+
+
+def make_call_log(call_id, recording_url):
+	return frappe.get_doc(
+		{
+			"doctype": "CRM Call Log",
+			"id": call_id,
+			"type": "Incoming",
+			"status": "Completed",
+			"from": "9876543210",
+			"to": "9123456789",
+			"recording_url": recording_url,
+		}
+	).insert(ignore_permissions=True)
+
+
+class IntegrationTestCallRecordings(IntegrationTestCase):
+	def fetch(self, call_log, content):
+		with patch.object(call_recordings, "download_recording", return_value=(content, "audio/mpeg")):
+			fetch_recording(call_log)
+		return frappe.db.get_value("CRM Call Log", call_log, "recording_file")
+
+	def test_same_content_is_stored_once(self):
+		first = make_call_log("recording-1", "https://recordings.example.com/1.mp3")
+		second = make_call_log("recording-2", "https://recordings.example.com/2.mp3")
+
+		first_file = self.fetch(first.name, b"ID3 recording")
+		second_file = self.fetch(second.name, b"ID3 recording")
+		self.assertTrue(first_file)
+		self.assertNotEqual(first_file, second_file)
+		self.assertEqual(
+			frappe.db.get_value("File", second_file, ["file_url", "attached_to_name"]),
+			(frappe.db.get_value("File", first_file, "file_url"), second.name),
+		)
+
+		# the second call log keeps its recording when the first one's File goes
+		frappe.delete_doc("File", first_file, ignore_permissions=True, force=True)
+		self.assertTrue(os.path.exists(frappe.get_doc("File", second_file).get_full_path()))
+
+		call = frappe.get_doc("CRM Call Log", first.name).as_dict()
+		self.assertEqual(parse_call_log(call)["recording_url"], get_recording_url(first.name))
+
+	def test_trim_drops_oldest_recordings(self):
+		old = make_call_log("recording-old", "https://recordings.example.com/old.mp3")
+		new = make_call_log("recording-new", "https://recordings.example.com/new.mp3")
+		old_file = self.fetch(old.name, b"0" * 700 * 1024)
+		frappe.db.set_value("File", old_file, "creation", "2025-01-01 00:00:00")
+		self.fetch(new.name, b"1" * 700 * 1024)
+
+		with patch.object(frappe.db, "get_single_value", return_value=1):
+			trim_recording_cache()
+
+		self.assertFalse(frappe.db.get_value("CRM Call Log", old.name, "recording_file"))
+		self.assertFalse(frappe.db.exists("File", old_file))
+		self.assertTrue(frappe.db.get_value("CRM Call Log", new.name, "recording_file"))
+
+	def test_only_provider_recording_hosts_are_fetched(self):
+		validate_recording_url("https://recordings.exotel.com/a.mp3", "Exotel")
+		validate_recording_url("https://s3-ap-southeast-1.amazonaws.com/exotelrecordings/a.mp3", "Exotel")
+		for url, medium in (
+			("http://recordings.exotel.com/a.mp3", "Exotel"),
+			("https://169.254.169.254/latest/meta-data", "Exotel"),
+			("https://exotel.com.example.com/a.mp3", "Exotel"),
+			("https://s3-ap-southeast-1.amazonaws.com/other-bucket/a.mp3", "Exotel"),
+			("https://recordings.exotel.com/a.mp3", "Tata Tele"),
+			("https://recordings.exotel.com/a.mp3", None),
+		):
+			self.assertRaises(ValueError, validate_recording_url, url, medium)
+
+	def test_redirect_off_the_recording_hosts_is_not_followed(self):
+		response = frappe._dict(is_redirect=True, headers={"Location": "http://localhost:8000/private"})
+		with patch.object(call_recordings.http_client, "get") as get:
+			get.return_value.__enter__.return_value = response
+			self.assertRaises(ValueError, download_recording, "https://recordings.exotel.com/a.mp3", "Exotel")
+		self.assertEqual(get.call_count, 1)
+		self.assertFalse(get.call_args.kwargs["allow_redirects"])
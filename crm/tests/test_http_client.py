@@ -0,0 +1,95 @@
+from unittest.mock import MagicMock, patch
+
+import frappe
+import requests
+from frappe.tests import UnitTestCase
+
+from crm.integrations import http_client
+from crm.integrations.http_client import (
+	CircuitBreaker,
+	CircuitOpenError,
+	get_http_metrics,
+	get_session,
+	request,
+)
+
+
+def response(status_code):
+	res = MagicMock(status_code=status_code, headers={})
+	return res
+
+
+class TestHTTPClient(UnitTestCase):
+	def setUp(self):
+		self.session = MagicMock()
+		for target, value in (
+			("get_session", MagicMock(return_value=self.session)),
+			("sleep_before_retry", MagicMock()),
+		):
+			patcher = patch.object(http_client, target, value)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		http_client._breakers.clear()
+
+	def test_get_is_retried_on_server_error(self):
+		self.session.request.side_effect = [response(502), response(200)]
+		self.assertEqual(request("Test", "GET", "https://example.com").status_code, 200)
+		self.assertEqual(self.session.request.call_count, 2)
+
+	def test_post_is_not_retried_after_it_may_have_been_received(self):
+		self.session.request.side_effect = [response(502), response(200)]
+		self.assertEqual(request("Test", "POST", "https://example.com").status_code, 502)
+
+		self.session.request.side_effect = requests.exceptions.ReadTimeout()
+		with self.assertRaises(requests.exceptions.ReadTimeout):
+			request("Test", "POST", "https://example.com")
+
+	def test_post_is_retried_when_refused(self):
+		self.session.request.side_effect = [
+			response(429),
+			requests.exceptions.ConnectTimeout(),
+			response(200),
+		]
+		self.assertEqual(request("Test", "POST", "https://example.com").status_code, 200)
+
+	def test_breaker_opens_and_fails_fast(self):
+		self.session.request.side_effect = requests.exceptions.ConnectionError()
+		for _ in range(http_client.BREAKER_THRESHOLD):
+			with self.assertRaises(requests.exceptions.ConnectionError):
+				request("Test", "POST", "https://example.com", endpoint="send")
+
+		calls = self.session.request.call_count
+		with self.assertRaises(CircuitOpenError):
+			request("Test", "POST", "https://example.com", endpoint="send")
+		self.assertEqual(self.session.request.call_count, calls)
+
+		# other endpoints of the provider are not affected
+		self.session.request.side_effect = None
+		self.session.request.return_value = response(200)
+		self.assertEqual(request("Test", "GET", "https://example.com", endpoint="status").status_code, 200)
+
+	def test_breaker_half_open_after_cooldown(self):
+		breaker = CircuitBreaker(threshold=1, cooldown=0)
+		breaker.record(ok=False)
+		self.assertTrue(breaker.allow())
+		breaker.record(ok=True)
+		self.assertIsNone(breaker.opened_at)
+
+	def test_metrics_of_a_request_are_read_back(self):
+		provider = f"Test {frappe.generate_hash(length=6)}"
+		self.session.request.side_effect = [response(502), response(200)]
+		request(provider, "GET", "https://example.com", endpoint="status")
+
+		metrics = [row for row in get_http_metrics() if row["provider"] == provider]
+		self.assertEqual(len(metrics), 1)
+		self.assertEqual(metrics[0]["endpoint"], "status")
+		self.assertEqual(metrics[0]["requests"], 2)
+		self.assertEqual(metrics[0]["errors"], 1)
+
+
+class TestHTTPSessions(UnitTestCase):
+	def test_sessions_are_not_shared_across_sites(self):
+		session = get_session("Test")
+		with patch.object(frappe.local, "site", "other.localhost"):
+			self.assertIsNot(get_session("Test"), session)
+		self.assertIs(get_session("Test"), session)
@@ -0,0 +1,71 @@
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.integrations.interakt.api import fetch_all_templates, sync_templates
+
+
+def interakt_response(templates, count):
+	return {"success": True, "templates": [{"count": count, "results": {"templates": templates}}]}
+
+
+def make_interakt(templates, page_size=2):
+	interakt = MagicMock()
+	interakt.get_templates.side_effect = lambda offset=0: interakt_response(
+		templates[offset : offset + page_size], len(templates)
+	)
+	return interakt
+
+
+class IntegrationTestInteraktTemplateSync(IntegrationTestCase):
+	def setUp(self):
+		prefix = f"sync_test_{frappe.generate_hash(length=6)}"
+		self.templates = [
+			{
+				"id": f"{prefix}-{i}",
+				"name": f"{prefix}_{i}",
+				"body": f"Hello {{{{1}}}}, offer {i}",
+				"approval_status": "APPROVED",
+				"language": "en",
+			}
+			for i in range(5)
+		]
+
+	def get_field(self, i, field):
+		return frappe.db.get_value("WhatsApp Templates", self.templates[i]["name"], field)
+
+	def test_fetch_pages_through_templates(self):
+		interakt = make_interakt(self.templates)
+		templates, error = fetch_all_templates(interakt)
+		self.assertIsNone(error)
+		self.assertEqual(len(templates), 5)
+		self.assertEqual(interakt.get_templates.call_count, 3)
+
+	def test_fetch_stops_when_offset_is_ignored(self):
+		interakt = MagicMock()
+		interakt.get_templates.return_value = {"success": True, "templates": self.templates[:2]}
+		templates, _ = fetch_all_templates(interakt)
+		self.assertEqual(len(templates), 2)
+		self.assertEqual(interakt.get_templates.call_count, 2)
+
+	def test_only_changes_are_written(self):
+		result = sync_templates(make_interakt(self.templates))
+		self.assertEqual((result["added"], result["updated"]), (5, 0))
+		self.assertEqual(self.get_field(0, "variable_count"), 1)
+
+		with patch.object(frappe.db, "bulk_update") as bulk_update:
+			result = sync_templates(make_interakt(self.templates))
+		self.assertEqual((result["added"], result["updated"]), (0, 0))
+		bulk_update.assert_not_called()
+
+		self.templates[1]["body"] = "Hi {{1}} and {{2}}"
+		result = sync_templates(make_interakt(self.templates[1:]))
+		self.assertEqual(result["updated"], 1)
+		self.assertEqual(self.get_field(1, "variable_count"), 2)
+		self.assertGreaterEqual(result["stale"], 1)
+		self.assertTrue(self.get_field(0, "is_stale"))
+
+		# back on Interakt
+		sync_templates(make_interakt(self.templates))
+		self.assertFalse(self.get_field(0, "is_stale"))
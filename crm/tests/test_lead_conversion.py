@@ -0,0 +1,65 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.api.lead_conversion import convert_lead_batch, prepare_contact
+
+
+class IntegrationTestLeadConversion(IntegrationTestCase):
+	def make_lead(self, **values):
+		lead = {"doctype": "CRM Lead", "first_name": "Convert", **values}
+		return frappe.get_doc(lead).insert(ignore_permissions=True).name
+
+	def test_leads_sharing_email_and_organization_share_them(self):
+		tag = frappe.generate_hash(length=6)
+		email = f"{tag}@example.com"
+		names = [self.make_lead(email=email, organization=f"Org {tag}") for _ in range(2)]
+
+		result = convert_lead_batch(names)
+
+		self.assertEqual(set(result["deals"]), set(names))
+		self.assertEqual(frappe.db.count("Contact Email", {"email_id": email}), 1)
+		self.assertEqual(frappe.db.count("CRM Organization", {"organization_name": f"Org {tag}"}), 1)
+		for name in names:
+			self.assertTrue(frappe.db.get_value("CRM Lead", name, "converted"))
+
+	def test_a_failing_lead_does_not_stop_the_batch(self):
+		good = self.make_lead(email=f"{frappe.generate_hash(length=6)}@example.com")
+		bad = self.make_lead(email=f"{frappe.generate_hash(length=6)}@example.com")
+		frappe.db.set_value("CRM Lead", bad, "territory", "No Such Territory")
+
+		result = convert_lead_batch([good, bad])
+
+		self.assertIn(good, result["deals"])
+		self.assertIn(bad, result["failed"])
+		self.assertFalse(frappe.db.get_value("CRM Lead", bad, "converted"))
+
+	def test_a_lead_whose_contact_fails_does_not_stop_the_batch(self):
+		good = self.make_lead(email=f"{frappe.generate_hash(length=6)}@example.com")
+		bad = self.make_lead(email=f"{frappe.generate_hash(length=6)}@example.com")
+
+		def prepare(lead, used_names):
+			if lead.name == bad:
+				raise frappe.ValidationError("Bad contact")
+			return prepare_contact(lead, used_names)
+
+		with patch("crm.api.lead_conversion.prepare_contact", side_effect=prepare):
+			result = convert_lead_batch([good, bad])
+
+		self.assertIn(good, result["deals"])
+		self.assertEqual(result["failed"], {bad: "Bad contact"})
+		self.assertFalse(frappe.db.get_value("CRM Lead", bad, "converted"))
+
+	def test_leads_the_user_cannot_change_are_left_out(self):
+		name = self.make_lead(email=f"{frappe.generate_hash(length=6)}@example.com")
+
+		frappe.set_user("Guest")
+		self.addCleanup(frappe.set_user, "Administrator")
+		result = convert_lead_batch([name])
+
+		self.assertEqual(result["deals"], {})
+		self.assertFalse(frappe.db.get_value("CRM Lead", name, "converted"))
@@ -0,0 +1,37 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+from collections import Counter
+
+from frappe.tests import UnitTestCase
+
+from crm.api.lead_distribution import Agent, TeamState, benchmark
+
+
+class TestLeadDistribution(UnitTestCase):
+	def test_leads_follow_weights_interleaved(self):
+		state = TeamState("Team", [Agent("a", weight=1), Agent("b", weight=3)])
+
+		picks = [state.pick() for _ in range(8)]
+
+		self.assertEqual(Counter(picks), {"a": 2, "b": 6})
+		# never more than the weights allow in a row
+		self.assertNotIn(["b"] * 4, [picks[i : i + 4] for i in range(5)])
+
+	def test_full_agents_are_passed_over(self):
+		state = TeamState("Team", [Agent("a", capacity=2, open_leads=1), Agent("b")])
+
+		picks = [state.pick() for _ in range(4)]
+
+		self.assertEqual(picks.count("a"), 1)
+		self.assertEqual(picks.count("b"), 3)
+
+	def test_no_agent_with_capacity_leaves_lead_unassigned(self):
+		state = TeamState("Team", [Agent("a", capacity=1, open_leads=1)])
+		self.assertEqual(state.assign(2), [None, None])
+
+	def test_benchmark_fairness(self):
+		result = benchmark(count=20000)
+
+		self.assertGreater(result["leads_per_second"], 1000)
+		self.assertLess(result["max_window_deviation"], 0.01)
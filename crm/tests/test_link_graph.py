@@ -0,0 +1,61 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.utils.link_graph import clear_link_graph, get_link_graph, get_linking_documents
+
+
+class IntegrationTestLinkGraph(IntegrationTestCase):
+	def setUp(self):
+		clear_link_graph()
+
+	def test_graph_lists_link_and_dynamic_link_fields(self):
+		fields = {(field["doctype"], field["fieldname"]): field for field in get_link_graph("CRM Lead")}
+
+		self.assertIsNone(fields[("CRM Deal", "lead")]["options"])
+		self.assertEqual(fields[("FCRM Note", "reference_docname")]["options"], "reference_doctype")
+
+	def test_linking_documents_of_several_names(self):
+		leads = [
+			frappe.get_doc({"doctype": "CRM Lead", "first_name": f"Graph {i}"}).insert(
+				ignore_permissions=True
+			)
+			for i in range(2)
+		]
+		notes = [
+			frappe.get_doc(
+				{
+					"doctype": "FCRM Note",
+					"title": f"Graph note {i}",
+					"reference_doctype": "CRM Lead",
+					"reference_docname": lead.name,
+				}
+			)
+			.insert(ignore_permissions=True)
+			.name
+			for i, lead in enumerate(leads)
+		]
+
+		documents = get_linking_documents("CRM Lead", [lead.name for lead in leads], links=False)
+
+		found = {(row.doctype, row.name): row.target for row in documents if row.doctype == "FCRM Note"}
+		expected = {("FCRM Note", note): lead.name for note, lead in zip(notes, leads, strict=True)}
+		self.assertEqual(found, expected)
+
+	def test_custom_field_clears_the_graph(self):
+		get_link_graph("CRM Lead")
+		frappe.get_doc(
+			{
+				"doctype": "Custom Field",
+				"dt": "CRM Task",
+				"fieldname": "graph_test_lead",
+				"fieldtype": "Link",
+				"options": "CRM Lead",
+			}
+		).insert(ignore_permissions=True)
+		self.addCleanup(frappe.delete_doc, "Custom Field", "CRM Task-graph_test_lead")
+
+		fields = {(field["doctype"], field["fieldname"]) for field in get_link_graph("CRM Lead")}
+		self.assertIn(("CRM Task", "graph_test_lead"), fields)
@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.integrations import outbox
+from crm.integrations.outbox import MAX_ATTEMPTS, get_backoff, queue_message, send_message
+
+
+def queue(key):
+	return queue_message(
+		"Interakt",
+		"CRM Lead",
+		"CRM-LEAD-TEST",
+		"9876543210",
+		country_code="+91",
+		template_name="seller_registration",
+		message={"body_values": ["Seller"]},
+		idempotency_key=key,
+	)
+
+
+class IntegrationTestMessageOutbox(IntegrationTestCase):
+	def setUp(self):
+		self.sender = patch.dict(outbox.PROVIDERS, {"Interakt": {"send": "send", "on_failure": "failed"}})
+		self.sender.start()
+		self.addCleanup(self.sender.stop)
+		patcher = patch.object(outbox, "throttle")
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def send(self, name, result):
+		with patch.object(frappe, "get_attr", return_value=lambda doc: result):
+			send_message(name)
+		return frappe.get_doc("CRM Message Outbox", name)
+
+	def test_queue_is_idempotent(self):
+		self.assertTrue(queue("outbox-test-1"))
+		self.assertIsNone(queue("outbox-test-1"))
+		self.assertEqual(frappe.db.count("CRM Message Outbox", {"idempotency_key": "outbox-test-1"}), 1)
+
+	def test_sent_message(self):
+		doc = self.send(queue("outbox-test-2"), {"success": True, "message_id": "msg-1"})
+		self.assertEqual((doc.status, doc.attempts, doc.message_id), ("Sent", 1, "msg-1"))
+
+	def test_retry_with_backoff_then_fail(self):
+		name = queue("outbox-test-3")
+		for attempt in range(1, MAX_ATTEMPTS):
+			doc = self.send(name, {"success": False, "error": "timeout", "retryable": True})
+			self.assertEqual((doc.status, doc.attempts), ("Queued", attempt))
+			self.assertGreater(doc.next_attempt_at, frappe.utils.now_datetime())
+
+		doc = self.send(name, {"success": False, "error": "timeout", "retryable": True})
+		self.assertEqual((doc.status, doc.attempts), ("Failed", MAX_ATTEMPTS))
+
+	def test_rejected_message_is_not_retried(self):
+		doc = self.send(queue("outbox-test-4"), {"success": False, "error": "invalid", "retryable": False})
+		self.assertEqual((doc.status, doc.attempts), ("Failed", 1))
+
+	def test_backoff_grows_and_is_capped(self):
+		self.assertLess(get_backoff(1), get_backoff(5))
+		self.assertLessEqual(get_backoff(50), outbox.BACKOFF_MAX_SECONDS * 1.2)
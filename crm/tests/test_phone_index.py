@@ -0,0 +1,57 @@
+import random
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+
+from crm.integrations import phone_index
+from crm.integrations.phone_index import find_document_by_phone, normalize_phone, record_unmatched_phone
+
+
+class TestNormalizePhone(UnitTestCase):
+	def test_formats_of_a_number_match(self):
+		for phone in ("+91 98765-43210", "098765 43210", "919876543210", "9876543210", "(+91) 98765 43210"):
+			self.assertEqual(normalize_phone(phone, "+91"), "9876543210")
+
+	def test_foreign_and_short_numbers_keep_their_digits(self):
+		self.assertEqual(normalize_phone("+1 (555) 123-4567", "+91"), "15551234567")
+		self.assertEqual(normalize_phone("91234", "+91"), "91234")
+		self.assertEqual(normalize_phone(None, "+91"), "")
+
+
+class IntegrationTestPhoneIndex(IntegrationTestCase):
+	def setUp(self):
+		self.number = f"9{random.randint(0, 10**9 - 1):09d}"
+		frappe.cache.delete_value(phone_index._route_key(self.number))
+
+	def make_lead(self, mobile_no):
+		return frappe.get_doc(
+			{"doctype": "CRM Lead", "first_name": "Phone Index", "mobile_no": mobile_no}
+		).insert(ignore_permissions=True)
+
+	def test_sender_is_found_with_one_query_then_cached(self):
+		lead = self.make_lead(f"+91 {self.number[:5]} {self.number[5:]}")
+
+		with patch.object(phone_index.frappe.db, "sql", wraps=frappe.db.sql) as sql:
+			self.assertEqual(find_document_by_phone(f"91{self.number}"), ("CRM Lead", lead.name))
+			self.assertEqual(find_document_by_phone(f"0{self.number}"), ("CRM Lead", lead.name))
+		self.assertEqual(sql.call_count, 1)
+
+	def test_changed_number_is_reindexed(self):
+		lead = self.make_lead(self.number)
+		self.assertEqual(find_document_by_phone(self.number), ("CRM Lead", lead.name))
+
+		lead.mobile_no = "9000000001"
+		lead.save(ignore_permissions=True)
+		self.assertEqual(find_document_by_phone(self.number), (None, None))
+
+	def test_unmatched_sender_is_recorded_until_a_lead_has_the_number(self):
+		self.assertEqual(find_document_by_phone(self.number), (None, None))
+		record_unmatched_phone(f"+91{self.number}", "WhatsApp", "Hi")
+		record_unmatched_phone(f"+91{self.number}", "WhatsApp", "Hello?")
+		unmatched = frappe.get_doc("CRM Unmatched Phone", self.number)
+		self.assertEqual((unmatched.message_count, unmatched.last_message), (2, "Hello?"))
+
+		lead = self.make_lead(self.number)
+		self.assertFalse(frappe.db.exists("CRM Unmatched Phone", self.number))
+		self.assertEqual(find_document_by_phone(self.number), ("CRM Lead", lead.name))
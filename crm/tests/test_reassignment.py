@@ -0,0 +1,65 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.api.reassignment import reassign
+
+
+class IntegrationTestReassignment(IntegrationTestCase):
+	def setUp(self):
+		self.owner = "test_reassignment@example.com"
+		if not frappe.db.exists("User", self.owner):
+			frappe.get_doc(
+				{
+					"doctype": "User",
+					"email": self.owner,
+					"first_name": "Reassignment",
+					"send_welcome_email": 0,
+				}
+			).insert(ignore_permissions=True)
+
+	def make_leads(self, count):
+		leads = [{"doctype": "CRM Lead", "first_name": f"Reassign {i}"} for i in range(count)]
+		return [frappe.get_doc(lead).insert(ignore_permissions=True).name for lead in leads]
+
+	def test_leads_are_shared_assigned_and_owner_notified_once(self):
+		names = self.make_leads(3)
+		frappe.share.add_docshare(
+			"CRM Lead", names[0], "Administrator", flags={"ignore_share_permission": True}
+		)
+
+		result = reassign("CRM Lead", names, self.owner)
+
+		self.assertEqual(result["reassigned"], 3)
+		for name in names:
+			self.assertEqual(frappe.db.get_value("CRM Lead", name, "lead_owner"), self.owner)
+			shares = frappe.get_all(
+				"DocShare", filters={"share_doctype": "CRM Lead", "share_name": name}, pluck="user"
+			)
+			self.assertEqual(shares, [self.owner])
+			self.assertTrue(
+				frappe.db.exists(
+					"ToDo", {"reference_type": "CRM Lead", "reference_name": name, "allocated_to": self.owner}
+				)
+			)
+			self.assertIn(self.owner, frappe.parse_json(frappe.db.get_value("CRM Lead", name, "_assign")))
+
+		notifications = {"to_user": self.owner, "type": "Assignment"}
+		self.assertEqual(frappe.db.count("CRM Notification", notifications), 1)
+
+	def test_reassigning_twice_adds_nothing(self):
+		names = self.make_leads(1)
+		reassign("CRM Lead", names, self.owner)
+		reassign("CRM Lead", names, self.owner)
+
+		self.assertEqual(frappe.db.count("ToDo", {"reference_name": names[0], "allocated_to": self.owner}), 1)
+
+	def test_owner_of_one_lead_gets_frappe_assignment_notification(self):
+		lead = frappe.get_doc(
+			{"doctype": "CRM Lead", "first_name": "Owned", "lead_owner": self.owner}
+		).insert(ignore_permissions=True)
+
+		filters = {"for_user": self.owner, "document_type": "CRM Lead", "document_name": lead.name}
+		self.assertTrue(frappe.db.exists("Notification Log", {**filters, "type": "Assignment"}))
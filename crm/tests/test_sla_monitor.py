@@ -0,0 +1,71 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import add_to_date, getdate, now_datetime
+
+from crm.fcrm.doctype.crm_service_level_agreement.sla_monitor import (
+	get_sla_breach_rate,
+	record_sla_metrics,
+	sweep_sla_breaches,
+)
+
+
+class IntegrationTestSLAMonitor(IntegrationTestCase):
+	def make_lead(self, **sla_values):
+		lead = frappe.get_doc(
+			{"doctype": "CRM Lead", "first_name": "SLA", "lead_owner": "Administrator"}
+		).insert(ignore_permissions=True)
+		frappe.db.set_value("CRM Lead", lead.name, sla_values, update_modified=False)
+		return lead.name
+
+	def test_overdue_records_fail_and_owners_are_notified(self):
+		overdue = add_to_date(now_datetime(), hours=-1)
+		breached = self.make_lead(sla_status="First Response Due", response_by=overdue)
+		responded = self.make_lead(
+			sla_status="First Response Due", response_by=overdue, first_responded_on=now_datetime()
+		)
+		# no response since the last one, the rolling deadline counted from it passed
+		rolling = self.make_lead(
+			sla_status="Rolling Response Due",
+			response_by=overdue,
+			last_responded_on=add_to_date(now_datetime(), hours=-3),
+		)
+		pending = self.make_lead(
+			sla_status="Rolling Response Due",
+			response_by=add_to_date(now_datetime(), hours=1),
+			last_responded_on=add_to_date(now_datetime(), hours=-1),
+		)
+
+		sweep_sla_breaches()
+
+		statuses = dict(
+			frappe.get_all(
+				"CRM Lead",
+				filters={"name": ("in", [breached, responded, rolling, pending])},
+				fields=["name", "sla_status"],
+				as_list=True,
+			)
+		)
+		self.assertEqual(statuses[breached], "Failed")
+		self.assertEqual(statuses[responded], "First Response Due")
+		self.assertEqual(statuses[rolling], "Failed")
+		self.assertEqual(statuses[pending], "Rolling Response Due")
+		self.assertTrue(
+			frappe.db.exists(
+				"CRM Notification", {"type": "SLA", "reference_name": breached, "to_user": "Administrator"}
+			)
+		)
+
+	def test_recorded_metrics_are_read_back(self):
+		def today():
+			return next(row for row in get_sla_breach_rate(days=1) if row["doctype"] == "CRM Deal")
+
+		before = today()
+		record_sla_metrics("CRM Deal", getdate(), 4, 1)
+		after = today()
+
+		self.assertEqual(after["due"] - before["due"], 4)
+		self.assertEqual(after["breached"] - before["breached"], 1)
+		self.assertGreater(after["breach_rate"], 0)
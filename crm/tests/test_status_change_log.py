@@ -0,0 +1,60 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from crm.fcrm.doctype.crm_status_change_log.crm_status_change_log import log_status_changes
+
+
+class IntegrationTestStatusChangeLog(IntegrationTestCase):
+	def get_log(self, name):
+		return frappe.get_all(
+			"CRM Status Change Log",
+			filters={"parenttype": "CRM Lead", "parent": name},
+			fields=["idx", "from", "to", "duration"],
+			order_by="idx",
+		)
+
+	def test_open_row_is_closed_and_new_row_appended(self):
+		lead = frappe.get_doc({"doctype": "CRM Lead", "first_name": "Status", "status": "New"}).insert(
+			ignore_permissions=True
+		)
+		frappe.db.set_value("CRM Lead", lead.name, "status", "Contacted")
+
+		log_status_changes("CRM Lead", {lead.name: ("New", "Contacted")})
+
+		log = self.get_log(lead.name)
+		self.assertEqual(
+			[(row["from"], row.to or "", row.idx) for row in log],
+			[("New", "Contacted", 1), ("Contacted", "", 2)],
+		)
+		self.assertIsNotNone(log[0].duration)
+
+	def test_unchanged_status_is_not_logged(self):
+		lead = frappe.get_doc({"doctype": "CRM Lead", "first_name": "Status", "status": "New"}).insert(
+			ignore_permissions=True
+		)
+
+		log_status_changes("CRM Lead", {lead.name: ("New", "New")})
+
+		self.assertEqual(len(self.get_log(lead.name)), 1)
+
+	def test_save_appends_to_log(self):
+		lead = frappe.get_doc({"doctype": "CRM Lead", "first_name": "Status", "status": "New"}).insert(
+			ignore_permissions=True
+		)
+		first_row = lead.status_change_log[0]
+
+		lead.status = "Contacted"
+		lead.save(ignore_permissions=True)
+		lead.status = "Qualified"
+		lead.save(ignore_permissions=True)
+
+		log = self.get_log(lead.name)
+		self.assertEqual(
+			[(row["from"], row.to or "") for row in log],
+			[("New", "Contacted"), ("Contacted", "Qualified"), ("Qualified", "")],
+		)
+		self.assertEqual(lead.status_change_log[0].name, first_row.name)
+		self.assertEqual(len(lead.status_change_log), 3)
@@ -0,0 +1,48 @@
+from unittest.mock import patch
+
+from frappe.tests import UnitTestCase
+
+from crm.integrations import telephony_log
+from crm.integrations.telephony_log import REDACTED, log_call_event, redact
+
+
+class TestTelephonyLog(UnitTestCase):
+	def test_redact_secrets(self):
+		payload = {
+			"call_id": "123",
+			"Authorization": "token abc:def",
+			"meta": {"api_key": "abc", "webhook_token": "def", "agent": "Agent One"},
+			"list": [{"password": "x"}],
+		}
+		self.assertEqual(
+			redact(payload),
+			{
+				"call_id": "123",
+				"Authorization": REDACTED,
+				"meta": {"api_key": REDACTED, "webhook_token": REDACTED, "agent": "Agent One"},
+				"list": [{"password": REDACTED}],
+			},
+		)
+
+	def test_sampling_and_debug_payload(self):
+		payload = {"ref_id": "r1", "call_status": "completed", "customer_number": "9123456789"}
+
+		with (
+			patch.object(telephony_log, "get_log_settings", return_value=(0, False)),
+			patch.object(telephony_log, "get_telephony_logger") as get_logger,
+		):
+			log_call_event("Smartflo", "outbound_webhook", payload)
+			get_logger.assert_not_called()
+
+			# warnings are never sampled away
+			log_call_event("Smartflo", "auth_failed", level="warning")
+			get_logger.return_value.log.assert_called_once()
+
+		with (
+			patch.object(telephony_log, "get_log_settings", return_value=(0, True)),
+			patch.object(telephony_log, "get_telephony_logger") as get_logger,
+		):
+			log_call_event("Smartflo", "outbound_webhook", payload)
+			message = get_logger.return_value.log.call_args.args[1]
+			self.assertIn('"payload": {', message)
+			self.assertIn('"ref_id": "r1"', message)
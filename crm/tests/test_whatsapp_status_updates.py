@@ -0,0 +1,94 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import IntegrationTestCase, UnitTestCase
+
+from crm.integrations.interakt import status_updates
+from crm.integrations.interakt.status_updates import (
+	BUFFER_KEY,
+	apply_status_updates,
+	coalesce,
+	flush_status_updates,
+	queue_status_update,
+)
+
+
+class TestCoalesceStatusUpdates(UnitTestCase):
+	def test_keeps_most_advanced_status_and_first_timestamps(self):
+		updates = coalesce(
+			[
+				{"message_id": "a", "status": "Delivered", "delivered_at": "2026-01-01 10:00:00"},
+				{"message_id": "a", "status": "Read", "read_at": "2026-01-01 10:05:00"},
+				{"message_id": "a", "status": "Sent"},
+				{"message_id": "a", "status": "Delivered", "delivered_at": "2026-01-01 10:09:00"},
+				{"message_id": "b", "status": "Sent"},
+			]
+		)
+		updates = {update["message_id"]: update for update in updates}
+
+		self.assertEqual(updates["a"]["status"], "Read")
+		self.assertEqual(updates["a"]["delivered_at"], "2026-01-01 10:00:00")
+		self.assertEqual(updates["a"]["read_at"], "2026-01-01 10:05:00")
+		self.assertEqual(updates["b"]["status"], "Sent")
+
+
+class IntegrationTestApplyStatusUpdates(IntegrationTestCase):
+	def make_message(self, message_id, status):
+		return frappe.get_doc(
+			{
+				"doctype": "CRM WhatsApp Message",
+				"direction": "Outgoing",
+				"status": status,
+				"message_id": message_id,
+				"phone_number": "9876543210",
+				"message": "Hello",
+			}
+		).insert(ignore_permissions=True)
+
+	def test_batch_moves_statuses_forward_only(self):
+		tag = frappe.generate_hash(length=8)
+		sent = self.make_message(f"{tag}-sent", "Sent")
+		read = self.make_message(f"{tag}-read", "Read")
+
+		apply_status_updates(
+			[
+				{"message_id": sent.message_id, "status": "Delivered", "delivered_at": "2026-01-01 10:00:00"},
+				{"message_id": read.message_id, "status": "Delivered", "delivered_at": "2026-01-01 10:00:00"},
+			]
+		)
+
+		sent.reload()
+		read.reload()
+		self.assertEqual(sent.status, "Delivered")
+		self.assertEqual(str(sent.delivered_at), "2026-01-01 10:00:00")
+		self.assertEqual(read.status, "Read")
+
+	def test_unknown_message_ids_are_returned(self):
+		tag = frappe.generate_hash(length=8)
+		sent = self.make_message(f"{tag}-sent", "Sent")
+
+		unmatched = apply_status_updates(
+			[
+				{"message_id": sent.message_id, "status": "Delivered"},
+				{"message_id": f"{tag}-campaign", "status": "Delivered"},
+			]
+		)
+
+		self.assertEqual([update["message_id"] for update in unmatched], [f"{tag}-campaign"])
+
+	def test_failed_flush_puts_the_events_back(self):
+		frappe.cache.delete_value(BUFFER_KEY)
+		self.addCleanup(frappe.cache.delete_value, BUFFER_KEY)
+		with patch.object(frappe, "enqueue"):
+			queue_status_update({"message_id": "flush-failure", "status": "read"})
+
+		with (
+			patch.object(status_updates.time, "sleep"),
+			patch.object(status_updates, "apply_status_updates", side_effect=frappe.QueryDeadlockError),
+		):
+			self.assertRaises(frappe.QueryDeadlockError, flush_status_updates)
+
+		self.assertEqual(frappe.cache.llen(BUFFER_KEY), 1)
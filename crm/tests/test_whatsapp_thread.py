@@ -0,0 +1,72 @@
+import time
+from unittest.mock import patch
+
+import frappe
+from frappe.tests import UnitTestCase
+
+from crm.api import whatsapp
+from crm.api.whatsapp import build_thread
+
+LEAD = ("CRM Lead", "CRM-LEAD-THREAD")
+
+
+def make_message(i, **kwargs):
+	return frappe._dict(
+		{
+			"name": f"msg-{i}",
+			"direction": "Incoming" if i % 2 else "Outgoing",
+			"from": "+919123456789" if i % 2 else None,
+			"content_type": "text",
+			"message_type": "Manual",
+			"message_id": f"wamid.{i}",
+			"is_reply": 0,
+			"reply_to_message_id": None,
+			"creation": f"2025-01-17 16:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}",
+			"message": f"message {i}",
+			"reference_doctype": LEAD[0],
+			"reference_name": LEAD[1],
+			**kwargs,
+		}
+	)
+
+
+def make_conversation(size):
+	messages = []
+	for i in range(size):
+		if i % 10 == 9:
+			reaction = {"content_type": "reaction", "message": "👍", "reply_to_message_id": f"wamid.{i - 1}"}
+			messages.append(make_message(i, **reaction))
+		elif i % 10 == 5:
+			messages.append(make_message(i, is_reply=1, reply_to_message_id=f"wamid.{i - 2}"))
+		else:
+			messages.append(make_message(i))
+	return messages
+
+
+class TestWhatsAppThread(UnitTestCase):
+	def setUp(self):
+		patcher = patch.object(whatsapp, "get_from_names", return_value={LEAD: "Seller"})
+		self.get_from_names = patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def test_reactions_and_replies_are_threaded(self):
+		messages = build_thread("CRM WhatsApp Message", make_conversation(10))
+		thread = {message.name: message for message in messages}
+
+		self.assertNotIn("msg-9", thread)
+		self.assertEqual(thread["msg-8"].reaction, "👍")
+		self.assertEqual(thread["msg-5"].reply_message, "message 3")
+		self.assertEqual(thread["msg-5"].reply_to, "msg-3")
+		self.assertEqual(thread["msg-5"].reply_to_from, "Seller")
+		self.assertEqual(thread["msg-1"].from_name, "Seller")
+		self.assertEqual(thread["msg-2"].from_name, "You")
+
+	def test_sender_names_are_resolved_once(self):
+		build_thread("CRM WhatsApp Message", make_conversation(100))
+		self.assertEqual(self.get_from_names.call_count, 1)
+
+	def test_long_thread_is_linear(self):
+		started = time.monotonic()
+		thread = build_thread("CRM WhatsApp Message", make_conversation(20000))
+		self.assertEqual(len(thread), 18000)
+		self.assertLess(time.monotonic() - started, 2)
@@ -4,11 +4,13 @@ import frappe
 import phonenumbers
 from frappe import _
 from frappe.model.docstatus import DocStatus
-from frappe.model.dynamic_links import get_dynamic_link_map
+from frappe.permissions import get_role_permissions, get_user_permissions
 from frappe.utils import floor
 from phonenumbers import NumberParseException
 from phonenumbers import PhoneNumberFormat as PNF
 
+from crm.utils.link_graph import get_linking_documents
+
 
 def parse_phone_number(phone_number, default_country="IN"):
 	try:
@@ -103,9 +105,6 @@ def seconds_to_duration(seconds):
 
 # Extracted from frappe core frappe/model/delete_doc.py/check_if_doc_is_linked
 def get_linked_docs(doc, method="Delete"):
-	from frappe.model.rename_doc import get_link_fields
-
-	link_fields = get_link_fields(doc.doctype)
 	ignored_doctypes = set()
 
 	if method == "Cancel" and (doc_ignore_flags := doc.get("ignore_linked_doctypes")):
@@ -115,117 +114,90 @@ def get_linked_docs(doc, method="Delete"):
 
 	docs = []
 
-	for lf in link_fields:
-		link_dt, link_field, issingle = lf["parent"], lf["fieldname"], lf["issingle"]
+	for item in get_linking_documents(doc.doctype, [doc.name], dynamic_links=False):
+		link_dt, link_field = item.doctype, item.fieldname
 		if link_dt in ignored_doctypes or (link_field == "amended_from" and method == "Cancel"):
 			continue
 
-		try:
-			meta = frappe.get_meta(link_dt)
-		except frappe.DoesNotExistError:
-			frappe.clear_last_message()
-			# This mostly happens when app do not remove their customizations, we shouldn't
-			# prevent link checks from failing in those cases
+		if item.issingle:
+			docs.append({"doc": doc.name, "link_dt": link_dt, "link_field": link_field})
 			continue
 
-		if issingle:
-			if frappe.db.get_single_value(link_dt, link_field) == doc.name:
-				docs.append({"doc": doc.name, "link_dt": link_dt, "link_field": link_field})
+		# available only in child table cases
+		item_parent = item.get("parent")
+		linked_parent_doctype = item.parenttype if item_parent else link_dt
+
+		if linked_parent_doctype in ignored_doctypes:
 			continue
 
-		fields = ["name", "docstatus"]
-
-		if meta.istable:
-			fields.extend(["parent", "parenttype"])
-
-		for item in frappe.db.get_values(link_dt, {link_field: doc.name}, fields, as_dict=True):
-			# available only in child table cases
-			item_parent = getattr(item, "parent", None)
-			linked_parent_doctype = item.parenttype if item_parent else link_dt
-
-			if linked_parent_doctype in ignored_doctypes:
-				continue
-
-			if method != "Delete" and (method != "Cancel" or not DocStatus(item.docstatus).is_submitted()):
-				# don't raise exception if not
-				# linked to a non-cancelled doc when deleting or to a submitted doc when cancelling
-				continue
-			elif link_dt == doc.doctype and (item_parent or item.name) == doc.name:
-				# don't raise exception if not
-				# linked to same item or doc having same name as the item
-				continue
-			else:
-				reference_docname = item_parent or item.name
-				docs.append(
-					{
-						"doc": doc.name,
-						"reference_doctype": linked_parent_doctype,
-						"reference_docname": reference_docname,
-					}
-				)
+		if method != "Delete" and (method != "Cancel" or not DocStatus(item.docstatus).is_submitted()):
+			# don't raise exception if not
+			# linked to a non-cancelled doc when deleting or to a submitted doc when cancelling
+			continue
+		elif link_dt == doc.doctype and (item_parent or item.name) == doc.name:
+			# don't raise exception if not
+			# linked to same item or doc having same name as the item
+			continue
+		else:
+			reference_docname = item_parent or item.name
+			docs.append(
+				{
+					"doc": doc.name,
+					"reference_doctype": linked_parent_doctype,
+					"reference_docname": reference_docname,
+				}
+			)
 	return docs
 
 
 # Extracted from frappe core frappe/model/delete_doc.py/check_if_doc_is_dynamically_linked
 def get_dynamic_linked_docs(doc, method="Delete"):
 	docs = []
-	for df in get_dynamic_link_map().get(doc.doctype, []):
-		ignore_linked_doctypes = doc.get("ignore_linked_doctypes") or []
+	ignore_linked_doctypes = doc.get("ignore_linked_doctypes") or []
+	ignore_links_on_delete = frappe.get_hooks("ignore_links_on_delete")
 
-		if df.parent in frappe.get_hooks("ignore_links_on_delete") or (
-			df.parent in ignore_linked_doctypes and method == "Cancel"
+	for refdoc in get_linking_documents(doc.doctype, [doc.name], links=False):
+		if refdoc.doctype in ignore_links_on_delete or (
+			refdoc.doctype in ignore_linked_doctypes and method == "Cancel"
 		):
 			# don't check for communication and todo!
 			continue
 
-		meta = frappe.get_meta(df.parent)
-		if meta.issingle:
+		# linked to an non-cancelled doc when deleting
+		# or linked to a submitted doc when cancelling
+		if not (
+			(method == "Delete" and not DocStatus(refdoc.docstatus).is_cancelled())
+			or (method == "Cancel" and DocStatus(refdoc.docstatus).is_submitted())
+		):
+			continue
+
+		if refdoc.issingle:
 			# dynamic link in single doc
-			refdoc = frappe.db.get_singles_dict(df.parent)
-			if (
-				refdoc.get(df.options) == doc.doctype
-				and refdoc.get(df.fieldname) == doc.name
-				and (
-					# linked to an non-cancelled doc when deleting
-					(method == "Delete" and not DocStatus(refdoc.docstatus).is_cancelled())
-					# linked to a submitted doc when cancelling
-					or (method == "Cancel" and DocStatus(refdoc.docstatus).is_submitted())
-				)
-			):
-				docs.append({"doc": doc.name, "reference_doctype": df.parent, "reference_docname": df.parent})
-		else:
-			# dynamic link in table
-			df["table"] = ", `parent`, `parenttype`, `idx`" if meta.istable else ""
-			for refdoc in frappe.db.sql(
-				"""select `name`, `docstatus` {table} from `tab{parent}` where
-				`{options}`=%s and `{fieldname}`=%s""".format(**df),
-				(doc.doctype, doc.name),
-				as_dict=True,
-			):
-				# linked to an non-cancelled doc when deleting
-				# or linked to a submitted doc when cancelling
-				if (method == "Delete" and not DocStatus(refdoc.docstatus).is_cancelled()) or (
-					method == "Cancel" and DocStatus(refdoc.docstatus).is_submitted()
-				):
-					reference_doctype = refdoc.parenttype if meta.istable else df.parent
-					reference_docname = refdoc.parent if meta.istable else refdoc.name
-
-					if reference_doctype in frappe.get_hooks("ignore_links_on_delete") or (
-						reference_doctype in ignore_linked_doctypes and method == "Cancel"
-					):
-						# don't check for communication and todo!
-						continue
-
-					at_position = f"at Row: {refdoc.idx}" if meta.istable else ""
-
-					docs.append(
-						{
-							"doc": doc.name,
-							"reference_doctype": reference_doctype,
-							"reference_docname": reference_docname,
-							"at_position": at_position,
-						}
-					)
+			docs.append(
+				{"doc": doc.name, "reference_doctype": refdoc.doctype, "reference_docname": refdoc.doctype}
+			)
+			continue
+
+		# dynamic link in table
+		reference_doctype = refdoc.parenttype if refdoc.istable else refdoc.doctype
+		reference_docname = refdoc.parent if refdoc.istable else refdoc.name
+
+		if reference_doctype in ignore_links_on_delete or (
+			reference_doctype in ignore_linked_doctypes and method == "Cancel"
+		):
+			# don't check for communication and todo!
+			continue
+
+		at_position = f"at Row: {refdoc.idx}" if refdoc.istable else ""
+
+		docs.append(
+			{
+				"doc": doc.name,
+				"reference_doctype": reference_doctype,
+				"reference_docname": reference_docname,
+				"at_position": at_position,
+			}
+		)
 	return docs
 
 
@@ -251,6 +223,24 @@ def is_sales_user(user: str | None = None) -> bool:
 	return is_admin() or "Sales Manager" in frappe.get_roles(user) or "Sales User" in frappe.get_roles(user)
 
 
+def get_writable_names(doctype: str, names: list[str], user: str | None = None) -> list[str]:
+	"""
+	Names among `names` that `user` may write.
+
+	`get_list` checks read, which a read share or a read-only role grants. When the user's roles
+	grant write on every document of the doctype and no user permission narrows it, what they can
+	read they can write, and that one query is the answer; otherwise each document is checked.
+
+	:param user: User to check for, defaults to current user
+	"""
+	user = user or frappe.session.user
+	names = frappe.get_list(doctype, filters={"name": ("in", names)}, pluck="name", user=user)
+	role_permissions = get_role_permissions(frappe.get_meta(doctype), user, is_owner=False)
+	if role_permissions.get("write") and not get_user_permissions(user):
+		return names
+	return [name for name in names if frappe.has_permission(doctype, "write", doc=name, user=user)]
+
+
 def sales_user_only(fn):
 	"""Decorator to validate if user is an agent."""
 
@@ -0,0 +1,164 @@
+"""
+Link graph: the fields through which documents of other doctypes point at a doctype.
+
+Finding the documents linked to a document meant calling `get_link_fields` and `get_meta` for
+every linking doctype, and building one query per dynamic link parent, each time. The graph of a
+doctype lists its link and dynamic link fields once, with what a caller needs to know about them
+(child table, single, mandatory, indexed), and is cached in redis. It is built for the CRM doctypes
+after every migrate and for other doctypes on first use, and dropped whenever a DocType, Custom
+Field or Property Setter changes.
+
+`get_linking_documents` finds the documents linking to a set of names, with one `IN` query per
+field and batch. `get_missing_indexes` lists the link columns those queries would scan, also
+reported by `bench --site <site> crm-missing-link-indexes`.
+"""
+
+import frappe
+from frappe.model.dynamic_links import get_dynamic_link_map
+from frappe.model.rename_doc import get_link_fields
+
+LINK_GRAPH_KEY = "crm:link_graph"
+BATCH_SIZE = 500
+
+# Linked to outside the FCRM module, but deleted and merged from the CRM
+CRM_DOCTYPES = ("Contact", "Address")
+
+
+def get_link_graph(doctype: str) -> list[dict]:
+	"""
+	Fields linking to `doctype`, cached until the schema changes.
+
+	:return: List of `{"doctype", "fieldname", "options", "istable", "issingle", "reqd", "indexed"}`,
+		`doctype` being the linking doctype and `options` the doctype field of a dynamic link
+	"""
+	return frappe.cache.hget(LINK_GRAPH_KEY, doctype, generator=lambda: build_link_graph(doctype))
+
+
+def build_link_graph(doctype):
+	fields = [(field["parent"], field["fieldname"], None) for field in get_link_fields(doctype)]
+	fields += [(df.parent, df.fieldname, df.options) for df in get_dynamic_link_map().get(doctype, [])]
+
+	graph, indexes = [], {}
+	for parent, fieldname, options in fields:
+		try:
+			meta = frappe.get_meta(parent)
+		except frappe.DoesNotExistError:
+			# customizations left behind by an uninstalled app
+			frappe.clear_last_message()
+			continue
+
+		if parent not in indexes and not meta.issingle:
+			indexes[parent] = get_indexes(parent)
+		df = meta.get_field(fieldname)
+		graph.append(
+			{
+				"doctype": parent,
+				"fieldname": fieldname,
+				"options": options,
+				"istable": meta.istable,
+				"issingle": meta.issingle,
+				"reqd": df.reqd if df else 0,
+				"indexed": bool(meta.issingle or is_indexed(indexes[parent], fieldname, options)),
+			}
+		)
+	return graph
+
+
+def get_indexes(doctype) -> list[list[str]]:
+	"""Columns of each index of a doctype's table, in index order."""
+	indexes = {}
+	for index_name, column in frappe.db.sql(
+		"""
+		select index_name, column_name from information_schema.statistics
+		where table_schema = database() and table_name = %s
+		order by index_name, seq_in_index
+		""",
+		(f"tab{doctype}",),
+	):
+		indexes.setdefault(index_name, []).append(column)
+	return list(indexes.values())
+
+
+def is_indexed(indexes, fieldname, options=None):
+	"""Whether an index leads with the field, or with the doctype field and then it for a dynamic link."""
+	prefixes = [[fieldname]]
+	if options:
+		prefixes.append([options, fieldname])
+	return any(index[: len(prefix)] == prefix for index in indexes for prefix in prefixes)
+
+
+def clear_link_graph(doc=None, method=None):
+	# `get_link_fields` keeps its own copy for the request
+	frappe.flags.pop("link_fields", None)
+	frappe.cache.delete_value(LINK_GRAPH_KEY)
+
+
+def build_link_graphs():
+	"""Rebuild the graphs of the CRM doctypes, run after migrate."""
+	clear_link_graph()
+	for doctype in get_crm_doctypes():
+		get_link_graph(doctype)
+
+
+def get_crm_doctypes():
+	filters = {"module": "FCRM", "istable": 0, "issingle": 0}
+	return [*frappe.get_all("DocType", filters=filters, pluck="name"), *CRM_DOCTYPES]
+
+
+def get_linking_documents(doctype: str, names: list[str], links=True, dynamic_links=True) -> list:
+	"""
+	Documents pointing at any of `names`, with one query per linking field and batch of names.
+
+	:param links: Look through link fields
+	:param dynamic_links: Look through dynamic link fields
+	:return: List of `frappe._dict`, the field (as in `get_link_graph`) with the `name`, `docstatus`
+		and `target` name of the linking document or row, and `parent`, `parenttype` and `idx`
+		for child table rows
+	"""
+	documents = []
+	for field in get_link_graph(doctype):
+		if not (dynamic_links if field["options"] else links):
+			continue
+		for i in range(0, len(names), BATCH_SIZE):
+			for row in query_field(doctype, field, names[i : i + BATCH_SIZE]):
+				documents.append(frappe._dict(field, **row))
+	return documents
+
+
+def query_field(doctype, field, names):
+	fieldname, options = field["fieldname"], field["options"]
+	if field["issingle"]:
+		values = frappe.db.get_singles_dict(field["doctype"])
+		if values.get(fieldname) not in names or (options and values.get(options) != doctype):
+			return []
+		docstatus = values.get("docstatus") or 0
+		return [{"name": field["doctype"], "docstatus": docstatus, "target": values[fieldname]}]
+
+	columns = f"name, docstatus, `{fieldname}` as target"
+	if field["istable"]:
+		columns += ", parent, parenttype, idx"
+	condition = f"`{options}` = %(doctype)s and " if options else ""
+	return frappe.db.sql(
+		f"select {columns} from `tab{field['doctype']}` where {condition}`{fieldname}` in %(names)s",
+		{"doctype": doctype, "names": tuple(names)},
+		as_dict=True,
+	)
+
+
+def get_missing_indexes(doctypes=None) -> list[dict]:
+	"""
+	Link columns pointing at `doctypes` (by default the CRM doctypes) that no index leads with.
+
+	:return: List of `{"doctype", "fieldname", "options", "targets"}`, `targets` being the linked
+		doctypes among `doctypes`, several for a dynamic link
+	"""
+	missing = {}
+	for target in doctypes or get_crm_doctypes():
+		for field in get_link_graph(target):
+			if field["indexed"]:
+				continue
+			key = (field["doctype"], field["fieldname"])
+			missing.setdefault(
+				key, {"doctype": key[0], "fieldname": key[1], "options": field["options"], "targets": []}
+			)["targets"].append(target)
+	return list(missing.values())